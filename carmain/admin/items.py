@@ -5,6 +5,12 @@ from carmain.models import items
 class MaintenanceItemAdmin(ModelView, model=items.MaintenanceItem):
     column_default_sort = "name"
     column_list = [items.MaintenanceItem.name, items.MaintenanceItem.default_interval]
+    # Вычисляются из названия при сохранении
+    form_excluded_columns = [
+        items.MaintenanceItem.type,
+        items.MaintenanceItem.icon,
+        items.MaintenanceItem.category,
+    ]
 
 
 class UserMaintenanceItemAdmin(ModelView, model=items.UserMaintenanceItem):
@@ -1,4 +1,7 @@
 from sqladmin import ModelView
+from sqlalchemy import Select, select
+from starlette.requests import Request
+from carmain.models.loaders import loader_options
 from carmain.models.records import ServiceRecord
 
 
@@ -16,6 +19,10 @@ class ServiceRecordAdmin(ModelView, model=ServiceRecord):
 
     column_searchable_list = []
 
+    def list_query(self, request: Request) -> Select:
+        # Вычисляемые колонки читают связи, которые sqladmin сам не загружает
+        return select(ServiceRecord).options(*loader_options(ServiceRecord, "admin"))
+
     @staticmethod
     def maintenance_item_name(obj):
         """Получить название элемента обслуживания"""
@@ -1,5 +1,9 @@
+from typing import Any
+
 from sqladmin import ModelView
+from starlette.requests import Request
 
+from carmain.core.token_cache import token_cache
 from carmain.models.auth import AccessToken
 from carmain.models.users import User
 
@@ -7,6 +11,19 @@ from carmain.models.users import User
 class UserAdmin(ModelView, model=User):
     column_list = [User.id, User.email]
 
+    # Флаги пользователя закэшированы вместе с его сессиями
+    async def after_model_change(
+        self, data: dict, model: Any, is_created: bool, request: Request
+    ) -> None:
+        if not is_created:
+            await token_cache.invalidate_user(model.id)
+
+    async def after_model_delete(self, model: Any, request: Request) -> None:
+        await token_cache.invalidate_user(model.id)
+
 
 class AccessTokenAdmin(ModelView, model=AccessToken):
     column_list = [AccessToken.user_id, AccessToken.token, AccessToken.data]
+
+    async def after_model_delete(self, model: Any, request: Request) -> None:
+        await token_cache.invalidate(model.token)
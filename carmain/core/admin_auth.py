@@ -1,12 +1,13 @@
+import datetime
+
 from sqladmin.authentication import AuthenticationBackend
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, Response
 
 from carmain.core import backend
 from carmain.core.database import async_session_maker
-from carmain.models.auth import AccessToken
+from carmain.core.token_cache import token_cache
+from carmain.repository.user_repository import UserRepository
 
 
 class AdminAuthBackend(AuthenticationBackend):
@@ -29,15 +30,17 @@ class AdminAuthBackend(AuthenticationBackend):
         if not token:
             return False
 
-        async with async_session_maker() as session:
-            query = (
-                select(AccessToken)
-                .where(AccessToken.token == token)
-                .options(joinedload(AccessToken.user))
-            )
-            db_token = await session.scalar(query)
-
-            if db_token and db_token.user:
-                return db_token.user.is_superuser
-
-        return False
+        principal = await token_cache.get(token)
+        if principal is None:
+            lifetime = datetime.timedelta(seconds=backend.DATABASE_TOKEN_LIFETIME)
+            max_age = datetime.datetime.now(datetime.timezone.utc) - lifetime
+            async with async_session_maker() as session:
+                db_session = await UserRepository(session).get_session_principal(
+                    token, max_age
+                )
+            if db_session is None:
+                return False
+            principal, created_at = db_session
+            await token_cache.put(token, principal, created_at + lifetime)
+
+        return principal.is_active and principal.is_superuser
@@ -1,9 +1,10 @@
 import datetime
 import os
-from typing import Optional, Annotated
+from typing import Any, Dict, Optional, Annotated
 
 from fastapi import Request, Depends
-from fastapi_users import IntegerIDMixin, BaseUserManager, models
+import jwt
+from fastapi_users import IntegerIDMixin, BaseUserManager, exceptions, models, schemas
 from fastapi_users.authentication import (
     CookieTransport,
     AuthenticationBackend,
@@ -11,37 +12,142 @@ from fastapi_users.authentication import (
     JWTStrategy,
 )
 from fastapi_users.authentication.strategy import AccessTokenDatabase, DatabaseStrategy
-from fastapi_users.password import PasswordHelper
+from fastapi_users.jwt import decode_jwt
+from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 
 from loguru import logger
 from sqlalchemy import update
 
-from carmain.core import database
+from carmain.core import database, metrics
 from carmain.core.config import get_settings
 from carmain.core.database import get_async_session
+from carmain.core.password import PooledPasswordHelper
+from carmain.core.token_cache import TokenCache, token_cache
 from carmain.models.auth import AccessToken, get_access_token_db
 from carmain.models.users import User, get_user_db
+from carmain.repository.user_repository import UserRepository
+from carmain.schemas.user_schema import UserPrincipal
 
 
 settings = get_settings()
 
+DATABASE_TOKEN_LIFETIME = int(datetime.timedelta(days=30).total_seconds())
+JWT_LIFETIME = 3600
+
+
+class PrincipalDatabaseStrategy(DatabaseStrategy):
+    """
+    Cookie-сессия, которая по токену читает не модель User, а её проекцию
+    UserPrincipal одним запросом. Проекция кэшируется в TokenCache, запрос
+    в БД делается только при промахе. Выдача токенов — как у DatabaseStrategy
+    """
+
+    def __init__(
+        self,
+        database: AccessTokenDatabase[AccessToken],
+        users: UserRepository,
+        lifetime_seconds: Optional[int] = None,
+        cache: TokenCache = token_cache,
+    ):
+        super().__init__(database, lifetime_seconds)
+        self.users = users
+        self.cache = cache
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager
+    ) -> Optional[UserPrincipal]:
+        if token is None:
+            return None
+
+        principal = await self.cache.get(token)
+        if principal is not None:
+            return principal
+
+        max_age = None
+        if self.lifetime_seconds:
+            max_age = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+                seconds=self.lifetime_seconds
+            )
+        session = await self.users.get_session_principal(token, max_age)
+        if session is None:
+            return None
+
+        principal, created_at = session
+        expires_at = None
+        if self.lifetime_seconds:
+            expires_at = created_at + datetime.timedelta(seconds=self.lifetime_seconds)
+        await self.cache.put(token, principal, expires_at)
+        return principal
+
+    async def destroy_token(self, token: str, user) -> None:
+        await self.cache.invalidate(token)
+        await super().destroy_token(token, user)
+
+
+class PrincipalJWTStrategy(JWTStrategy):
+    """JWT-стратегия, возвращающая проекцию UserPrincipal вместо модели User"""
+
+    def __init__(self, users: UserRepository, **kwargs):
+        super().__init__(**kwargs)
+        self.users = users
+
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager
+    ) -> Optional[UserPrincipal]:
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience, algorithms=[self.algorithm]
+            )
+            user_id = int(data["sub"])
+        except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+            return None
+        return await self.users.get_principal(user_id)
+
 
 def get_database_strategy(
     access_token_db: Annotated[
         AccessTokenDatabase[AccessToken], Depends(get_access_token_db)
     ]
 ) -> DatabaseStrategy:
-    lifetime = int(datetime.timedelta(days=30).total_seconds())
     return DatabaseStrategy(
         database=access_token_db,
-        lifetime_seconds=lifetime,
+        lifetime_seconds=DATABASE_TOKEN_LIFETIME,
     )
 
 
 def get_jwt_strategy() -> JWTStrategy:
     return JWTStrategy(
-        secret=database.settings.secret_key, lifetime_seconds=3600, algorithm="HS256"
+        secret=database.settings.secret_key,
+        lifetime_seconds=JWT_LIFETIME,
+        algorithm="HS256",
+    )
+
+
+def get_principal_database_strategy(
+    access_token_db: Annotated[
+        AccessTokenDatabase[AccessToken], Depends(get_access_token_db)
+    ],
+    users: Annotated[UserRepository, Depends()],
+) -> PrincipalDatabaseStrategy:
+    return PrincipalDatabaseStrategy(
+        database=access_token_db,
+        users=users,
+        lifetime_seconds=DATABASE_TOKEN_LIFETIME,
+    )
+
+
+def get_principal_jwt_strategy(
+    users: Annotated[UserRepository, Depends()],
+) -> PrincipalJWTStrategy:
+    return PrincipalJWTStrategy(
+        users=users,
+        secret=database.settings.secret_key,
+        lifetime_seconds=JWT_LIFETIME,
+        algorithm="HS256",
     )
 
 
@@ -54,17 +160,93 @@ async def get_user_manager(
 class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
     reset_password_token_secret = database.settings.secret_key
     verification_token_secret = database.settings.secret_key
+    password_helper: PooledPasswordHelper
+
+    # create, authenticate и _update повторяют BaseUserManager, но хешируют
+    # и проверяют пароль в пуле потоков, не занимая цикл событий
+    async def create(
+        self,
+        user_create: schemas.UC,
+        safe: bool = False,
+        request: Optional[Request] = None,
+    ) -> models.UP:
+        await self.validate_password(user_create.password, user_create)
+
+        existing_user = await self.user_db.get_by_email(user_create.email)
+        if existing_user is not None:
+            raise exceptions.UserAlreadyExists()
+
+        user_dict = (
+            user_create.create_update_dict()
+            if safe
+            else user_create.create_update_dict_superuser()
+        )
+        password = user_dict.pop("password")
+        user_dict["hashed_password"] = await self.password_helper.hash_async(password)
+
+        created_user = await self.user_db.create(user_dict)
+        await self.on_after_register(created_user, request)
+        return created_user
+
+    async def authenticate(
+        self, credentials: OAuth2PasswordRequestForm
+    ) -> Optional[models.UP]:
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Хешируем впустую, чтобы время ответа не выдавало наличие email
+            await self.password_helper.hash_async(credentials.password)
+            return None
+
+        verified, updated_password_hash = (
+            await self.password_helper.verify_and_update_async(
+                credentials.password, user.hashed_password
+            )
+        )
+        if not verified:
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+        return user
+
+    async def _update(self, user: models.UP, update_dict: Dict[str, Any]) -> models.UP:
+        password = update_dict.get("password")
+        if password is not None:
+            await self.validate_password(password, user)
+            update_dict = {
+                **{k: v for k, v in update_dict.items() if k != "password"},
+                "hashed_password": await self.password_helper.hash_async(password),
+            }
+        return await super()._update(user, update_dict)
 
     async def on_after_register(
         self, user: models.UP, request: Optional[Request] = None
     ) -> None:
         if settings.auto_verify:
             async for session in get_async_session():
-                await session.execute(update(User).where(User.id == user.id).values(is_verified=True))
+                await session.execute(
+                    update(User).where(User.id == user.id).values(is_verified=True)
+                )
                 await session.commit()
 
         return await super().on_after_register(user, request)
 
+    async def on_after_update(
+        self,
+        user: models.UP,
+        update_dict: dict,
+        request: Optional[Request] = None,
+    ) -> None:
+        # Закэшированные сессии несут флаги и email пользователя
+        await token_cache.invalidate_user(user.id)
+        return await super().on_after_update(user, update_dict, request)
+
+    async def on_after_delete(
+        self, user: models.UP, request: Optional[Request] = None
+    ) -> None:
+        await token_cache.invalidate_user(user.id)
+        return await super().on_after_delete(user, request)
+
     async def on_after_forgot_password(
         self, user: models.UP, token: str, request: Optional[Request] = None
     ) -> None:
@@ -76,7 +258,37 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         return await super().on_after_request_verify(user, token, request)
 
 
-password_helper = PasswordHelper()
+password_helper = PooledPasswordHelper(
+    max_workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+)
+
+password_hashing_operations = metrics.registry.counter(
+    "carmain_password_hashing_operations_total",
+    "Хеширование и проверка паролей в пуле: completed, rejected (503)",
+    ["result"],
+)
+password_hashing_seconds = metrics.registry.counter(
+    "carmain_password_hashing_seconds_total",
+    "Время операций с паролями: wait — в очереди пула, run — в потоке",
+    ["phase"],
+)
+password_hashing_pending = metrics.registry.gauge(
+    "carmain_password_hashing_pending",
+    "Операции с паролями в очереди и в работе",
+)
+
+
+@metrics.registry.collector
+def collect_password_hashing_stats() -> None:
+    stats = password_helper.stats()
+    password_hashing_operations.set_total(stats["completed"], result="completed")
+    password_hashing_operations.set_total(stats["rejected"], result="rejected")
+    password_hashing_seconds.set_total(stats["wait_seconds"], phase="wait")
+    password_hashing_seconds.set_total(stats["run_seconds"], phase="run")
+    password_hashing_pending.set(stats["pending"])
+
+
 bearer_transport = BearerTransport(tokenUrl="/auth/login")
 
 
@@ -103,5 +315,23 @@ cookie_backend = AuthenticationBackend(
 )
 
 
+# Те же транспорты и имена, но стратегии читают проекцию пользователя.
+# Роутеры fastapi-users работают с полной моделью и используют get_backends
+principal_cookie_backend = AuthenticationBackend(
+    name="cookie_session",
+    transport=cookie_transport,
+    get_strategy=get_principal_database_strategy,
+)
+principal_jwt_backend = AuthenticationBackend(
+    name="jwt_session",
+    transport=bearer_transport,
+    get_strategy=get_principal_jwt_strategy,
+)
+
+
 def get_backends():
     return [cookie_backend, jwt_backend]
+
+
+def get_principal_backends():
+    return [principal_cookie_backend, principal_jwt_backend]
@@ -0,0 +1,67 @@
+"""
+Условные GET для HTMX-фрагментов.
+
+ETag фрагмента — хеш версий данных (repository/version_repository.py) и
+всего, от чего ещё зависит ответ: пользователя, адреса с параметрами,
+заголовков HTMX, текущей даты и сборки приложения. Если браузер прислал
+тот же ETag в If-None-Match, вью отвечает 304, не читая строк и не рендеря
+шаблон. В хеш входит секретный ключ, поэтому подобрать ETag чужих данных
+нельзя и совпадение проверяется до проверки владельца.
+"""
+
+import hashlib
+import time
+from datetime import date
+from typing import Mapping
+
+from fastapi import Request, Response
+
+from carmain.core.config import get_settings
+
+# Новый запуск приложения (с preload_app — один на все воркеры) меняет все
+# ETag: после выкладки браузеры не получат 304 на старую разметку
+_BUILD = str(time.time_ns())
+
+# Ответ зависит от HX-Request/HX-Target: фрагмент и страница по одному адресу
+VARY = "HX-Request, HX-Target"
+
+
+def fragment_etag(request: Request, user_id: int, versions: Mapping[str, int]) -> str:
+    parts = [
+        get_settings().secret_key,
+        _BUILD,
+        str(user_id),
+        request.url.path,
+        request.url.query,
+        request.headers.get("HX-Request", ""),
+        request.headers.get("HX-Target", ""),
+        date.today().isoformat(),
+    ]
+    parts.extend(f"{scope}={version}" for scope, version in sorted(versions.items()))
+    digest = hashlib.sha256("\0".join(parts).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Слабое сравнение с If-None-Match (RFC 9110, 13.1.2)"""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def _cache_headers(etag: str) -> dict:
+    # no-cache: браузер хранит фрагмент, но каждый раз сверяет ETag
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": VARY}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_cache_headers(etag))
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers.update(_cache_headers(etag))
+    return response
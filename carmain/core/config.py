@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -24,6 +25,48 @@ class Settings(BaseSettings):
     auto_verify: bool = True  # Верифицируем пользователей автоматически, не проверяя
     static_path: str = "carmain/static"
     media_path: str = "carmain/media"
+    # Пул соединений на воркер. Postgres должен выдержать
+    # workers * (db_pool_size + db_max_overflow) соединений
+    # (gunicorn.conf.py: workers = cpu_count() * 2 + 1)
+    db_pool_size: int = 5
+    db_max_overflow: int = 5
+    db_pool_timeout: float = 10.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_echo: bool = False
+    # Число SQL-запросов и их время в заголовках ответа X-DB-Queries,
+    # X-DB-Time-Ms и Server-Timing (только для отладки); запрос, сделавший
+    # больше query_budget_warning запросов, пишется в лог всегда
+    debug_query_headers: bool = False
+    query_budget_warning: int = 30
+    # Реплики для чтения в GET-запросах (JSON-список URL postgresql+asyncpg://).
+    # Реплика, отставшая больше replica_max_lag секунд, не используется
+    database_replica_urls: list[str] = []
+    replica_max_lag: float = 5.0
+    replica_lag_check_interval: float = 5.0
+    # Как часто (в секундах) воркер сверяет версию кэша справочника работ с БД
+    catalog_cache_check_interval: float = 5.0
+    # Кэш проверки cookie-сессий: время жизни записи (с), размер LRU в памяти
+    # и адрес общего хранилища с протоколом Redis (redis://host:6379/0).
+    # Без token_cache_url кэш локален для воркера и его TTL урезается до 5 с,
+    # чтобы выход и деактивация доходили до остальных воркеров
+    token_cache_ttl: float = 60.0
+    token_cache_size: int = 10000
+    token_cache_url: Optional[str] = None
+    # Пул потоков для хеширования паролей: число потоков и предел очереди,
+    # сверх которого вход и регистрация сразу отвечают 503
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 32
+    # Каталог для метрик воркеров gunicorn (см. core/metrics.py); очищается
+    # при старте сервера. Без него /metrics отдаёт только текущий процесс
+    metrics_dir: Optional[str] = None
+    metrics_flush_interval: float = 1.0
+    # Шаблоны: перечитывать ли изменённые файлы (для разработки) и каталог
+    # для скомпилированного кода шаблонов (без него кэш только в памяти)
+    template_auto_reload: bool = True
+    template_cache_dir: Optional[str] = None
+    # Память воркера под отрендеренные карточки (core/fragment_cache.py)
+    fragment_cache_bytes: int = 16 * 1024 * 1024
     model_config = SettingsConfigDict(env_file=".env")
 
 
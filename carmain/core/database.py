@@ -1,14 +1,29 @@
+import asyncio
+import math
+import time
 from asyncio import current_task
-from typing import AsyncGenerator
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterator, Iterator, Optional
+
+from fastapi import Request
+from loguru import logger
 
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
+    AsyncEngine,
     AsyncSession,
     async_scoped_session,
 )
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import Select, event, exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from carmain.core import metrics
 from carmain.core.config import get_settings
 
 # from sqlalchemy import event
@@ -18,86 +33,476 @@ import os
 
 settings = get_settings()
 
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений со счётчиками выдачи: сколько раз и сколько секунд
+    запросы получали соединение (ожидание в очереди плюс установка нового)
+    и сколько раз не дождались его за pool_timeout. Вместе с checkedout и
+    overflow это показывает, хватает ли pool_size + max_overflow на воркер.
+    dispose() создаёт новый пул этого класса, и счётчики начинаются с нуля
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def engine_options(settings) -> dict:
+    """Параметры движка из настроек: размер пула, таймауты и вывод SQL"""
+    return {
+        "echo": settings.db_echo,
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
 # Use DATABASE_URL from environment if available (for production)
 database_url = os.getenv("DATABASE_URL")
 if database_url:
     # Convert to async URL if needed
     if database_url.startswith("postgresql://"):
         database_url = database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
-    engine = create_async_engine(database_url, echo=True)
 else:
     # Fallback to settings for local development
-    engine = create_async_engine(
-        f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.db_name}",
-        echo=True
+    database_url = f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:{settings.postgres_port}/{settings.db_name}"
+engine = create_async_engine(database_url, **engine_options(settings))
+
+
+class ReplicaSet:
+    """
+    Реплики для чтения с проверкой отставания.
+
+    Отставание проверяется в фоновой задаче воркера не чаще
+    lag_check_interval секунд: все реплики опрашиваются параллельно с одним
+    общим таймаутом lag_check_timeout, а choose() читает только результат
+    последней проверки и запрос её не ждёт. Реплика, отставшая больше
+    max_lag, недоступная или ещё не проверенная, не выбирается.
+    Если подходящих реплик нет, сессия читает с основной БД
+    """
+
+    # На простаивающей основной БД время последней транзакции стареет,
+    # поэтому реплика, догнавшая WAL, считается не отставшей
+    lag_query = text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+        "THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM now() - "
+        "pg_last_xact_replay_timestamp()), 0) END"
     )
+
+    def __init__(
+        self,
+        engines: list[AsyncEngine],
+        max_lag: float = 5.0,
+        lag_check_interval: float = 5.0,
+        lag_check_timeout: float = 1.0,
+    ):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.lag_check_timeout = lag_check_timeout
+        self.lags: list[float] = [math.inf] * len(engines)
+        self.routed = 0
+        self.fallbacks = 0
+        self._checked_at: Optional[float] = None
+        self._check: Optional[asyncio.Task] = None
+        self._next = 0
+
+    def choose(self) -> Optional[AsyncEngine]:
+        """Следующая по кругу реплика с допустимым отставанием или None"""
+        if not self.engines:
+            return None
+        self._schedule_check()
+
+        healthy = [
+            replica
+            for replica, lag in zip(self.engines, self.lags)
+            if lag <= self.max_lag
+        ]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+        self.routed += 1
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next]
+
+    def _schedule_check(self) -> None:
+        """Запустить фоновую проверку, если прошлая устарела и не идёт сейчас"""
+        loop = asyncio.get_running_loop()
+        if (
+            self._check is not None
+            and not self._check.done()
+            and self._check.get_loop() is loop
+        ):
+            return
+        if (
+            self._checked_at is not None
+            and time.monotonic() - self._checked_at < self.lag_check_interval
+        ):
+            return
+        self._check = loop.create_task(self.check_lag())
+
+    async def check_lag(self) -> None:
+        """Опросить все реплики параллельно; не ответившие за таймаут — недоступны"""
+        self._checked_at = time.monotonic()
+        if not self.engines:
+            return
+        probes = [asyncio.ensure_future(self._lag(replica)) for replica in self.engines]
+        done, pending = await asyncio.wait(probes, timeout=self.lag_check_timeout)
+        for probe in pending:
+            probe.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        for index, (replica, probe) in enumerate(zip(self.engines, probes)):
+            if probe in done and probe.exception() is None:
+                self.lags[index] = probe.result()
+                continue
+            error = probe.exception() if probe in done else "таймаут проверки"
+            logger.warning(f"Реплика {replica.url!r} недоступна: {error!r}")
+            self.lags[index] = math.inf
+
+    async def _lag(self, replica: AsyncEngine) -> float:
+        async with replica.connect() as conn:
+            return float((await conn.execute(self.lag_query)).scalar_one())
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [
+                {
+                    "url": replica.url.render_as_string(hide_password=True),
+                    "lag": lag if math.isfinite(lag) else None,
+                }
+                for replica, lag in zip(self.engines, self.lags)
+            ],
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+        }
+
+
+replicas = ReplicaSet(
+    [
+        create_async_engine(url, **engine_options(settings))
+        for url in settings.database_replica_urls
+    ],
+    max_lag=settings.replica_max_lag,
+    lag_check_interval=settings.replica_lag_check_interval,
+)
+
+
+class RoutingSession(Session):
+    """
+    Сессия, которая отправляет чтения на реплику и отмечает запись.
+
+    Реплика задаётся в info["replica"] при открытии сессии для безопасного
+    (GET/HEAD) запроса. Запись, flush, SELECT ... FOR UPDATE и запросы с
+    execution_options(primary=True) идут в основную БД; после первой записи
+    все чтения этой сессии тоже идут в основную БД, чтобы запрос видел
+    собственные изменения. Отметка info["wrote"] нужна и единице работы:
+    по ней она решает, коммитить ли транзакцию запроса
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            self._flushing
+            or not isinstance(clause, Select)
+            or clause._for_update_arg is not None
+        ):
+            self.info["wrote"] = True
+
+        replica = self.info.get("replica")
+        if (
+            replica is None
+            or self.info.get("wrote")
+            or clause.get_execution_options().get("primary")
+        ):
+            return super().get_bind(mapper, clause=clause, **kw)
+        return replica.sync_engine
+
+
 async_session_maker = async_sessionmaker(
-    engine, expire_on_commit=False, class_=AsyncSession, autoflush=False
+    engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
 )
 
 
+@dataclass
+class QueryStats:
+    """SQL-запросы одного HTTP-запроса (или блока кода в тестах)"""
+
+    count: int = 0
+    seconds: float = 0.0
+    statements: list[str] = field(default_factory=list)
+
+    def repeated(self, times: int = 2) -> list[tuple[str, int]]:
+        """Одинаковые запросы, выполненные не меньше times раз: признак N+1"""
+        counts = Counter(self.statements)
+        return [(sql, n) for sql, n in counts.most_common() if n >= times]
+
+    def report(self) -> str:
+        lines = [f"{self.count} SQL-запросов за {self.seconds * 1000:.1f} мс:"]
+        for sql, n in Counter(self.statements).most_common():
+            lines.append(f"  x{n}: {' '.join(sql.split())}")
+        return "\n".join(lines)
+
+
+# Счётчик текущего запроса; задачи и greenlet-ы SQLAlchemy наследуют контекст
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    """Считать SQL-запросы всех движков, выполненные внутри блока"""
+    stats = QueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+
+@dataclass
+class RepositoryCall:
+    """Вызов метода репозитория, к которому относятся SQL-запросы (метрики)"""
+
+    method: str
+    statements: int = 0
+
+
+current_repository_call: ContextVar[Optional[RepositoryCall]] = ContextVar(
+    "current_repository_call", default=None
+)
+
+statement_seconds = metrics.registry.histogram(
+    "carmain_db_statement_duration_seconds",
+    "Время SQL-запроса по методу репозитория (other — вне репозиториев)",
+    ["method"],
+)
+
+
+# Слушатели висят на классе Engine: считаются основная БД, реплики и
+# движки тестов
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+
+    call = current_repository_call.get()
+    statement_seconds.observe(elapsed, method=call.method if call else "other")
+    if call is not None:
+        call.statements += 1
+
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.statements.append(statement)
+
+
+@event.listens_for(Engine, "handle_error")
+def _query_failed(context):
+    # after_cursor_execute для упавшего запроса не вызывается
+    if context.connection is not None and context.statement is not None:
+        started = context.connection.info.get("query_started")
+        if started:
+            started.pop()
+
+
 # @event.listens_for(engine.sync_engine, "before_cursor_execute")
 # def log_sql_statements(conn, cursor, statement, parameters, context, executemany):
 #     logger.info(f"Executing: {statement} with parameters: {parameters}")
 
 
-class Base(DeclarativeBase):
-    pass
+def pool_stats(engine=engine) -> dict:
+    """Состояние пула соединений воркера для /metrics"""
+    pool = engine.sync_engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        # Все движки приложения создаются из engine_options(settings)
+        "max_overflow": settings.db_max_overflow,
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            wait_seconds=round(pool.wait_seconds, 6),
+            max_wait_seconds=round(pool.max_wait_seconds, 6),
+            timeouts=pool.timeouts,
+        )
+    return stats
 
 
-class SessionManager:
-    def __init__(self) -> None:
-        self.session_factory = async_scoped_session(
-            async_session_maker, scopefunc=current_task
-        )
-        self.session = None
+pool_size = metrics.registry.gauge(
+    "carmain_db_pool_size", "Постоянный размер пула соединений", ["pool"]
+)
+pool_checked_out = metrics.registry.gauge(
+    "carmain_db_pool_checked_out", "Выданные из пула соединения", ["pool"]
+)
+pool_overflow = metrics.registry.gauge(
+    "carmain_db_pool_overflow", "Соединения сверх pool_size", ["pool"]
+)
+pool_checkouts = metrics.registry.counter(
+    "carmain_db_pool_checkouts_total", "Выдачи соединений из пула", ["pool"]
+)
+pool_wait_seconds = metrics.registry.counter(
+    "carmain_db_pool_wait_seconds_total",
+    "Суммарное время получения соединения из пула",
+    ["pool"],
+)
+pool_timeouts = metrics.registry.counter(
+    "carmain_db_pool_timeouts_total",
+    "Запросы, не дождавшиеся соединения за pool_timeout",
+    ["pool"],
+)
+
+
+@metrics.registry.collector
+def collect_pool_stats() -> None:
+    pools = {"primary": engine}
+    pools.update((f"replica{i}", r) for i, r in enumerate(replicas.engines))
+    for name, pool_engine in pools.items():
+        stats = pool_stats(pool_engine)
+        pool_size.set(stats["size"], pool=name)
+        pool_checked_out.set(stats["checked_out"], pool=name)
+        pool_overflow.set(max(stats["overflow"], 0), pool=name)
+        pool_checkouts.set_total(stats.get("checkouts", 0), pool=name)
+        pool_wait_seconds.set_total(stats.get("wait_seconds", 0.0), pool=name)
+        pool_timeouts.set_total(stats.get("timeouts", 0), pool=name)
 
-    async def __aenter__(self) -> None:
-        self.session = self.session_factory()
 
-    async def __aexit__(self, *args: object) -> None:
-        await self.rollback()
+replica_routing = metrics.registry.counter(
+    "carmain_db_replica_routing_total",
+    "Чтения безопасных запросов: replica — на реплику, primary — нет подходящей",
+    ["target"],
+)
+replica_excluded = metrics.registry.gauge(
+    "carmain_db_replica_excluded",
+    "Воркеры, не выбирающие реплику: отстала больше max_lag или недоступна",
+    ["pool"],
+)
 
-    async def commit(self) -> None:
-        if self.session:
-            await self.session.commit()
-            await self.session.close()
-        self.session = None
 
-    async def rollback(self) -> None:
-        if self.session:
-            await self.session.rollback()
-            await self.session.close()
-        self.session = None
+@metrics.registry.collector
+def collect_replica_stats() -> None:
+    replica_routing.set_total(replicas.routed, target="replica")
+    replica_routing.set_total(replicas.fallbacks, target="primary")
+    for index, lag in enumerate(replicas.lags):
+        replica_excluded.set(int(lag > replicas.max_lag), pool=f"replica{index}")
 
 
-session_manager = SessionManager()
+def dispose_after_fork() -> None:
+    """
+    Сбросить пул, унаследованный от мастер-процесса gunicorn (preload_app).
+    close=False: соединения родителя не закрываются из дочернего процесса,
+    воркер просто начинает со своим пустым пулом
+    """
+    engine.sync_engine.dispose(close=False)
+    for replica in replicas.engines:
+        replica.sync_engine.dispose(close=False)
 
 
-# async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-#     session: AsyncSession = async_session_maker()
-#     try:
-#         yield session
-#     except Exception:
-#         await session.rollback()
-#         raise
-#     finally:
-#         await session.close()
+class Base(DeclarativeBase):
+    pass
+
 
+class SessionManager:
+    """
+    Единица работы: одна сессия и одна транзакция на задачу asyncio,
+    то есть на HTTP-запрос. Репозитории только делают flush, а COMMIT
+    выполняется один раз в конце, если в сессии была запись. Исключение
+    откатывает всю работу запроса целиком
+    """
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with session_manager:
-        session = session_manager.session
-        if session is None:
-            raise Exception("SessionManager is not initialized")
+    def __init__(self, session_maker: async_sessionmaker = async_session_maker) -> None:
+        self.session_factory = async_scoped_session(
+            session_maker, scopefunc=current_task
+        )
+
+    @asynccontextmanager
+    async def unit_of_work(
+        self, replica: Optional[AsyncEngine] = None
+    ) -> AsyncIterator[AsyncSession]:
+        if self.session_factory.registry.has():
+            # Вложенный вызов (хук fastapi-users внутри запроса) работает в
+            # транзакции запроса, завершает её внешняя единица работы
+            yield self.session_factory()
+            return
+
+        session = self.session_factory()
+        session.info.update(replica=replica, wrote=False)
         try:
             yield session
-        except Exception:
+            if session.info["wrote"] or session.new or session.dirty or session.deleted:
+                await session.commit()
+        except BaseException:
             await session.rollback()
             raise
         finally:
-            # Closing the session after use...
-            await session.close()
+            await self.session_factory.remove()
+
+    @asynccontextmanager
+    async def stream_session(
+        self, replica: Optional[AsyncEngine] = None
+    ) -> AsyncIterator[AsyncSession]:
+        """
+        Отдельная сессия только для чтения — для тела потокового ответа.
+        FastAPI закрывает зависимости, а с ними и сессию запроса, раньше, чем
+        StreamingResponse начинает отдавать тело. Сессия не регистрируется
+        по задаче: поток могут дочитать или закрыть из другой задачи
+        """
+        async with self.session_factory.session_factory() as session:
+            session.info.update(replica=replica, wrote=False)
+            yield session
+
+
+session_manager = SessionManager()
+
+
+# Запросы, которые ничего не меняют и могут читать с реплики
+REPLICA_METHODS = frozenset({"GET", "HEAD"})
+
+
+async def get_async_session(
+    request: Request = None,
+) -> AsyncGenerator[AsyncSession, None]:
+    # Без запроса (фоновые задачи, хуки) сессия работает с основной БД
+    replica = None
+    if request is not None and request.method in REPLICA_METHODS:
+        replica = replicas.choose()
+    async with session_manager.unit_of_work(replica) as session:
+        yield session
 
 
 # class Database:
@@ -0,0 +1,119 @@
+"""
+Кэш отрендеренных карточек: автомобиль в гараже, работа в справочнике.
+
+Ключ — шаблон, id сущности и версия карточки: значения всех полей, которые
+она выводит (у автомобиля — вместе с числом работ к обслуживанию). Поэтому
+кэш не отдаёт устаревшую карточку, даже если данные изменил другой воркер,
+а списки собираются из готового HTML без рендера. invalidate() в
+обработчиках изменения сразу убирает старые версии сущности в этом воркере,
+остальные вытесняются по LRU. Размер ограничен памятью строк.
+"""
+
+import sys
+from collections import OrderedDict
+from typing import Any, Hashable, Mapping
+
+from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
+
+from carmain.core import metrics
+from carmain.core.config import get_settings
+from carmain.core.templating import templates
+
+
+class FragmentCache:
+    """LRU отрендеренных фрагментов, ограниченный суммарным размером строк"""
+
+    def __init__(self, templates: Jinja2Templates, max_bytes: int) -> None:
+        self.templates = templates
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # (шаблон, id сущности, версия) -> HTML
+        self._entries: OrderedDict[tuple, Markup] = OrderedDict()
+        self._entity_keys: dict[Hashable, set[tuple]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def render(
+        self,
+        template: str,
+        entity_id: Hashable,
+        version: Hashable,
+        context: Mapping[str, Any],
+    ) -> Markup:
+        """Карточка из кэша или, при промахе, рендер шаблона с context"""
+        key = (template, entity_id, version)
+        html = self._entries.get(key)
+        if html is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+        self.misses += 1
+        html = Markup(self.templates.get_template(template).render(context))
+        self._store(key, html)
+        return html
+
+    def invalidate(self, entity_id: Hashable) -> None:
+        """Забыть все версии карточек сущности"""
+        for key in self._entity_keys.pop(entity_id, set()):
+            html = self._entries.pop(key, None)
+            if html is not None:
+                self.size -= sys.getsizeof(html)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._entity_keys.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self.size,
+        }
+
+    def _store(self, key: tuple, html: Markup) -> None:
+        size = sys.getsizeof(html)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = html
+        self._entity_keys.setdefault(key[1], set()).add(key)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: tuple) -> None:
+        html = self._entries.pop(key)
+        self.size -= sys.getsizeof(html)
+        keys = self._entity_keys.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._entity_keys[key[1]]
+
+
+fragment_cache = FragmentCache(templates, get_settings().fragment_cache_bytes)
+
+
+fragment_cache_lookups = metrics.registry.counter(
+    "carmain_fragment_cache_lookups_total",
+    "Карточки из кэша отрендеренных фрагментов: hit, miss",
+    ["result"],
+)
+fragment_cache_bytes = metrics.registry.gauge(
+    "carmain_fragment_cache_bytes",
+    "Память строк в кэше отрендеренных фрагментов",
+)
+
+
+@metrics.registry.collector
+def collect_fragment_cache_stats() -> None:
+    stats = fragment_cache.stats()
+    fragment_cache_lookups.set_total(stats["hits"], result="hit")
+    fragment_cache_lookups.set_total(stats["misses"], result="miss")
+    fragment_cache_bytes.set(stats["bytes"])
@@ -0,0 +1,298 @@
+"""
+Метрики в текстовом формате Prometheus для /metrics.
+
+Gunicorn запускает несколько воркеров и перезапускает их каждые
+max_requests запросов, а запрос к /metrics попадает в случайный воркер.
+Поэтому при заданном metrics_dir каждый воркер не реже раза в
+metrics_flush_interval секунд сбрасывает свои значения в файл
+<metrics_dir>/<pid>.json, а /metrics собирает ответ из файлов всех воркеров:
+счётчики, гистограммы и gauge-метрики складываются.
+
+Когда воркер завершается, мастер (child_exit в gunicorn.conf.py) переносит
+его счётчики и гистограммы в archive.json, а gauge-метрики отбрасывает:
+так счётчики не уменьшаются при перезапуске воркеров, а число файлов не
+растёт. Без metrics_dir метрики отдаются только из текущего процесса.
+
+Значения, которые источник считает сам (пул соединений, кэш токенов),
+снимаются сборщиками (registry.collector) перед каждым сбросом.
+"""
+
+import json
+import math
+import os
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+
+from carmain.core.config import get_settings
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+ARCHIVE_FILE = "archive.json"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self) -> dict:
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "samples": [[list(key), value] for key, value in self.values.items()],
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """Для счётчиков, которые ведёт сам источник (пул, кэш)"""
+        self.values[self._key(labels)] = float(value)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Значение по набору меток — список: число наблюдений в каждом интервале
+    (последний — +Inf), затем сумма наблюдений
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(b) for b in buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        counts[index] += 1
+        counts[-1] += value
+
+    def dump(self) -> dict:
+        return {**super().dump(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    def __init__(
+        self, directory: Optional[str] = None, flush_interval: float = 1.0
+    ) -> None:
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics: dict[str, Metric] = {}
+        self.collectors: list[Callable[[], None]] = []
+        self._flushed_at = 0.0
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, func: Callable[[], None]) -> Callable[[], None]:
+        """Декоратор: функция обновляет метрики перед сбросом и выдачей"""
+        self.collectors.append(func)
+        return func
+
+    def snapshot(self) -> dict:
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"Сборщик метрик {collect.__name__} упал: {e}")
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def flush(self, force: bool = False) -> None:
+        """Записать значения воркера в <directory>/<pid>.json"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_interval:
+            return
+        self._flushed_at = now
+        _write_json(
+            os.path.join(self.directory, f"{os.getpid()}.json"), self.snapshot()
+        )
+
+    def render(self) -> str:
+        if not self.directory:
+            return exposition(self.snapshot())
+        self.flush(force=True)
+        merged: dict = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                data = _read_json(os.path.join(self.directory, name))
+                if data:
+                    merge(merged, data)
+        return exposition(merged)
+
+
+def merge(target: dict, snapshot: dict, gauges: bool = True) -> dict:
+    """Сложить снимок одного процесса в общий (gauges=False — без gauge)"""
+    for name, data in snapshot.items():
+        if data["type"] == "gauge" and not gauges:
+            continue
+        merged = target.setdefault(name, {**data, "samples": []})
+        samples = {tuple(key): value for key, value in merged["samples"]}
+        for key, value in data["samples"]:
+            key = tuple(key)
+            current = samples.get(key)
+            if current is None:
+                samples[key] = value
+            elif isinstance(value, list):
+                samples[key] = [a + b for a, b in zip(current, value)]
+            else:
+                samples[key] = current + value
+        merged["samples"] = [[list(key), value] for key, value in samples.items()]
+    return target
+
+
+def mark_process_dead(directory: str, pid: int) -> None:
+    """Перенести счётчики и гистограммы завершившегося воркера в архив"""
+    path = os.path.join(directory, f"{pid}.json")
+    data = _read_json(path)
+    if data is None:
+        return
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    archive = _read_json(archive_path) or {}
+    _write_json(archive_path, merge(archive, data, gauges=False))
+    os.remove(path)
+
+
+def clear_directory(directory: str) -> None:
+    """Удалить значения прошлого запуска сервера"""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            os.remove(os.path.join(directory, name))
+
+
+def exposition(snapshot: dict) -> str:
+    """Текстовый формат Prometheus 0.0.4"""
+    lines = []
+    for name, data in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {_escape_help(data['help'])}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        labelnames = data["labels"]
+        for key, value in sorted(data["samples"]):
+            labels = list(zip(labelnames, key))
+            if data["type"] != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            bounds = [_number(b) for b in data["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                bucket_labels = _labels(labels + [("le", bound)])
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape_label(v)}"' for n, v in pairs) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _write_json(path: str, data: dict) -> None:
+    # Запись через временный файл и rename: читатель видит старый или новый
+    # файл целиком
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать метрики {path}: {e}")
+        return None
+
+
+settings = get_settings()
+registry = MetricsRegistry(settings.metrics_dir, settings.metrics_flush_interval)
@@ -0,0 +1,121 @@
+import time
+
+from loguru import logger
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from carmain.core import metrics
+from carmain.core.database import count_queries
+
+request_seconds = metrics.registry.histogram(
+    "carmain_http_request_duration_seconds",
+    "Время обработки HTTP-запроса по шаблону маршрута",
+    ["method", "route"],
+)
+requests_total = metrics.registry.counter(
+    "carmain_http_requests_total",
+    "HTTP-запросы по шаблону маршрута и статусу ответа",
+    ["method", "route", "status"],
+)
+requests_in_flight = metrics.registry.gauge(
+    "carmain_http_requests_in_flight", "HTTP-запросы в обработке"
+)
+
+
+class MetricsMiddleware:
+    """
+    Метрики HTTP-запросов. Маршрут берётся шаблоном (/vehicles/{vehicle_id}),
+    смонтированные приложения (/static, /admin) считаются одним маршрутом,
+    а запросы мимо маршрутов — меткой <unmatched>, чтобы число рядов не
+    зависело от URL. Значения воркера сбрасываются в metrics_dir не чаще
+    metrics_flush_interval
+    """
+
+    def __init__(self, app: ASGIApp, registry: metrics.MetricsRegistry) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root_path = scope.get("root_path", "")
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = route_template(scope, root_path)
+            request_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], route=route
+            )
+            requests_total.inc(method=scope["method"], route=route, status=status)
+            requests_in_flight.dec()
+            self.registry.flush()
+
+
+def route_template(scope: Scope, root_path: str = "") -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    mounted = scope.get("root_path", "")[len(root_path) :]
+    if mounted:
+        return f"{mounted}/{{path}}"
+    return "<unmatched>"
+
+
+class QueryStatsMiddleware:
+    """
+    Счётчик SQL-запросов на HTTP-запрос.
+
+    Транзакция запроса коммитится до отправки заголовков ответа, поэтому
+    счётчик к этому моменту полный. С headers=True число запросов и их время
+    отдаются в X-DB-Queries, X-DB-Time-Ms и Server-Timing; запрос, который
+    сделал больше warn_after SQL-запросов, пишется в лог вместе с повторами
+    """
+
+    def __init__(
+        self, app: ASGIApp, headers: bool = False, warn_after: int = 0
+    ) -> None:
+        self.app = app
+        self.headers = headers
+        self.warn_after = warn_after
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as stats:
+
+            async def send_with_stats(message: Message) -> None:
+                if message["type"] == "http.response.start" and self.headers:
+                    headers = MutableHeaders(scope=message)
+                    duration = stats.seconds * 1000
+                    headers["X-DB-Queries"] = str(stats.count)
+                    headers["X-DB-Time-Ms"] = f"{duration:.1f}"
+                    headers.append(
+                        "Server-Timing",
+                        f'db;dur={duration:.1f};desc="{stats.count} SQL"',
+                    )
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+
+        if self.warn_after and stats.count > self.warn_after:
+            repeated = ", ".join(
+                f"x{n} {' '.join(sql.split())[:80]}" for sql, n in stats.repeated()[:3]
+            )
+            logger.warning(
+                f"{scope['method']} {scope['path']}: {stats.count} SQL-запросов "
+                f"за {stats.seconds * 1000:.1f} мс. Повторы: {repeated or 'нет'}"
+            )
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Union
+
+from fastapi_users.password import PasswordHelper
+from pwdlib import PasswordHash
+
+from carmain.core.exceptions import ServiceUnavailableError
+
+
+class PooledPasswordHelper(PasswordHelper):
+    """
+    Хеширование и проверка паролей в отдельном пуле потоков.
+
+    bcrypt/argon2 занимают процессор на десятки миллисекунд и отпускают GIL,
+    поэтому в пуле они не блокируют цикл событий воркера. Пул ограничен
+    max_workers потоками, очередь — max_pending операциями: при переполнении
+    запрос сразу получает 503, а не ждёт за всплеском входов.
+
+    Синхронные hash/verify_and_update родителя остаются для редких путей
+    fastapi-users (сброс пароля); UserManager вызывает асинхронные версии
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_pending: int = 32,
+        password_hash: Optional[PasswordHash] = None,
+    ) -> None:
+        super().__init__(password_hash)
+        # Потоки создаются при первой задаче, то есть уже после fork воркера
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password"
+        )
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run(self.hash, password)
+
+    async def verify_and_update_async(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Union[str, None]]:
+        return await self._run(self.verify_and_update, plain_password, hashed_password)
+
+    async def _run(self, func, *args):
+        # Счётчики меняются только в потоке цикла событий, блокировка не нужна
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ServiceUnavailableError(
+                detail="Слишком много одновременных входов, повторите позже",
+                headers={"Retry-After": "1"},
+            )
+
+        def timed():
+            started = time.perf_counter()
+            result = func(*args)
+            return result, started, time.perf_counter()
+
+        self.pending += 1
+        queued = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(self.executor, timed)
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        self.wait_seconds += started - queued
+        self.run_seconds += finished - started
+        return result
+
+    def stats(self) -> dict[str, Union[int, float]]:
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds": round(self.wait_seconds, 6),
+            "run_seconds": round(self.run_seconds, 6),
+        }
@@ -0,0 +1,135 @@
+"""
+Общее окружение шаблонов Jinja2 для всех страниц и фрагментов.
+
+Окружение одно на процесс: шаблоны разбираются и компилируются один раз,
+а скомпилированный код сохраняется в template_cache_dir и переживает
+перезапуск воркера. precompile() загружает все шаблоны заранее; с
+preload_app это делает мастер gunicorn, и воркеры, в том числе
+пересозданные после max_requests, получают готовые шаблоны при fork.
+
+Длинные списки отдаются потоком (stream_template): асинхронное окружение
+поверх общего рендерит шаблон по частям, пока строки читаются из БД.
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Optional
+
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+from markupsafe import Markup
+
+from carmain.core import metrics
+from carmain.core.config import get_settings
+
+render_seconds = metrics.registry.histogram(
+    "carmain_template_render_seconds",
+    "Время рендера шаблона страницы или фрагмента",
+    ["template"],
+)
+
+# Сколько символов HTML копится перед отправкой куска потокового ответа
+STREAM_CHUNK = 8 * 1024
+
+
+class TimedTemplate(Template):
+    """Шаблон, время рендера которого попадает в метрики"""
+
+    def render(self, *args, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            render_seconds.observe(
+                time.perf_counter() - started, template=self.name or "<string>"
+            )
+
+
+def to_json_filter(value: Any) -> Markup:
+    if isinstance(value, uuid.UUID):
+        return Markup(json.dumps(str(value)))
+    return Markup(json.dumps(value))
+
+
+def _bytecode_cache(cache_dir: Optional[str]) -> Optional[FileSystemBytecodeCache]:
+    if not cache_dir:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    return FileSystemBytecodeCache(cache_dir)
+
+
+def create_templates(
+    directory: str = "carmain/templates",
+    auto_reload: bool = True,
+    cache_dir: Optional[str] = None,
+) -> Jinja2Templates:
+    env = Environment(
+        loader=FileSystemLoader(directory),
+        autoescape=True,
+        # Без auto_reload загруженный шаблон не сверяется с файлом на диске
+        auto_reload=auto_reload,
+        bytecode_cache=_bytecode_cache(cache_dir),
+    )
+    env.template_class = TimedTemplate
+    env.filters["tojson"] = to_json_filter
+    return Jinja2Templates(env=env)
+
+
+def precompile(templates: Jinja2Templates) -> int:
+    """Загружает все шаблоны в кэш окружения; ошибка шаблона — ошибка старта"""
+    names = templates.env.list_templates(extensions=("html",))
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+
+def create_stream_env(
+    templates: Jinja2Templates, cache_dir: Optional[str] = None
+) -> Environment:
+    """
+    Асинхронное окружение поверх общего: те же загрузчик, фильтры и
+    глобальные переменные, а циклы шаблона обходят и асинхронные итераторы.
+    Код шаблонов в нём другой, поэтому и кэш байткода отдельный
+    """
+    return templates.env.overlay(
+        enable_async=True,
+        bytecode_cache=_bytecode_cache(cache_dir and os.path.join(cache_dir, "async")),
+    )
+
+
+async def _chunks(parts: AsyncIterator[str], size: int) -> AsyncIterator[str]:
+    buffer: list[str] = []
+    buffered = 0
+    async for part in parts:
+        buffer.append(part)
+        buffered += len(part)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_template(name: str, context: dict) -> StreamingResponse:
+    """
+    Ответ, который уходит клиенту по мере рендера. generate_async() выдаёт
+    HTML по частям, циклы шаблона читают строки из асинхронных итераторов
+    контекста, поэтому в памяти не собираются ни все строки, ни вся страница.
+    Части склеиваются в куски по STREAM_CHUNK символов
+    """
+    template = stream_env.get_template(name)
+    return StreamingResponse(
+        _chunks(template.generate_async(context), STREAM_CHUNK),
+        media_type="text/html",
+    )
+
+
+_settings = get_settings()
+templates = create_templates(
+    auto_reload=_settings.template_auto_reload,
+    cache_dir=_settings.template_cache_dir,
+)
+stream_env = create_stream_env(templates, _settings.template_cache_dir)
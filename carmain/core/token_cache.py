@@ -0,0 +1,304 @@
+"""
+Кэш проверки cookie-сессий: токен -> UserPrincipal.
+
+Без кэша каждый запрос, включая мелкие HTMX-фрагменты, ходит в таблицу
+accesstoken. Запись живёт не дольше token_cache_ttl и не дольше самого
+токена; удаляется при выходе (destroy_token) и при изменении или удалении
+пользователя. Ключи — sha256 от токена, сами токены в кэш не попадают.
+
+Хранилище подключаемое: по умолчанию LRU в памяти воркера, при заданном
+token_cache_url — общий для всех воркеров сервер с протоколом Redis (RESP).
+
+Кэш в памяти сбрасывается только в том воркере, который обработал выход
+или деактивацию: остальные воркеры принимают отозванный токен, пока не
+истечёт их запись. Поэтому TTL такого кэша не больше LOCAL_TOKEN_CACHE_MAX_TTL,
+а для нескольких воркеров с долгим TTL нужен token_cache_url.
+"""
+
+import asyncio
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+from carmain.core import metrics
+from carmain.core.config import get_settings
+from carmain.schemas.user_schema import UserPrincipal
+
+
+class TokenCacheBackend(ABC):
+    """Хранилище кэша: значения по ключу с TTL и индекс ключей пользователя"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set(self, key: str, user_id: int, value: str, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    async def delete_user(self, user_id: int) -> None: ...
+
+
+class MemoryTokenCacheBackend(TokenCacheBackend):
+    """Ограниченный по размеру LRU-кэш в памяти процесса"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        # ключ -> (момент истечения по time.monotonic, user_id, значение)
+        self._entries: OrderedDict[str, tuple[float, int, str]] = OrderedDict()
+        self._user_keys: dict[int, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, user_id: int, value: str, ttl: float) -> None:
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, user_id, value)
+        self._user_keys.setdefault(user_id, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    async def delete(self, key: str) -> None:
+        self._drop(key)
+
+    async def delete_user(self, user_id: int) -> None:
+        for key in self._user_keys.pop(user_id, set()):
+            self._entries.pop(key, None)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._user_keys.get(entry[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[entry[1]]
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер с протоколом Redis"""
+
+
+class RespTokenCacheBackend(TokenCacheBackend):
+    """
+    Общий кэш в сервере с протоколом Redis (RESP): redis, valkey, keydb
+    или локальная замена. Одно соединение на воркер, команды по очереди
+    """
+
+    def __init__(
+        self, url: str, prefix: str = "carmain:token-cache:", timeout: float = 0.5
+    ):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._command("GET", self._key(key))
+        return value.decode() if value is not None else None
+
+    async def set(self, key: str, user_id: int, value: str, ttl: float) -> None:
+        ttl_ms = max(int(ttl * 1000), 1)
+        user_key = self._user_key(user_id)
+        await self._command("SET", self._key(key), value, "PX", ttl_ms)
+        await self._command("SADD", user_key, key)
+        # Индекс живёт не меньше самой долгой записи пользователя
+        if await self._command("PTTL", user_key) < ttl_ms:
+            await self._command("PEXPIRE", user_key, ttl_ms)
+
+    async def delete(self, key: str) -> None:
+        await self._command("DEL", self._key(key))
+
+    async def delete_user(self, user_id: int) -> None:
+        user_key = self._user_key(user_id)
+        keys = await self._command("SMEMBERS", user_key) or []
+        await self._command("DEL", user_key, *(self._key(key.decode()) for key in keys))
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}user:{user_id}"
+
+    async def _command(self, *args):
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._roundtrip(args)
+            except (OSError, EOFError, asyncio.TimeoutError):
+                await self.close()
+                raise
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        if self.password:
+            await self._roundtrip(("AUTH", self.password))
+        if self.db:
+            await self._roundtrip(("SELECT", self.db))
+
+    async def _roundtrip(self, args):
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(payload))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), self.timeout)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise EOFError("соединение с кэшем закрыто")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RespError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            return (await self._reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(body)
+            if size < 0:
+                return None
+            return [await self._read_reply() for _ in range(size)]
+        raise RespError(f"неизвестный ответ: {line!r}")
+
+    async def close(self) -> None:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+
+
+class TokenCache:
+    """
+    Кэш токен -> UserPrincipal со счётчиками попаданий и промахов.
+    Недоступность хранилища не ломает вход: такой запрос считается промахом
+    """
+
+    def __init__(self, backend: TokenCacheBackend, ttl: float = 60.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, token: str) -> Optional[UserPrincipal]:
+        try:
+            value = await self.backend.get(self._key(token))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Кэш токенов недоступен: {e!r}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return UserPrincipal.model_validate_json(value)
+
+    async def put(
+        self,
+        token: str,
+        principal: UserPrincipal,
+        expires_at: Optional[datetime] = None,
+    ) -> None:
+        """Сохранить проекцию; запись не переживёт срок действия токена"""
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, (expires_at - datetime.now(timezone.utc)).total_seconds())
+        if ttl <= 0:
+            return
+        try:
+            await self.backend.set(
+                self._key(token), principal.id, principal.model_dump_json(), ttl
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Кэш токенов недоступен: {e!r}")
+
+    async def invalidate(self, token: str) -> None:
+        try:
+            await self.backend.delete(self._key(token))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось удалить токен из кэша: {e!r}")
+
+    async def invalidate_user(self, user_id: int) -> None:
+        """Сбросить все закэшированные сессии пользователя"""
+        try:
+            await self.backend.delete_user(user_id)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось сбросить кэш сессий пользователя: {e!r}")
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+
+# Сколько секунд другой воркер может принимать отозванный токен без общего кэша
+LOCAL_TOKEN_CACHE_MAX_TTL = 5.0
+
+
+def create_token_cache() -> TokenCache:
+    settings = get_settings()
+    if settings.token_cache_url:
+        store = RespTokenCacheBackend(settings.token_cache_url)
+        return TokenCache(store, settings.token_cache_ttl)
+
+    store = MemoryTokenCacheBackend(settings.token_cache_size)
+    return TokenCache(store, min(settings.token_cache_ttl, LOCAL_TOKEN_CACHE_MAX_TTL))
+
+
+token_cache = create_token_cache()
+
+token_cache_lookups = metrics.registry.counter(
+    "carmain_token_cache_lookups_total",
+    "Проверки сессии через кэш токенов: hit, miss, error",
+    ["result"],
+)
+
+
+@metrics.registry.collector
+def collect_token_cache_stats() -> None:
+    stats = token_cache.stats()
+    token_cache_lookups.set_total(stats["hits"], result="hit")
+    token_cache_lookups.set_total(stats["misses"], result="miss")
+    token_cache_lookups.set_total(stats["errors"], result="error")
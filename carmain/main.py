@@ -1,22 +1,20 @@
-import json
 import logging
-import uuid
 from contextlib import asynccontextmanager
 
 from fastapi import Depends
-from markupsafe import Markup
 from sqladmin import Admin
-from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import PlainTextResponse, RedirectResponse
+from carmain.core.templating import precompile, templates
 from carmain.admin.items import MaintenanceItemAdmin, UserMaintenanceItemAdmin
 from carmain.admin.records import ServiceRecordAdmin
 from carmain.admin.users import UserAdmin, AccessTokenAdmin
 from carmain.admin.vehicles import VehicleAdmin
 from carmain.bootstrap import create_initial_maintenance_items
-from carmain.core import database
+from carmain.core import database, metrics
 from carmain.core.config import get_settings
 from carmain.core.admin_auth import AdminAuthBackend
-from carmain.models.users import User
+from carmain.core.middleware import MetricsMiddleware, QueryStatsMiddleware
+from carmain.schemas.user_schema import UserPrincipal
 from carmain.routers.v1 import auth_router, vehicle_router
 from carmain.views import auth_router as auth_view_router
 from carmain.views.v1 import vehicle_view, maintenance_view, service_view
@@ -40,8 +38,12 @@ async def lifespan(app: FastAPI):
             logger.error(f"Error during initialization: {e}")
             raise
 
+    # Первые запросы воркера не ждут проверки реплик и без неё читали бы
+    # с основной БД
+    await database.replicas.check_lag()
+
     yield
-    
+
     # Shutdown: cleanup resources if needed
     logger.info("Application shutdown: cleaning up resources")
 
@@ -49,6 +51,12 @@ async def lifespan(app: FastAPI):
 carmain = FastAPI(title="Carmain", debug=True, lifespan=lifespan)
 
 settings = get_settings()
+carmain.add_middleware(
+    QueryStatsMiddleware,
+    headers=settings.debug_query_headers,
+    warn_after=settings.query_budget_warning,
+)
+carmain.add_middleware(MetricsMiddleware, registry=metrics.registry)
 carmain.mount("/static", StaticFiles(directory=settings.static_path), name="static")
 carmain.mount("/media", StaticFiles(directory=settings.media_path), name="media")
 
@@ -79,21 +87,15 @@ carmain.include_router(vehicle_view.vehicle_router)
 carmain.include_router(maintenance_view.router)
 carmain.include_router(service_view.router)
 
+# Шаблоны компилируются при импорте приложения: с preload_app — один раз в
+# мастере gunicorn, до fork воркеров
+logger.info(f"Templates precompiled: {precompile(templates)}")
+
 
 # @carmain.get("/")
 # async def welcome(user: User = Depends(auth_router.current_user)) -> dict:
 #     return {"message": f"Welcome {user.email}"}
 
-templates = Jinja2Templates(directory="carmain/templates")
-
-
-def to_json_filter(value):
-    if isinstance(value, uuid.UUID):
-        return Markup(json.dumps(str(value)))
-    return Markup(json.dumps(value))
-
-
-templates.env.filters["tojson"] = to_json_filter
 
 # def to_json_filter(value):
 #     """
@@ -109,13 +111,24 @@ templates.env.filters["tojson"] = to_json_filter
 @carmain.get("/health")
 async def health_check():
     """Health check endpoint for load balancers and monitoring"""
+    # Без авторизации: только ответ "жив". Пулы, реплики и кэши — в /metrics,
+    # закрытом в nginx
     return {"status": "healthy", "service": "carmain"}
 
 
+@carmain.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Метрики всех воркеров в текстовом формате Prometheus"""
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @carmain.get("/")
 async def index(
     request: Request,
-    user: User = Depends(auth_router.optional_user),
+    user: UserPrincipal = Depends(auth_router.optional_principal),
     vehicle_service: vehicle_view.VehicleService = Depends(),
 ):
     if not user:
@@ -13,6 +13,7 @@ from carmain.models.auth import *  # noqa
 from carmain.models.vehicles import *  # noqa
 from carmain.models.items import *  # noqa
 from carmain.models.records import *  # noqa
+from carmain.models.versions import *  # noqa
 import fastapi_users_db_sqlalchemy  # noqa
 
 # Load environment variables from .env file
@@ -0,0 +1,72 @@
+"""user_maintenance_item next due odometer
+
+Revision ID: 8f2c1d9a4b7e
+Revises: 324bd1152169
+Create Date: 2026-10-17 12:40:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8f2c1d9a4b7e"
+down_revision: Union[str, None] = "324bd1152169"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "user_maintenance_item",
+        sa.Column("next_due_odometer", sa.Integer(), nullable=True),
+    )
+    op.add_column(
+        "user_maintenance_item",
+        sa.Column("next_warning_odometer", sa.Integer(), nullable=True),
+    )
+
+    # Заполняем пороговые пробеги для уже обслуживавшихся элементов
+    op.execute(
+        """
+        UPDATE user_maintenance_item AS umi
+        SET next_due_odometer = umi.last_service_odometer + intervals.interval,
+            next_warning_odometer = umi.last_service_odometer
+                + intervals.interval * 90 / 100
+        FROM (
+            SELECT u.id,
+                   COALESCE(u.custom_interval, mi.default_interval) AS interval
+            FROM user_maintenance_item AS u
+            JOIN maintenance_item AS mi ON mi.id = u.item_id
+        ) AS intervals
+        WHERE intervals.id = umi.id
+          AND umi.last_service_odometer IS NOT NULL
+        """
+    )
+
+    op.create_index(
+        "ix_user_maintenance_item_vehicle_next_due",
+        "user_maintenance_item",
+        ["vehicle_id", "next_due_odometer"],
+    )
+    op.create_index(
+        "ix_user_maintenance_item_vehicle_next_warning",
+        "user_maintenance_item",
+        ["vehicle_id", "next_warning_odometer"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_user_maintenance_item_vehicle_next_warning",
+        table_name="user_maintenance_item",
+    )
+    op.drop_index(
+        "ix_user_maintenance_item_vehicle_next_due",
+        table_name="user_maintenance_item",
+    )
+    op.drop_column("user_maintenance_item", "next_warning_odometer")
+    op.drop_column("user_maintenance_item", "next_due_odometer")
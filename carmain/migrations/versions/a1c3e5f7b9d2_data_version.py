@@ -0,0 +1,33 @@
+"""data_version table for conditional GET of fragments
+
+Revision ID: a1c3e5f7b9d2
+Revises: f4a6c8e0b2d5
+Create Date: 2026-10-17 15:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a1c3e5f7b9d2"
+down_revision: Union[str, None] = "f4a6c8e0b2d5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Строки появляются при первой записи; отсутствующая версия равна 0
+    op.create_table(
+        "data_version",
+        sa.Column("scope", sa.String(length=64), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("scope"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("data_version")
@@ -0,0 +1,83 @@
+"""maintenance_item category column and trigram search index
+
+Revision ID: b3e71f0c5d21
+Revises: 8f2c1d9a4b7e
+Create Date: 2026-10-17 13:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# Правила категорий на момент миграции. Намеренно скопированы, а не
+# импортированы из приложения: результат миграции не должен меняться
+# вместе с кодом. Первое совпадение побеждает
+CATEGORY_KEYWORDS = (
+    ("filters", ("фильтр",)),
+    ("brakes", ("тормоз", "колод")),
+    ("battery", ("аккум", "батар")),
+    ("engine", ("масл", "двигател")),
+)
+
+
+def _category(name: str):
+    name_lower = name.lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in name_lower for keyword in keywords):
+            return category
+    return None
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b3e71f0c5d21"
+down_revision: Union[str, None] = "8f2c1d9a4b7e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "maintenance_item",
+        sa.Column("category", sa.String(length=32), nullable=True),
+    )
+
+    # Справочник небольшой, категории проставляем построчно
+    connection = op.get_bind()
+    maintenance_item = sa.table(
+        "maintenance_item",
+        sa.column("id", sa.Uuid()),
+        sa.column("name", sa.String()),
+        sa.column("category", sa.String()),
+    )
+    for item_id, name in connection.execute(
+        sa.select(maintenance_item.c.id, maintenance_item.c.name)
+    ):
+        category = _category(name)
+        if category is not None:
+            connection.execute(
+                maintenance_item.update()
+                .where(maintenance_item.c.id == item_id)
+                .values(category=category)
+            )
+
+    op.create_index(
+        op.f("ix_maintenance_item_category"), "maintenance_item", ["category"]
+    )
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_maintenance_item_name_trgm",
+        "maintenance_item",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_maintenance_item_name_trgm", table_name="maintenance_item")
+    op.drop_index(op.f("ix_maintenance_item_category"), table_name="maintenance_item")
+    op.drop_column("maintenance_item", "category")
@@ -0,0 +1,33 @@
+"""catalog_version table for the maintenance catalog cache
+
+Revision ID: c5a9e2d4f1b8
+Revises: b3e71f0c5d21
+Create Date: 2026-10-17 13:40:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5a9e2d4f1b8"
+down_revision: Union[str, None] = "b3e71f0c5d21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    catalog_version = op.create_table(
+        "catalog_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.bulk_insert(catalog_version, [{"id": 1, "version": 1}])
+
+
+def downgrade() -> None:
+    op.drop_table("catalog_version")
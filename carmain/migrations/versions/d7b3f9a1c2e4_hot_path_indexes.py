@@ -0,0 +1,66 @@
+"""composite indexes for the hot access paths
+
+Revision ID: d7b3f9a1c2e4
+Revises: c5a9e2d4f1b8
+Create Date: 2026-10-17 14:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7b3f9a1c2e4"
+down_revision: Union[str, None] = "c5a9e2d4f1b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Индексы повторяют __table_args__ моделей; проверка планов до и после —
+# benchmarks/index_plans.py
+INDEXES = (
+    # Гараж пользователя
+    ("ix_vehicle_user_id", "vehicle", ["user_id"]),
+    # Элементы обслуживания пользователя по автомобилю
+    (
+        "ix_user_maintenance_item_user_vehicle",
+        "user_maintenance_item",
+        ["user_id", "vehicle_id"],
+    ),
+    # Отслеживаемые работы автомобиля: item_id читается из самого индекса
+    (
+        "ix_user_maintenance_item_vehicle_item",
+        "user_maintenance_item",
+        ["vehicle_id", "item_id"],
+    ),
+    # История обслуживания от новых записей к старым, в порядке курсора
+    (
+        "ix_service_record_user_item_date",
+        "service_record",
+        [sa.text("user_item_id"), sa.text("service_date DESC"), sa.text("id DESC")],
+    ),
+)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но не
+    # работает внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            # Прерванная сборка CONCURRENTLY оставляет невалидный индекс
+            # с тем же именем: удаляем его перед повторной попыткой
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
@@ -0,0 +1,173 @@
+"""service_record: native uuid columns and a real foreign key
+
+Revision ID: e2c8a4f6b0d3
+Revises: d7b3f9a1c2e4
+Create Date: 2026-10-17 14:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2c8a4f6b0d3"
+down_revision: Union[str, None] = "d7b3f9a1c2e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Начальная схема уже создаёт service_record с колонками uuid, но модель
+# раньше описывала их как sqlalchemy_utils.UUIDType (CHAR(32)), и базы,
+# созданные по модели, хранят id строками. Миграция переводит такие базы
+# на uuid без долгой блокировки таблицы:
+#   1. новые колонки uuid, триггер заполняет их для новых и изменённых строк;
+#   2. старые строки переносятся пачками по BATCH_SIZE, каждая в своей
+#      транзакции; индексы по новым колонкам строятся CONCURRENTLY;
+#   3. под короткой блокировкой старые колонки заменяются новыми;
+#   4. внешний ключ проверяется без блокировки записи (VALIDATE CONSTRAINT).
+BATCH_SIZE = 10000
+
+HISTORY_INDEX = "ix_service_record_user_item_date"
+
+SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION service_record_uuid_sync() RETURNS trigger AS $$
+BEGIN
+    NEW.id_uuid := NEW.id::uuid;
+    NEW.user_item_id_uuid := NEW.user_item_id::uuid;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+COPY_BATCH = sa.text(
+    """
+    WITH batch AS (
+        SELECT id FROM service_record
+        WHERE id > :after
+        ORDER BY id
+        LIMIT :size
+    )
+    UPDATE service_record AS sr
+    SET id_uuid = sr.id::uuid, user_item_id_uuid = sr.user_item_id::uuid
+    FROM batch
+    WHERE sr.id = batch.id
+    RETURNING sr.id
+    """
+)
+
+
+def _uuid_columns() -> bool:
+    columns = sa.inspect(op.get_bind()).get_columns("service_record")
+    return all(
+        isinstance(column["type"], sa.Uuid)
+        for column in columns
+        if column["name"] in ("id", "user_item_id")
+    )
+
+
+def upgrade() -> None:
+    # SQL-скрипт (--sql) строится от начальной схемы, где колонки уже uuid
+    if op.get_context().as_sql or _uuid_columns():
+        return
+
+    op.add_column("service_record", sa.Column("id_uuid", sa.Uuid(), nullable=True))
+    op.add_column(
+        "service_record", sa.Column("user_item_id_uuid", sa.Uuid(), nullable=True)
+    )
+    op.execute(SYNC_FUNCTION)
+    op.execute(
+        "CREATE TRIGGER service_record_uuid_sync "
+        "BEFORE INSERT OR UPDATE ON service_record "
+        "FOR EACH ROW EXECUTE FUNCTION service_record_uuid_sync()"
+    )
+    # NOT VALID: проверяются только новые строки, без сканирования таблицы.
+    # После проверки SET NOT NULL и PRIMARY KEY не сканируют таблицу под
+    # блокировкой
+    op.execute(
+        "ALTER TABLE service_record ADD CONSTRAINT service_record_id_uuid_not_null "
+        "CHECK (id_uuid IS NOT NULL) NOT VALID"
+    )
+    op.execute(
+        "ALTER TABLE service_record "
+        "ADD CONSTRAINT service_record_user_item_id_uuid_not_null "
+        "CHECK (user_item_id_uuid IS NOT NULL) NOT VALID"
+    )
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        after = ""
+        while True:
+            ids = connection.execute(
+                COPY_BATCH, {"after": after, "size": BATCH_SIZE}
+            ).scalars()
+            after = max(ids, default=None)
+            if after is None:
+                break
+
+        op.execute(
+            "ALTER TABLE service_record "
+            "VALIDATE CONSTRAINT service_record_id_uuid_not_null"
+        )
+        op.execute(
+            "ALTER TABLE service_record "
+            "VALIDATE CONSTRAINT service_record_user_item_id_uuid_not_null"
+        )
+        op.create_index(
+            "service_record_id_uuid_key",
+            "service_record",
+            ["id_uuid"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            f"{HISTORY_INDEX}_uuid",
+            "service_record",
+            [
+                sa.text("user_item_id_uuid"),
+                sa.text("service_date DESC"),
+                sa.text("id_uuid DESC"),
+            ],
+            postgresql_concurrently=True,
+        )
+
+    op.execute("LOCK TABLE service_record IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER service_record_uuid_sync ON service_record")
+    op.execute("DROP FUNCTION service_record_uuid_sync()")
+    # Вместе со старыми колонками удаляются их первичный и внешний ключи
+    # и индексы
+    op.drop_column("service_record", "id")
+    op.drop_column("service_record", "user_item_id")
+    op.alter_column("service_record", "id_uuid", new_column_name="id")
+    op.alter_column(
+        "service_record",
+        "user_item_id_uuid",
+        new_column_name="user_item_id",
+        nullable=False,
+    )
+    op.execute(
+        "ALTER TABLE service_record ADD CONSTRAINT service_record_pkey "
+        "PRIMARY KEY USING INDEX service_record_id_uuid_key"
+    )
+    op.drop_constraint("service_record_id_uuid_not_null", "service_record")
+    op.drop_constraint("service_record_user_item_id_uuid_not_null", "service_record")
+    op.execute(f"ALTER INDEX {HISTORY_INDEX}_uuid RENAME TO {HISTORY_INDEX}")
+    op.alter_column("service_record", "id", server_default=sa.func.gen_random_uuid())
+    op.execute(
+        "ALTER TABLE service_record "
+        "ADD CONSTRAINT service_record_user_item_id_fkey "
+        "FOREIGN KEY (user_item_id) REFERENCES user_maintenance_item (id) NOT VALID"
+    )
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            "ALTER TABLE service_record "
+            "VALIDATE CONSTRAINT service_record_user_item_id_fkey"
+        )
+
+
+def downgrade() -> None:
+    # uuid — тип колонок начальной схемы, возвращать CHAR(32) некуда
+    pass
@@ -0,0 +1,91 @@
+"""maintenance_item: stored type and icon
+
+Revision ID: f4a6c8e0b2d5
+Revises: e2c8a4f6b0d3
+Create Date: 2026-10-17 15:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# Правила на момент миграции, скопированы из приложения по той же причине,
+# что и в b3e71f0c5d21. Первое совпадение побеждает; правило — группы слов,
+# каждая из которых должна встретиться в названии
+TYPE_RULES = (
+    ("oil_change", (("масл",),)),
+    ("brake_pads", (("тормоз", "колод"),)),
+    ("timing_belt", (("ремен", "грм"),)),
+    ("air_filter", (("фильтр",), ("воздух", "воздуш"))),
+    ("battery", (("аккумулятор", "батар"),)),
+)
+
+ICON_RULES = (
+    ("oil-can", (("масл", "oil"),)),
+    ("exclamation-circle", (("тормоз", "brake"),)),
+    ("cogs", (("ремень", "грм"),)),
+    ("filter", (("фильтр", "filter"),)),
+    ("car-battery", (("аккум", "battery"),)),
+)
+
+
+def _case(name, rules, default: str):
+    """Правила как CASE: одно UPDATE на всю таблицу, работает и в --sql"""
+    name_lower = sa.func.lower(name)
+    return sa.case(
+        *(
+            (
+                sa.and_(
+                    *(
+                        sa.or_(*(name_lower.contains(word) for word in group))
+                        for group in condition
+                    )
+                ),
+                value,
+            )
+            for value, condition in rules
+        ),
+        else_=default,
+    )
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f4a6c8e0b2d5"
+down_revision: Union[str, None] = "e2c8a4f6b0d3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NOT NULL с константой по умолчанию не переписывает таблицу
+    op.add_column(
+        "maintenance_item",
+        sa.Column("type", sa.String(length=32), server_default="other", nullable=False),
+    )
+    op.add_column(
+        "maintenance_item",
+        sa.Column(
+            "icon", sa.String(length=32), server_default="wrench", nullable=False
+        ),
+    )
+
+    maintenance_item = sa.table(
+        "maintenance_item",
+        sa.column("name", sa.String()),
+        sa.column("type", sa.String()),
+        sa.column("icon", sa.String()),
+    )
+    op.execute(
+        maintenance_item.update().values(
+            type=_case(maintenance_item.c.name, TYPE_RULES, "other"),
+            icon=_case(maintenance_item.c.name, ICON_RULES, "wrench"),
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("maintenance_item", "icon")
+    op.drop_column("maintenance_item", "type")
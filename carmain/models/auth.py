@@ -14,7 +14,7 @@ from carmain.models.users import User
 class AccessToken(SQLAlchemyBaseAccessTokenTable, Base):
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"))
     data: Mapped[dict] = mapped_column(JSON, nullable=True)
-    user: Mapped[User] = relationship(back_populates="sessions")
+    user: Mapped[User] = relationship(back_populates="sessions", lazy="raise")
 
 
 async def get_access_token_db(session: AsyncSession = Depends(get_async_session)):
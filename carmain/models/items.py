@@ -1,23 +1,54 @@
 import datetime
 import uuid
+from typing import Optional
 
-from sqlalchemy import Uuid, Integer, ForeignKey, String, DateTime
+from sqlalchemy import (
+    Uuid,
+    Integer,
+    ForeignKey,
+    String,
+    DateTime,
+    Index,
+    event,
+    select,
+    update,
+    DDL,
+    inspect,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from carmain.core.database import Base
+from carmain.utils.ids import uuid7
+from carmain.utils.maintenance_utils import classify
 from carmain.models.users import User
 from carmain.models.vehicles import Vehicle
 
 
 class MaintenanceItem(Base):
     __tablename__ = "maintenance_item"
+    __table_args__ = (
+        # Триграммный индекс для поиска по подстроке (ILIKE '%q%')
+        Index(
+            "ix_maintenance_item_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, index=True, default=uuid.uuid4
+        Uuid, primary_key=True, index=True, default=uuid7
     )
     name: Mapped[str] = mapped_column(String(128))
     default_interval: Mapped[int] = mapped_column(Integer)
+    # Тип, иконка и категория вычисляются из названия при записи, см. события
+    # ниже
+    type: Mapped[str] = mapped_column(String(32), server_default="other")
+    icon: Mapped[str] = mapped_column(String(32), server_default="wrench")
+    category: Mapped[Optional[str]] = mapped_column(
+        String(32), nullable=True, index=True
+    )
     user_maintenance_items: Mapped[list["UserMaintenanceItem"]] = relationship(
-        back_populates="maintenance_item", lazy="joined"
+        back_populates="maintenance_item", lazy="raise"
     )
 
     def __str__(self):
@@ -25,11 +56,42 @@ class MaintenanceItem(Base):
         # return super().__str__()
 
 
+class CatalogVersion(Base):
+    """
+    Версия справочника работ. Увеличивается при любом изменении
+    MaintenanceItem, чтобы воркеры могли лениво обновить свой кэш справочника
+    """
+
+    __tablename__ = "catalog_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=1)
+
+
+# Доля интервала, после которой обслуживание считается предстоящим
+WARNING_THRESHOLD_PERCENT = 90
+
+
 class UserMaintenanceItem(Base):
     __tablename__ = "user_maintenance_item"
+    __table_args__ = (
+        Index(
+            "ix_user_maintenance_item_vehicle_next_due",
+            "vehicle_id",
+            "next_due_odometer",
+        ),
+        Index(
+            "ix_user_maintenance_item_vehicle_next_warning",
+            "vehicle_id",
+            "next_warning_odometer",
+        ),
+        Index("ix_user_maintenance_item_user_vehicle", "user_id", "vehicle_id"),
+        # item_id читается из индекса без обращения к таблице
+        Index("ix_user_maintenance_item_vehicle_item", "vehicle_id", "item_id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, index=True, default=uuid.uuid4
+        Uuid, primary_key=True, index=True, default=uuid7
     )
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"))
     item_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey("maintenance_item.id"))
@@ -39,9 +101,126 @@ class UserMaintenanceItem(Base):
     last_service_date: Mapped[datetime.datetime] = mapped_column(
         DateTime, nullable=True
     )
-    user: Mapped[User] = relationship(back_populates="maintenance_items")
-    vehicle: Mapped[Vehicle] = relationship(back_populates="maintenance_items")
+    # Пробег, после которого обслуживание просрочено / скоро потребуется.
+    # Поддерживаются событиями ниже, чтобы запросы "что пора обслужить"
+    # сводились к сравнению с индексированной колонкой.
+    next_due_odometer: Mapped[int] = mapped_column(Integer, nullable=True)
+    next_warning_odometer: Mapped[int] = mapped_column(Integer, nullable=True)
+    user: Mapped[User] = relationship(back_populates="maintenance_items", lazy="raise")
+    vehicle: Mapped[Vehicle] = relationship(
+        back_populates="maintenance_items", lazy="raise"
+    )
     maintenance_item: Mapped[MaintenanceItem] = relationship(
-        back_populates="user_maintenance_items"
+        back_populates="user_maintenance_items", lazy="raise"
+    )
+    # Профили загрузки связей, см. carmain.models.loaders
+    loader_profiles = {
+        # Карточка элемента: название из каталога и пробег автомобиля
+        "card": ("maintenance_item", "vehicle"),
+        "catalog": ("maintenance_item",),
+    }
+
+
+def _warning_offset(interval):
+    return interval * WARNING_THRESHOLD_PERCENT // 100
+
+
+def _service_interval(connection, target: UserMaintenanceItem) -> Optional[int]:
+    if target.custom_interval is not None:
+        return target.custom_interval
+    maintenance_item = inspect(target).dict.get("maintenance_item")
+    if maintenance_item is not None:
+        return maintenance_item.default_interval
+    return connection.scalar(
+        select(MaintenanceItem.default_interval).where(
+            MaintenanceItem.id == target.item_id
+        )
+    )
+
+
+def _set_due_odometers(connection, target: UserMaintenanceItem) -> None:
+    """Пересчитать пороговые пробеги элемента перед записью в БД"""
+    last_odometer = target.last_service_odometer
+    interval = None
+    if last_odometer is not None:
+        interval = _service_interval(connection, target)
+    if interval is None:
+        target.next_due_odometer = None
+        target.next_warning_odometer = None
+        return
+    target.next_due_odometer = last_odometer + interval
+    target.next_warning_odometer = last_odometer + _warning_offset(interval)
+
+
+@event.listens_for(UserMaintenanceItem, "before_insert")
+def _user_item_before_insert(mapper, connection, target):
+    _set_due_odometers(connection, target)
+
+
+@event.listens_for(UserMaintenanceItem, "before_update")
+def _user_item_before_update(mapper, connection, target):
+    state = inspect(target)
+    if any(
+        state.attrs[name].history.has_changes()
+        for name in ("last_service_odometer", "custom_interval", "item_id")
+    ):
+        _set_due_odometers(connection, target)
+
+
+def _classify(target: MaintenanceItem) -> None:
+    classification = classify(target.name)
+    target.type = classification.type.value
+    target.icon = classification.icon
+    target.category = classification.category
+
+
+@event.listens_for(MaintenanceItem, "before_insert")
+def _maintenance_item_before_insert(mapper, connection, target):
+    _classify(target)
+
+
+@event.listens_for(MaintenanceItem, "before_update")
+def _maintenance_item_before_update(mapper, connection, target):
+    if inspect(target).attrs.name.history.has_changes():
+        _classify(target)
+
+
+@event.listens_for(MaintenanceItem, "after_update")
+def _maintenance_item_after_update(mapper, connection, target):
+    if not inspect(target).attrs.default_interval.history.has_changes():
+        return
+    connection.execute(
+        update(UserMaintenanceItem.__table__)
+        .where(
+            UserMaintenanceItem.item_id == target.id,
+            UserMaintenanceItem.custom_interval.is_(None),
+            UserMaintenanceItem.last_service_odometer.isnot(None),
+        )
+        .values(
+            next_due_odometer=UserMaintenanceItem.last_service_odometer
+            + target.default_interval,
+            next_warning_odometer=UserMaintenanceItem.last_service_odometer
+            + _warning_offset(target.default_interval),
+        )
     )
-    eagers = ["maintenance_item", "vehicle"]
+
+
+# Единственная строка версии создаётся вместе с таблицей (миграция c5a9e2d4f1b8
+# или create_all), поэтому увеличение версии — один UPDATE без гонок за вставку
+event.listen(
+    CatalogVersion.__table__,
+    "after_create",
+    DDL("INSERT INTO catalog_version (id, version) VALUES (1, 1)"),
+)
+
+
+def _bump_catalog_version(connection) -> None:
+    table = CatalogVersion.__table__
+    connection.execute(update(table).values(version=table.c.version + 1))
+
+
+@event.listens_for(MaintenanceItem, "after_insert")
+@event.listens_for(MaintenanceItem, "after_update")
+@event.listens_for(MaintenanceItem, "after_delete")
+def _maintenance_item_changed(mapper, connection, target):
+    _bump_catalog_version(connection)
@@ -0,0 +1,40 @@
+from typing import Optional
+
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+
+def loader_options(model, profile: Optional[str]) -> list[LoaderOption]:
+    """
+    Опции загрузки связей для именованного профиля модели.
+
+    Все связи моделей объявлены с lazy="raise": обращение к незагруженной
+    связи — ошибка, а не скрытый запрос. Модель описывает профили в
+    атрибуте loader_profiles: имя профиля -> пути связей через точку,
+    например "user_maintenance_item.vehicle". Ссылки на один объект
+    подгружаются через JOIN, коллекции — отдельным запросом SELECT IN
+    """
+    if not profile:
+        return []
+
+    profiles = getattr(model, "loader_profiles", {})
+    if profile not in profiles:
+        raise ValueError(
+            f"Неизвестный профиль загрузки {profile!r} для {model.__name__}"
+        )
+
+    options = []
+    for path in profiles[profile]:
+        option = None
+        current = model
+        for name in path.split("."):
+            attr = getattr(current, name)
+            if attr.property.uselist:
+                option = (
+                    selectinload(attr) if option is None else option.selectinload(attr)
+                )
+            else:
+                option = joinedload(attr) if option is None else option.joinedload(attr)
+            current = attr.property.mapper.class_
+        options.append(option)
+    return options
@@ -1,30 +1,44 @@
 import datetime
 import uuid
 
-from sqlalchemy import Uuid, Integer, ForeignKey, String, DateTime, Text
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy_utils import UUIDType
+from sqlalchemy import Uuid, Integer, ForeignKey, String, DateTime, Text, Index
+from sqlalchemy.orm import Mapped, mapped_column, relationship, backref
 from carmain.core.database import Base
+from carmain.utils.ids import uuid7
 
 
 class ServiceRecord(Base):
     __tablename__ = "service_record"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUIDType(binary=False),
-        primary_key=True,
-        index=True,
-        default=lambda: uuid.uuid4().hex,
+        Uuid, primary_key=True, index=True, default=uuid7
     )
     user_item_id: Mapped[uuid.UUID] = mapped_column(
-        UUIDType(binary=False),
-        ForeignKey("user_maintenance_item.id"),
-        default=lambda: uuid.uuid4().hex,
+        Uuid, ForeignKey("user_maintenance_item.id")
     )
     service_date: Mapped[datetime.datetime] = mapped_column(DateTime)
     service_odometer: Mapped[int] = mapped_column(Integer)
     comment: Mapped[str | None] = mapped_column(String(1024), nullable=True)
     service_photo: Mapped[str | None] = mapped_column(String(1024), nullable=True)
     user_maintenance_item = relationship(
-        "UserMaintenanceItem", backref="service_records"
+        "UserMaintenanceItem",
+        backref=backref("service_records", lazy="raise"),
+        lazy="raise",
     )
+    loader_profiles = {
+        "admin": (
+            "user_maintenance_item.maintenance_item",
+            "user_maintenance_item.vehicle",
+            "user_maintenance_item.user",
+        ),
+    }
+
+
+# История обслуживания элемента от новых записей к старым: порядок индекса
+# совпадает с курсором get_page_by_user_item_id
+Index(
+    "ix_service_record_user_item_date",
+    ServiceRecord.user_item_id,
+    ServiceRecord.service_date.desc(),
+    ServiceRecord.id.desc(),
+)
@@ -10,13 +10,13 @@ from carmain.core.database import Base, get_async_session
 class User(SQLAlchemyBaseUserTable, Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     sessions: Mapped[list["AccessToken"]] = relationship(
-        back_populates="user", lazy="joined"
+        back_populates="user", lazy="raise"
     )
     vehicles: Mapped[list["Vehicle"]] = relationship(
-        back_populates="user", lazy="joined"
+        back_populates="user", lazy="raise"
     )
     maintenance_items: Mapped[list["UserMaintenanceItem"]] = relationship(
-        back_populates="user", lazy="joined"
+        back_populates="user", lazy="raise"
     )
 
     def __str__(self):
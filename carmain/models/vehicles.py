@@ -4,6 +4,7 @@ import uuid
 from sqlalchemy import Uuid, Integer, ForeignKey, String, Date, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from carmain.core.database import Base
+from carmain.utils.ids import uuid7
 from carmain.models.users import User
 from typing import Optional
 
@@ -14,17 +15,17 @@ class Vehicle(Base):
     __tablename__ = "vehicle"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, index=True, default=uuid.uuid4
+        Uuid, primary_key=True, index=True, default=uuid7
     )
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"))
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), index=True)
     brand: Mapped[str] = mapped_column(String(64))
     model: Mapped[str] = mapped_column(String(256))
     year: Mapped[int] = mapped_column(Integer)
     odometer: Mapped[int] = mapped_column(Integer)
     photo: Mapped[Optional[str]] = mapped_column(String(512), nullable=True)
-    user: Mapped[User] = relationship(back_populates="vehicles")
+    user: Mapped[User] = relationship(back_populates="vehicles", lazy="raise")
     maintenance_items: Mapped[list["UserMaintenanceItem"]] = relationship(
-        back_populates="vehicle"
+        back_populates="vehicle", lazy="raise"
     )
 
     def __str__(self):
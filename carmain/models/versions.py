@@ -0,0 +1,16 @@
+from sqlalchemy import Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+from carmain.core.database import Base
+
+
+class DataVersion(Base):
+    """
+    Версия данных пользователя или автомобиля для условных GET фрагментов.
+    Увеличивается сервисами при каждой записи в своей области (scope), см.
+    repository/version_repository.py
+    """
+
+    __tablename__ = "data_version"
+
+    scope: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=1)
@@ -1,32 +1,89 @@
+import functools
+import inspect
+import uuid
 from typing import Annotated, Optional, Any
-from collections.abc import Sequence
+from collections.abc import AsyncIterator, Sequence
 from fastapi import Depends
-from sqlalchemy import select, update, insert, delete, Row, RowMapping
+from sqlalchemy import Select, select, update, insert, delete, Row, RowMapping
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
-from carmain.core.database import get_async_session, Base
+from carmain.core import metrics
+from carmain.core.database import (
+    RepositoryCall,
+    current_repository_call,
+    get_async_session,
+    Base,
+)
 from carmain.core.exceptions import DuplicatedError, NotFoundError
+from carmain.models.loaders import loader_options
 from carmain.repository.repository import Repository, M, K
+from carmain.utils.pagination import as_int, as_uuid, decode_cursor, encode_cursor
+
+
+call_statements = metrics.registry.histogram(
+    "carmain_repository_call_statements",
+    "Число SQL-запросов за один вызов метода репозитория",
+    ["method"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+
+# Строк в одной порции серверного курсора при потоковом чтении
+STREAM_BATCH = 200
+
+
+def track_calls(cls: type) -> None:
+    """
+    Обернуть публичные async-методы класса: SQL-запросы внутри вызова
+    попадают в метрики с меткой method="Репозиторий.метод"
+    """
+    for name, func in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.iscoroutinefunction(func):
+            setattr(cls, name, _tracked(func))
+
+
+def _tracked(func):
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        method = f"{type(self).__name__}.{func.__name__}"
+        parent = current_repository_call.get()
+        # super().create() и т.п. считаются в вызов снаружи
+        if parent is not None and parent.method == method:
+            return await func(self, *args, **kwargs)
+
+        call = RepositoryCall(method)
+        token = current_repository_call.set(call)
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            current_repository_call.reset(token)
+            call_statements.observe(call.statements, method=method)
+            if parent is not None:
+                parent.statements += call.statements
+
+    return wrapper
 
 
 class BaseRepository(Repository[K, M]):
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        track_calls(cls)
+
     def __init__(
         self, model: M, session: Annotated[AsyncSession, Depends(get_async_session)]
     ) -> None:
         self.model = model
         self.session = session
 
+    def with_profile(self, query, profile: Optional[str] = None):
+        """Подключить к запросу именованный профиль загрузки связей модели"""
+        return query.options(*loader_options(self.model, profile))
+
     async def get_by_id(
         self,
         obj_id: K,
-        eager=False,
+        profile: Optional[str] = None,
     ) -> M:
-        query = select(self.model)
-        # query = await self.session.query(self.model)
-        if eager:
-            for eager in getattr(self.model, "eagers", []):
-                query = query.options(joinedload(getattr(self.model, eager)))
+        query = self.with_profile(select(self.model), profile)
         query = query.where(self.model.id == obj_id)
         result = await self.session.scalar(query)
         if not result:
@@ -37,13 +94,55 @@ class BaseRepository(Repository[K, M]):
         result = await self.session.scalars(select(self.model))
         return result.all()
 
+    async def get_page(
+        self, cursor: Optional[str] = None, limit: int = 20, criteria: Sequence = ()
+    ) -> tuple[Sequence[M], Optional[str]]:
+        """
+        Страница строк по возрастанию id с курсором по id последней строки.
+        Для ключей uuid7 это порядок добавления строк
+        """
+        query = select(self.model).where(*criteria)
+        id_type = self.model.id.type.python_type
+        after = decode_cursor(cursor, [as_uuid if id_type is uuid.UUID else as_int])
+        if after:
+            query = query.where(self.model.id > after[0])
+        query = query.order_by(self.model.id).limit(limit + 1)
+        rows = (await self.session.scalars(query)).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1].id])
+        return rows, next_cursor
+
+    # Потоковое чтение: строки приходят из серверного курсора порциями по
+    # batch, в памяти держится только текущая порция
+    async def stream(
+        self, query: Select, batch: int = STREAM_BATCH
+    ) -> AsyncIterator[Row]:
+        result = await self.session.stream(query.execution_options(yield_per=batch))
+        async for row in result:
+            yield row
+
+    async def stream_scalars(
+        self, query: Select, batch: int = STREAM_BATCH
+    ) -> AsyncIterator[M]:
+        result = await self.session.stream_scalars(
+            query.execution_options(yield_per=batch)
+        )
+        async for obj in result:
+            yield obj
+
+    # Репозитории только отправляют изменения в БД (flush): транзакцию
+    # запроса коммитит единица работы в core.database
     async def create(self, obj: M) -> M:
         try:
-            self.session.add(obj)
-            await self.session.commit()
-            await self.session.refresh(obj)
+            # Точка сохранения: дубликат откатывает только эту вставку, а не
+            # всю транзакцию запроса с уже отправленными изменениями
+            async with self.session.begin_nested():
+                self.session.add(obj)
+                await self.session.flush()
         except IntegrityError as e:
-            await self.session.rollback()
             raise DuplicatedError(detail=str(e.orig))
         return obj
 
@@ -55,22 +154,16 @@ class BaseRepository(Repository[K, M]):
         for key, value in update_payload.items():
             setattr(db_obj, key, value)
 
-        try:
-            await self.session.commit()
-            await self.session.refresh(db_obj)
-        except Exception:
-            await self.session.rollback()
-            raise
+        await self.session.flush()
         return db_obj
 
     async def delete_by_id(self, obj_id: K) -> M:
         db_obj = await self.session.get(self.model, obj_id)
         if not db_obj:
             raise NotFoundError(detail=f"not found id: {obj_id}")
-        try:
-            await self.session.delete(db_obj)
-            await self.session.commit()
-        except Exception:
-            await self.session.rollback()
-            raise
+        await self.session.delete(db_obj)
+        await self.session.flush()
         return db_obj
+
+
+track_calls(BaseRepository)
@@ -0,0 +1,119 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from carmain.core.config import get_settings
+from carmain.models.items import CatalogVersion, MaintenanceItem
+
+
+@dataclass(frozen=True)
+class CatalogItem:
+    """Неизменяемая копия строки справочника работ"""
+
+    id: uuid.UUID
+    name: str
+    default_interval: int
+    category: Optional[str] = None
+    type: str = "other"
+    icon: str = "wrench"
+
+    def __str__(self):
+        return f"{self.name}"
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: Optional[int]
+    items: Tuple[CatalogItem, ...]
+    by_id: Mapping[uuid.UUID, CatalogItem] = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "by_id", MappingProxyType({item.id: item for item in self.items})
+        )
+
+
+class CatalogCache:
+    """
+    Кэш справочника работ в памяти воркера.
+
+    Снимок перечитывается, только если изменилась версия в таблице
+    catalog_version. Саму версию воркер сверяет не чаще раза в check_interval
+    секунд; изменения, закоммиченные в этом же процессе, сбрасывают кэш сразу,
+    а незакоммиченные изменения сессии она читает мимо кэша.
+    """
+
+    def __init__(self, check_interval: float) -> None:
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    async def snapshot(self, session: AsyncSession) -> CatalogSnapshot:
+        if session.info.get("catalog_changed"):
+            # Сессия уже изменила справочник, но ещё не закоммитила:
+            # читаем мимо кэша, чтобы запрос видел свои изменения
+            return CatalogSnapshot(None, await self._load(session))
+
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and time.monotonic() - self._checked_at < self.check_interval
+        ):
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._snapshot
+            version = await session.scalar(select(CatalogVersion.version))
+            if snapshot is None or snapshot.version != version:
+                snapshot = CatalogSnapshot(version, await self._load(session))
+                self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    @staticmethod
+    async def _load(session: AsyncSession) -> Tuple[CatalogItem, ...]:
+        rows = await session.execute(
+            select(
+                MaintenanceItem.id,
+                MaintenanceItem.name,
+                MaintenanceItem.default_interval,
+                MaintenanceItem.category,
+                MaintenanceItem.type,
+                MaintenanceItem.icon,
+            ).order_by(MaintenanceItem.name)
+        )
+        return tuple(CatalogItem(*row) for row in rows)
+
+
+catalog_cache = CatalogCache(get_settings().catalog_cache_check_interval)
+
+
+@event.listens_for(MaintenanceItem, "after_insert")
+@event.listens_for(MaintenanceItem, "after_update")
+@event.listens_for(MaintenanceItem, "after_delete")
+def _mark_catalog_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("catalog_changed", False):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("catalog_changed", None)
@@ -1,20 +1,294 @@
 import uuid
-from datetime import date
-from typing import List, Optional, Tuple, Annotated
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Annotated
 from collections.abc import Sequence
 
-from dns.resolver import query
 from fastapi import Depends
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import (
+    select,
+    func,
+    and_,
+    or_,
+    case,
+    literal,
+    tuple_,
+    true,
+    insert,
+    update,
+    Row,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
 from carmain.core.database import get_async_session
-from carmain.core.exceptions import NotFoundError
-from carmain.models.items import MaintenanceItem, UserMaintenanceItem
+from carmain.core.exceptions import NotFoundError, ValidationError
+from carmain.models.items import (
+    MaintenanceItem,
+    UserMaintenanceItem,
+    WARNING_THRESHOLD_PERCENT,
+)
+from carmain.models.loaders import loader_options
 from carmain.models.records import ServiceRecord
 from carmain.models.vehicles import Vehicle
 from carmain.repository.base_repository import BaseRepository
+from carmain.repository.catalog_cache import CatalogItem, catalog_cache
+from carmain.schemas.maintenance_schema import (
+    MaintenanceCategory,
+    MaintenanceItemStatus,
+)
+from carmain.utils.ids import uuid7
+from carmain.utils.pagination import (
+    as_bool,
+    as_int,
+    as_uuid,
+    decode_cursor,
+    encode_cursor,
+    optional,
+)
+
+
+def _due_status():
+    """Статус обслуживания элемента по сохранённым пороговым пробегам"""
+    return case(
+        (
+            UserMaintenanceItem.last_service_odometer.is_(None),
+            literal(MaintenanceItemStatus.NEVER_SERVICED.value),
+        ),
+        (
+            Vehicle.odometer > UserMaintenanceItem.next_due_odometer,
+            literal(MaintenanceItemStatus.OVERDUE.value),
+        ),
+        (
+            Vehicle.odometer > UserMaintenanceItem.next_warning_odometer,
+            literal(MaintenanceItemStatus.UPCOMING.value),
+        ),
+        else_=literal(MaintenanceItemStatus.OK.value),
+    )
+
+
+def _requires_service():
+    """
+    Условие "требует обслуживания", сформулированное как сравнение
+    с индексированной колонкой next_warning_odometer
+    """
+    return or_(
+        UserMaintenanceItem.last_service_odometer.is_(None),
+        UserMaintenanceItem.next_warning_odometer < Vehicle.odometer,
+    )
+
+
+def _overdue_km():
+    """Превышение интервала в километрах (только для просроченных)"""
+    return case(
+        (
+            Vehicle.odometer > UserMaintenanceItem.next_due_odometer,
+            Vehicle.odometer - UserMaintenanceItem.next_due_odometer,
+        ),
+        else_=None,
+    )
+
+
+def _remaining_km():
+    """Остаток до обслуживания в километрах (для непросроченных)"""
+    return case(
+        (
+            Vehicle.odometer <= UserMaintenanceItem.next_due_odometer,
+            UserMaintenanceItem.next_due_odometer - Vehicle.odometer,
+        ),
+        else_=None,
+    )
+
+
+def _catalog_filters(
+    query, q: Optional[str] = None, category: Optional[MaintenanceCategory] = None
+):
+    """Поиск по названию (через триграммный индекс) и фильтр по категории"""
+    if q:
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(MaintenanceItem.name.ilike(f"%{escaped}%", escape="\\"))
+    if category and category != MaintenanceCategory.ALL:
+        query = query.where(MaintenanceItem.category == category.value)
+    return query
+
+
+def _vehicle_due_query(
+    user_id: int,
+    vehicle_id: uuid.UUID,
+    show_all: bool,
+    q: Optional[str] = None,
+    category: Optional[MaintenanceCategory] = None,
+):
+    """Выборка элементов автомобиля со статусом и пробегами, вычисленными в SQL"""
+    query = (
+        select(
+            UserMaintenanceItem.id,
+            UserMaintenanceItem.custom_interval,
+            UserMaintenanceItem.last_service_odometer,
+            UserMaintenanceItem.last_service_date,
+            UserMaintenanceItem.next_due_odometer,
+            MaintenanceItem.name,
+            MaintenanceItem.default_interval,
+            MaintenanceItem.type,
+            _due_status().label("status"),
+            _overdue_km().label("overdue_km"),
+            _remaining_km().label("remaining_km"),
+        )
+        .join(MaintenanceItem, MaintenanceItem.id == UserMaintenanceItem.item_id)
+        .join(Vehicle, Vehicle.id == UserMaintenanceItem.vehicle_id)
+        .where(
+            and_(
+                UserMaintenanceItem.user_id == user_id,
+                UserMaintenanceItem.vehicle_id == vehicle_id,
+                Vehicle.user_id == user_id,
+            )
+        )
+    )
+    if not show_all:
+        query = query.where(_requires_service())
+    return _catalog_filters(query, q, category)
+
+
+def _due_order():
+    return (
+        # Сначала никогда не обслуживаемые
+        UserMaintenanceItem.last_service_odometer.is_(None).desc(),
+        # Затем по уровню просрочки (насколько превышен интервал)
+        UserMaintenanceItem.next_due_odometer,
+        UserMaintenanceItem.id,
+    )
+
+
+def due_query(
+    user_id: int,
+    vehicle_id: uuid.UUID,
+    cursor: Optional[str] = None,
+    show_all: bool = False,
+    q: Optional[str] = None,
+    category: Optional[MaintenanceCategory] = None,
+):
+    """
+    Элементы автомобиля в порядке списка после курсора по ключу сортировки
+    (никогда не обслуживалось, next_due_odometer, id). Некорректный курсор —
+    ValidationError сразу, до выполнения запроса
+    """
+    query = _vehicle_due_query(user_id, vehicle_id, show_all, q, category)
+    after = decode_cursor(cursor, [as_bool, optional(as_int), as_uuid])
+    if after:
+        never_serviced, next_due, item_id = after
+        if not never_serviced and next_due is None:
+            # У обслуживавшегося элемента следующий пробег всегда вычислен
+            raise ValidationError(detail="Некорректный курсор пагинации")
+        if never_serviced:
+            query = query.where(
+                or_(
+                    and_(
+                        UserMaintenanceItem.last_service_odometer.is_(None),
+                        UserMaintenanceItem.id > item_id,
+                    ),
+                    UserMaintenanceItem.last_service_odometer.isnot(None),
+                )
+            )
+        else:
+            query = query.where(
+                UserMaintenanceItem.last_service_odometer.isnot(None),
+                tuple_(UserMaintenanceItem.next_due_odometer, UserMaintenanceItem.id)
+                > tuple_(next_due, item_id),
+            )
+    return query.order_by(*_due_order())
+
+
+@dataclass(frozen=True)
+class ServicedItem:
+    """Итог отметки об обслуживании: новая запись и элемент, к которому она относится"""
+
+    id: uuid.UUID
+    vehicle_id: uuid.UUID
+    vehicle_odometer: int
+    name: str
+    record_id: uuid.UUID
+    service_odometer: int
+    # False, если запись задним числом: последнее обслуживание не изменилось
+    advanced: bool
+
+
+@dataclass(frozen=True)
+class DirectoryItem:
+    """Работа справочника с отметкой, отслеживается ли она для автомобиля"""
+
+    id: uuid.UUID
+    name: str
+    default_interval: int
+    category: Optional[str]
+    icon: str
+    is_tracked: bool
+
+    @classmethod
+    def from_catalog(cls, item: CatalogItem, is_tracked: bool) -> "DirectoryItem":
+        return cls(
+            id=item.id,
+            name=item.name,
+            default_interval=item.default_interval,
+            category=item.category,
+            icon=item.icon,
+            is_tracked=is_tracked,
+        )
+
+
+def _serviced_source(user_id: int, user_item_id: uuid.UUID):
+    """Элемент пользователя с пробегом автомобиля и названием из справочника"""
+    return (
+        select(
+            UserMaintenanceItem.id.label("user_item_id"),
+            UserMaintenanceItem.vehicle_id,
+            Vehicle.odometer.label("vehicle_odometer"),
+            MaintenanceItem.name,
+        )
+        .join(Vehicle, Vehicle.id == UserMaintenanceItem.vehicle_id)
+        .join(MaintenanceItem, MaintenanceItem.id == UserMaintenanceItem.item_id)
+        .where(
+            UserMaintenanceItem.id == user_item_id,
+            UserMaintenanceItem.user_id == user_id,
+        )
+    )
+
+
+def _advance_last_service(user_item_id, service_date, service_odometer):
+    """
+    UPDATE последнего обслуживания и пороговых пробегов элемента.
+
+    Условие стоит на самой строке, а не на прочитанной раньше копии: запись
+    задним числом (раньше последней, а в тот же день — с меньшим пробегом)
+    не откатывает состояние, в том числе при параллельных отметках
+    """
+    table = UserMaintenanceItem.__table__
+    interval = func.coalesce(
+        table.c.custom_interval,
+        select(MaintenanceItem.default_interval)
+        .where(MaintenanceItem.id == table.c.item_id)
+        .scalar_subquery(),
+    )
+    return (
+        update(table)
+        .where(
+            table.c.id == user_item_id,
+            or_(
+                table.c.last_service_date.is_(None),
+                table.c.last_service_date < service_date,
+                and_(
+                    table.c.last_service_date == service_date,
+                    func.coalesce(table.c.last_service_odometer, 0) <= service_odometer,
+                ),
+            ),
+        )
+        .values(
+            last_service_date=service_date,
+            last_service_odometer=service_odometer,
+            next_due_odometer=service_odometer + interval,
+            next_warning_odometer=service_odometer
+            + interval * WARNING_THRESHOLD_PERCENT // 100,
+        )
+        .returning(table.c.id)
+    )
 
 
 class UserMaintenanceRepository(BaseRepository):
@@ -22,25 +296,30 @@ class UserMaintenanceRepository(BaseRepository):
         super().__init__(UserMaintenanceItem, session)
 
     async def get_by_vehicle(
-        self, vehicle_id: uuid.UUID, skip=0, limit=10, eager=False
+        self, vehicle_id: uuid.UUID, skip=0, limit=10, profile: Optional[str] = None
     ) -> Sequence[UserMaintenanceItem]:
         query = select(self.model).where(UserMaintenanceItem.vehicle_id == vehicle_id)
-        if eager:
-            for eager in getattr(self.model, "eagers", []):
-                query = query.options(joinedload(getattr(self.model, eager)))
+        query = self.with_profile(query, profile)
         query = query.offset(skip).limit(limit)
         result = await self.session.scalars(query)
         if not result:
             raise NotFoundError(detail=f"not found for vehicle_id : {vehicle_id}")
         return result.unique().all()
 
+    async def get_item_ids_by_vehicle(self, vehicle_id: uuid.UUID) -> set[uuid.UUID]:
+        """Только item_id отслеживаемых работ, без загрузки самих элементов"""
+        result = await self.session.scalars(
+            select(UserMaintenanceItem.item_id).where(
+                UserMaintenanceItem.vehicle_id == vehicle_id
+            )
+        )
+        return set(result.all())
+
     async def get_by_item_id(
-        self, item_id: uuid.UUID, skip=0, limit=10, eager=False
+        self, item_id: uuid.UUID, skip=0, limit=10, profile: Optional[str] = None
     ) -> UserMaintenanceItem:
         query = select(self.model).where(UserMaintenanceItem.item_id == item_id)
-        if eager:
-            for eager in getattr(self.model, "eagers", []):
-                query = query.options(joinedload(getattr(self.model, eager)))
+        query = self.with_profile(query, profile)
         query = query.offset(skip).limit(limit)
         result = await self.session.scalar(query)
         if not result:
@@ -55,22 +334,84 @@ class MaintenanceRepository(BaseRepository):
         self, session: Annotated[AsyncSession, Depends(get_async_session)]
     ) -> None:
         super().__init__(MaintenanceItem, session)
+        self.catalog_cache = catalog_cache
 
     async def get_maintenance_items(
-        self, skip: int = 0, limit: int = 10
-    ) -> Sequence[MaintenanceItem]:
-        """Получить список всех типов обслуживания"""
-        query = select(MaintenanceItem).offset(skip).limit(limit)
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        q: Optional[str] = None,
+        category: Optional[MaintenanceCategory] = None,
+    ) -> Sequence[CatalogItem]:
+        """Получить список типов обслуживания с поиском и фильтром по категории"""
+        if not q and (not category or category == MaintenanceCategory.ALL):
+            snapshot = await self.catalog_cache.snapshot(self.session)
+            return snapshot.items[skip : skip + limit]
+
+        query = _catalog_filters(
+            select(
+                MaintenanceItem.id,
+                MaintenanceItem.name,
+                MaintenanceItem.default_interval,
+                MaintenanceItem.category,
+                MaintenanceItem.type,
+                MaintenanceItem.icon,
+            ),
+            q,
+            category,
+        )
+        query = query.order_by(MaintenanceItem.name).offset(skip).limit(limit)
         result = await self.session.execute(query)
-        return result.scalars().unique().all()
+        return [CatalogItem(*row) for row in result.all()]
 
-    async def get_maintenance_item(
-        self, item_id: uuid.UUID
-    ) -> Optional[MaintenanceItem]:
-        """Получить информацию о типе обслуживания по ID"""
-        query = select(MaintenanceItem).where(MaintenanceItem.id == item_id)
+    async def get_directory(
+        self,
+        vehicle_id: uuid.UUID,
+        q: Optional[str] = None,
+        category: Optional[MaintenanceCategory] = None,
+        tracked_only: bool = False,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> List[DirectoryItem]:
+        """
+        Справочник работ для автомобиля одним запросом: LEFT JOIN с работами
+        автомобиля даёт флаг is_tracked, поиск, фильтры и страница — в SQL
+        """
+        # DISTINCT: одна работа может отслеживаться для автомобиля дважды
+        tracked = (
+            select(UserMaintenanceItem.item_id)
+            .where(UserMaintenanceItem.vehicle_id == vehicle_id)
+            .distinct()
+            .subquery()
+        )
+        is_tracked = tracked.c.item_id.is_not(None)
+        query = select(
+            MaintenanceItem.id,
+            MaintenanceItem.name,
+            MaintenanceItem.default_interval,
+            MaintenanceItem.category,
+            MaintenanceItem.type,
+            MaintenanceItem.icon,
+            is_tracked.label("is_tracked"),
+        ).outerjoin(tracked, tracked.c.item_id == MaintenanceItem.id)
+        query = _catalog_filters(query, q, category)
+        if tracked_only:
+            query = query.where(is_tracked)
+        query = (
+            query.order_by(MaintenanceItem.name, MaintenanceItem.id)
+            .offset(skip)
+            .limit(limit)
+        )
         result = await self.session.execute(query)
-        return result.unique().scalar_one_or_none()
+        return [
+            DirectoryItem.from_catalog(CatalogItem(*row[:6]), row.is_tracked)
+            for row in result.all()
+        ]
+
+    async def get_maintenance_item(self, item_id: uuid.UUID) -> Optional[CatalogItem]:
+        """Получить информацию о типе обслуживания по ID"""
+        snapshot = await self.catalog_cache.snapshot(self.session)
+        return snapshot.by_id.get(item_id)
 
     async def get_user_maintenance_items(
         self,
@@ -88,7 +429,7 @@ class MaintenanceRepository(BaseRepository):
             query = query.where(UserMaintenanceItem.vehicle_id == vehicle_id)
 
         query = (
-            query.options(joinedload(UserMaintenanceItem.maintenance_item))
+            query.options(*loader_options(UserMaintenanceItem, "catalog"))
             .offset(skip)
             .limit(limit)
         )
@@ -115,7 +456,7 @@ class MaintenanceRepository(BaseRepository):
         query = (
             select(UserMaintenanceItem)
             .where(UserMaintenanceItem.id == item_id)
-            .options(joinedload(UserMaintenanceItem.maintenance_item))
+            .options(*loader_options(UserMaintenanceItem, "catalog"))
         )
         result = await self.session.execute(query)
         # scalar_one_or_none не требует unique() так как возвращает один объект
@@ -129,11 +470,120 @@ class MaintenanceRepository(BaseRepository):
 
         if db_item:
             await self.session.delete(db_item)
-            await self.session.commit()
+            await self.session.flush()
             return True
 
         return False
 
+    async def mark_serviced(
+        self,
+        user_id: int,
+        user_item_id: uuid.UUID,
+        service_date: datetime,
+        service_odometer: Optional[int],
+        comment: Optional[str],
+    ) -> Optional[ServicedItem]:
+        """
+        Записать обслуживание элемента и сдвинуть его последнее обслуживание.
+
+        В PostgreSQL это один запрос: CTE с INSERT ... RETURNING записи и
+        UPDATE ... RETURNING элемента. Пробег по умолчанию — текущий пробег
+        автомобиля. None, если элемент не найден или принадлежит другому
+        пользователю; тогда ничего не записывается
+        """
+        record_id = uuid7()
+        records = ServiceRecord.__table__
+        connection = await self.session.connection()
+        if connection.dialect.name != "postgresql":
+            return await self._mark_serviced_stepwise(
+                user_id,
+                user_item_id,
+                record_id,
+                service_date,
+                service_odometer,
+                comment,
+            )
+
+        item = _serviced_source(user_id, user_item_id).cte("item")
+        record = (
+            insert(records)
+            .from_select(
+                ["id", "user_item_id", "service_date", "service_odometer", "comment"],
+                select(
+                    literal(record_id, records.c.id.type),
+                    item.c.user_item_id,
+                    literal(service_date, records.c.service_date.type),
+                    func.coalesce(
+                        literal(service_odometer, records.c.service_odometer.type),
+                        item.c.vehicle_odometer,
+                    ),
+                    literal(comment, records.c.comment.type),
+                ),
+            )
+            .returning(
+                records.c.user_item_id,
+                records.c.service_date,
+                records.c.service_odometer,
+            )
+            .cte("record")
+        )
+        advanced = _advance_last_service(
+            record.c.user_item_id, record.c.service_date, record.c.service_odometer
+        ).cte("advanced")
+        query = select(
+            item.c.user_item_id,
+            item.c.vehicle_id,
+            item.c.vehicle_odometer,
+            item.c.name,
+            record.c.service_odometer,
+            advanced.c.id.isnot(None).label("advanced"),
+        ).select_from(item.join(record, true()).outerjoin(advanced, true()))
+        row = (await self.session.execute(query)).first()
+        if row is None:
+            return None
+        return ServicedItem(
+            id=row.user_item_id,
+            vehicle_id=row.vehicle_id,
+            vehicle_odometer=row.vehicle_odometer,
+            name=row.name,
+            record_id=record_id,
+            service_odometer=row.service_odometer,
+            advanced=row.advanced,
+        )
+
+    async def _mark_serviced_stepwise(
+        self, user_id, user_item_id, record_id, service_date, service_odometer, comment
+    ) -> Optional[ServicedItem]:
+        """Те же запросы по очереди для СУБД без DML в CTE (SQLite в тестах)"""
+        row = (
+            await self.session.execute(_serviced_source(user_id, user_item_id))
+        ).first()
+        if row is None:
+            return None
+        if service_odometer is None:
+            service_odometer = row.vehicle_odometer
+        await self.session.execute(
+            insert(ServiceRecord.__table__).values(
+                id=record_id,
+                user_item_id=row.user_item_id,
+                service_date=service_date,
+                service_odometer=service_odometer,
+                comment=comment,
+            )
+        )
+        advanced = await self.session.scalar(
+            _advance_last_service(row.user_item_id, service_date, service_odometer)
+        )
+        return ServicedItem(
+            id=row.user_item_id,
+            vehicle_id=row.vehicle_id,
+            vehicle_odometer=row.vehicle_odometer,
+            name=row.name,
+            record_id=record_id,
+            service_odometer=service_odometer,
+            advanced=advanced is not None,
+        )
+
     async def get_service_records(
         self, user_item_id: uuid.UUID
     ) -> Sequence[ServiceRecord]:
@@ -146,89 +596,77 @@ class MaintenanceRepository(BaseRepository):
         result = await self.session.execute(query)
         return result.scalars().unique().all()
 
-    async def get_maintenance_items_requiring_service(
-        self, user_id: int, vehicle_id: uuid.UUID, skip: int = 0, limit: int = 10
-    ) -> Sequence[UserMaintenanceItem]:
+    async def get_vehicle_maintenance_due_page(
+        self,
+        user_id: int,
+        vehicle_id: uuid.UUID,
+        cursor: Optional[str] = None,
+        limit: int = 10,
+        show_all: bool = False,
+        q: Optional[str] = None,
+        category: Optional[MaintenanceCategory] = None,
+    ) -> Tuple[Sequence[Row], Optional[str], int]:
         """
-        Получить элементы, требующие обслуживания для конкретного автомобиля.
-        Возвращает кортеж (список элементов, общее количество)
+        Страница элементов обслуживания автомобиля со статусом, превышением
+        и остатком пробега, вычисленными в SQL. Пагинация по ключу сортировки
+        (никогда не обслуживалось, next_due_odometer, id) вместо OFFSET.
+        Количество строк от курсора до конца списка (на первой странице —
+        всего) считается оконной функцией в том же запросе.
+        Возвращает кортеж (строки страницы, курсор следующей страницы, количество)
         """
+        query = due_query(user_id, vehicle_id, cursor, show_all, q, category)
+        query = query.add_columns(func.count().over().label("total_count"))
+        query = query.limit(limit + 1)
 
-        vehicle_query = select(Vehicle).where(
-            and_(Vehicle.id == vehicle_id, Vehicle.user_id == user_id)
-        )
-        vehicle_result = await self.session.execute(vehicle_query)
-        vehicle = vehicle_result.scalar_one_or_none()
-
-        if not vehicle:
-            return []
-
-        current_odometer = vehicle.odometer
+        rows = (await self.session.execute(query)).all()
+        total = rows[0].total_count if rows else 0
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                [last.last_service_odometer is None, last.next_due_odometer, last.id]
+            )
+        return rows, next_cursor, total
 
+    async def get_due_counts_by_vehicle(
+        self, user_id: int, vehicle_ids: Optional[Sequence[uuid.UUID]] = None
+    ) -> Dict[uuid.UUID, int]:
+        """
+        Получить количество элементов, требующих обслуживания, по всем
+        автомобилям пользователя одним запросом с группировкой.
+        Автомобили без таких элементов в результат не попадают
+        """
         query = (
-            select(UserMaintenanceItem)
+            select(UserMaintenanceItem.vehicle_id, func.count())
+            .join(Vehicle, Vehicle.id == UserMaintenanceItem.vehicle_id)
             .where(
                 and_(
                     UserMaintenanceItem.user_id == user_id,
-                    UserMaintenanceItem.vehicle_id == vehicle_id,
-                    or_(
-                        # Никогда не обслуживалось
-                        UserMaintenanceItem.last_service_odometer.is_(None),
-                        # Просрочено по пробегу
-                        and_(
-                            UserMaintenanceItem.last_service_odometer.isnot(None),
-                            current_odometer - UserMaintenanceItem.last_service_odometer
-                            > func.coalesce(
-                                UserMaintenanceItem.custom_interval,
-                                select(MaintenanceItem.default_interval)
-                                .where(
-                                    MaintenanceItem.id == UserMaintenanceItem.item_id
-                                )
-                                .scalar_subquery(),
-                            ),
-                        ),
-                        # Скоро требуется обслуживание (осталось менее 10% от интервала)
-                        and_(
-                            UserMaintenanceItem.last_service_odometer.isnot(None),
-                            current_odometer - UserMaintenanceItem.last_service_odometer
-                            > func.coalesce(
-                                UserMaintenanceItem.custom_interval,
-                                select(MaintenanceItem.default_interval)
-                                .where(
-                                    MaintenanceItem.id == UserMaintenanceItem.item_id
-                                )
-                                .scalar_subquery(),
-                            )
-                            * 0.9,
-                        ),
-                    ),
+                    Vehicle.user_id == user_id,
+                    _requires_service(),
                 )
             )
-            .options(joinedload(UserMaintenanceItem.maintenance_item))
+            .group_by(UserMaintenanceItem.vehicle_id)
         )
+        if vehicle_ids is not None:
+            query = query.where(UserMaintenanceItem.vehicle_id.in_(vehicle_ids))
 
+        result = await self.session.execute(query)
+        return {vehicle_id: count for vehicle_id, count in result.all()}
+
+    async def get_maintenance_items_requiring_service(
+        self, user_id: int, vehicle_id: uuid.UUID, skip: int = 0, limit: int = 10
+    ) -> Sequence[Row]:
+        """
+        Элементы автомобиля, требующие обслуживания, в порядке срочности.
+        Строки те же, что у get_vehicle_maintenance_due_page
+        """
         query = (
-            query.order_by(
-                # Сначала никогда не обслуживаемые
-                UserMaintenanceItem.last_service_odometer.is_(None).desc(),
-                # Затем по уровню просрочки (насколько превышен интервал)
-                (
-                    current_odometer
-                    - UserMaintenanceItem.last_service_odometer
-                    - func.coalesce(
-                        UserMaintenanceItem.custom_interval,
-                        select(MaintenanceItem.default_interval)
-                        .where(MaintenanceItem.id == UserMaintenanceItem.item_id)
-                        .scalar_subquery(),
-                    )
-                ).desc(),
-            )
+            _vehicle_due_query(user_id, vehicle_id, show_all=False)
+            .order_by(*_due_order())
             .offset(skip)
             .limit(limit)
         )
-
         result = await self.session.execute(query)
-        # Используем unique() для предотвращения дублирования записей при joinedload с коллекциями
-        items = result.scalars().unique().all()
-
-        return items
+        return result.all()
@@ -1,14 +1,33 @@
 import uuid
-from typing import Annotated, Sequence
+from typing import Annotated, Optional, Sequence, Tuple
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import Select, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
 from carmain.core.database import get_async_session
 from carmain.core.exceptions import NotFoundError
 from carmain.models.records import ServiceRecord
 from carmain.repository.base_repository import BaseRepository
+from carmain.utils.pagination import (
+    as_datetime,
+    as_uuid,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def history_query(item_id: uuid.UUID, cursor: Optional[str] = None) -> Select:
+    """
+    История элемента от новых записей к старым после курсора (service_date, id).
+    Некорректный курсор — ValidationError сразу, до выполнения запроса
+    """
+    query = select(ServiceRecord).where(ServiceRecord.user_item_id == item_id)
+    after = decode_cursor(cursor, [as_datetime, as_uuid])
+    if after:
+        query = query.where(
+            tuple_(ServiceRecord.service_date, ServiceRecord.id) < tuple_(*after)
+        )
+    return query.order_by(ServiceRecord.service_date.desc(), ServiceRecord.id.desc())
 
 
 class ServiceRecordRepository(BaseRepository):
@@ -17,13 +36,29 @@ class ServiceRecordRepository(BaseRepository):
         super().__init__(ServiceRecord, session)
 
     async def get_by_user_item_id(
-        self, item_id: uuid.UUID, skip=0, limit=10, eager=False
+        self, item_id: uuid.UUID, skip=0, limit=10, profile: Optional[str] = None
     ) -> Sequence[ServiceRecord]:
         query = select(self.model).where(ServiceRecord.user_item_id == item_id)
-        if eager:
-            for eager in getattr(self.model, "eagers", []):
-                query = query.options(joinedload(getattr(self.model, eager)))
+        query = self.with_profile(query, profile)
         result = await self.session.scalars(query)
         if not result:
             raise NotFoundError(detail=f"not found for user_item_id: {item_id}")
         return result.unique().all()
+
+    async def get_page_by_user_item_id(
+        self, item_id: uuid.UUID, cursor: Optional[str] = None, limit=20
+    ) -> Tuple[Sequence[ServiceRecord], Optional[str]]:
+        """
+        Страница истории обслуживания от новых записей к старым.
+        Пагинация по ключу (service_date, id): глубокие страницы стоят
+        столько же, сколько первая. Возвращает (записи, курсор следующей страницы)
+        """
+        query = history_query(item_id, cursor).limit(limit + 1)
+        records = (await self.session.scalars(query)).all()
+
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            next_cursor = encode_cursor([last.service_date.isoformat(), last.id])
+        return records, next_cursor
@@ -1,13 +1,22 @@
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, Optional, Tuple
 
 from fastapi import Depends
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from carmain.core.database import get_async_session
+from carmain.models.auth import AccessToken
 from carmain.models.users import User
 from carmain.repository.base_repository import BaseRepository
 from carmain.schemas.auth_schema import SignIn
+from carmain.schemas.user_schema import UserPrincipal
+
+
+def _principal_query():
+    return select(
+        User.id, User.email, User.is_active, User.is_superuser, User.is_verified
+    )
 
 
 class UserRepository(BaseRepository):
@@ -22,3 +31,36 @@ class UserRepository(BaseRepository):
             select(User).where(User.email == user_info.email)  # type: ignore
         )
         return obj
+
+    async def get_principal(self, user_id: int) -> Optional[UserPrincipal]:
+        """Проекция пользователя для аутентификации по id"""
+        row = (
+            await self.session.execute(_principal_query().where(User.id == user_id))
+        ).first()
+        return UserPrincipal.model_validate(row) if row else None
+
+    async def get_principal_by_token(
+        self, token: str, max_age: Optional[datetime] = None
+    ) -> Optional[UserPrincipal]:
+        """Проекция владельца токена сессии одним запросом с JOIN"""
+        session = await self.get_session_principal(token, max_age)
+        return session[0] if session else None
+
+    async def get_session_principal(
+        self, token: str, max_age: Optional[datetime] = None
+    ) -> Optional[Tuple[UserPrincipal, datetime]]:
+        """Проекция владельца токена и время выдачи токена"""
+        query = (
+            _principal_query()
+            .add_columns(AccessToken.created_at)
+            .join(AccessToken, AccessToken.user_id == User.id)
+            .where(AccessToken.token == token)
+        )
+        if max_age is not None:
+            query = query.where(AccessToken.created_at >= max_age)
+        # Токен только что выданный при входе может ещё не дойти до реплики
+        query = query.execution_options(primary=True)
+        row = (await self.session.execute(query)).first()
+        if row is None:
+            return None
+        return UserPrincipal.model_validate(row), row.created_at
@@ -18,7 +18,12 @@ class VehicleRepository(BaseRepository[uuid.UUID, Vehicle]):
         super().__init__(Vehicle, session)
 
     async def get_by_user_id(self, user_id: int) -> list[Vehicle]:
-        query = select(self.model).where(self.model.user_id == user_id)
+        # id — uuid7: автомобили в порядке добавления
+        query = (
+            select(self.model)
+            .where(self.model.user_id == user_id)
+            .order_by(self.model.id)
+        )
         result = await self.session.scalars(query)
         return result.all()
         
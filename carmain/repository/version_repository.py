@@ -0,0 +1,69 @@
+import uuid
+from typing import Annotated, Dict
+
+from fastapi import Depends
+from sqlalchemy import literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from carmain.core.database import get_async_session
+from carmain.models.items import CatalogVersion
+from carmain.models.versions import DataVersion
+from carmain.repository.base_repository import BaseRepository
+
+CATALOG_SCOPE = "catalog"
+
+
+def user_scope(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def vehicle_scope(vehicle_id: uuid.UUID) -> str:
+    return f"vehicle:{vehicle_id}"
+
+
+class DataVersionRepository(BaseRepository):
+    """
+    Версии данных по областям: пользователь (гараж, счётчики работ, история)
+    и автомобиль (его работы и справочник с отметками). Фрагменты строят из
+    них ETag и отвечают 304, не читая самих данных
+    """
+
+    def __init__(self, session: Annotated[AsyncSession, Depends(get_async_session)]):
+        super().__init__(DataVersion, session)
+
+    async def get_versions(self, *scopes: str, catalog: bool = False) -> Dict[str, int]:
+        """Версии областей одним запросом; версия справочника — по catalog"""
+        query = select(DataVersion.scope, DataVersion.version).where(
+            DataVersion.scope.in_(scopes)
+        )
+        if catalog:
+            # UNION обёрнут в обычный SELECT: RoutingSession узнаёт чтение
+            # только по Select, а составной запрос увёл бы запрос на основную БД
+            query = select(
+                query.union_all(
+                    select(literal(CATALOG_SCOPE), CatalogVersion.version)
+                ).subquery()
+            )
+        found = dict((await self.session.execute(query)).tuples().all())
+        versions = {scope: found.get(scope, 0) for scope in scopes}
+        if catalog:
+            versions[CATALOG_SCOPE] = found.get(CATALOG_SCOPE, 0)
+        return versions
+
+    async def bump(self, *scopes: str) -> None:
+        """
+        Увеличить версии областей в транзакции записи (INSERT ... ON CONFLICT).
+        Области блокируются в одном порядке, чтобы параллельные записи одного
+        пользователя не ждали друг друга по кругу
+        """
+        connection = await self.session.connection()
+        dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+        table = DataVersion.__table__
+        statement = dialect.insert(table).values(
+            [{"scope": scope, "version": 1} for scope in sorted(set(scopes))]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.scope], set_={"version": table.c.version + 1}
+        )
+        await self.session.execute(statement)
@@ -1,4 +1,5 @@
 from fastapi_users import FastAPIUsers
+from fastapi_users.authentication import Authenticator
 
 from carmain.core import backend
 from carmain.models.users import User
@@ -20,6 +21,15 @@ current_superuser = fastapi_users.current_user(
 )
 optional_user = fastapi_users.current_user(optional=True)
 
+# Зависимости для HTML-представлений: UserPrincipal вместо модели User
+principal_authenticator = Authenticator(
+    backend.get_principal_backends(), backend.get_user_manager
+)
+current_active_verified_principal = principal_authenticator.current_user(
+    active=True, verified=True
+)
+optional_principal = principal_authenticator.current_user(optional=True)
+
 
 auth_router = fastapi_users.get_auth_router(backend.cookie_backend)
 register_router = fastapi_users.get_register_router(
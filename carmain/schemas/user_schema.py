@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 
 from fastapi_users import schemas
 
@@ -19,6 +19,21 @@ class UserUpdate(schemas.BaseUserUpdate):
     pass
 
 
+class UserPrincipal(BaseModel):
+    """
+    Аутентифицированный пользователь в запросе: только поля, нужные для
+    проверок доступа. Связи пользователя загружаются там, где они нужны
+    """
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    id: int
+    email: str
+    is_active: bool
+    is_superuser: bool
+    is_verified: bool
+
+
 class SignUpFormData(BaseModel):
     email: EmailStr
     password: str
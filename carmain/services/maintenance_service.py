@@ -1,33 +1,52 @@
-import sys
 import uuid
-from datetime import date, datetime
-from typing import List, Optional, Dict, Any, Tuple, Annotated, Sequence, Coroutine
+from datetime import datetime, time
+from typing import (
+    List,
+    Optional,
+    Dict,
+    Any,
+    Tuple,
+    Annotated,
+    AsyncIterator,
+    Sequence,
+)
 
 from fastapi import Depends, HTTPException
 from pydantic import BaseModel
-from sqlalchemy.exc import SQLAlchemyError
 
+from carmain.core.database import replicas, session_manager
 from carmain.models.items import MaintenanceItem, UserMaintenanceItem
 from carmain.models.records import ServiceRecord
 from carmain.models.vehicles import Vehicle
-from carmain.models.users import User
+from carmain.schemas.user_schema import UserPrincipal
 from carmain.repository.maintenance_repository import (
+    DirectoryItem,
     MaintenanceRepository,
+    ServicedItem,
     UserMaintenanceRepository,
+    due_query,
+)
+from carmain.repository.catalog_cache import CatalogItem
+from carmain.repository.record_repository import (
+    ServiceRecordRepository,
+    history_query,
 )
-from carmain.repository.record_repository import ServiceRecordRepository
 from carmain.repository.vehicle_repository import VehicleRepository
+from carmain.repository.version_repository import (
+    DataVersionRepository,
+    user_scope,
+    vehicle_scope,
+)
 from carmain.schemas.maintenance_schema import (
+    MaintenanceCategory,
     MaintenanceItemStatus,
     MaintenanceItemType,
     MaintenanceItemDisplay,
     ServiceRecordCreate,
-    UserMaintenanceItemUpdate,
     ServiceRecordUpdate,
 )
 from carmain.services.base_service import BaseService
-from carmain.routers.v1.auth_router import current_active_verified_user
-from carmain.utils.maintenance_utils import get_maintenance_item_type
+from carmain.routers.v1.auth_router import current_active_verified_principal
 
 
 class MaintenanceService(BaseService):
@@ -39,23 +58,47 @@ class MaintenanceService(BaseService):
         user_maintenance_repo: Annotated[UserMaintenanceRepository, Depends()],
         vehicle_repo: Annotated[VehicleRepository, Depends()],
         record_repo: Annotated[ServiceRecordRepository, Depends()],
-        user: Annotated[User, Depends(current_active_verified_user)],
+        version_repo: Annotated[DataVersionRepository, Depends()],
+        user: Annotated[UserPrincipal, Depends(current_active_verified_principal)],
     ):
         self.maintenance_repository = maintenance_repo
         self.user_maintenance_repository = user_maintenance_repo
         self.vehicle_repository = vehicle_repo
         self.record_repository = record_repo
+        self.version_repository = version_repo
         self.user = user
 
+    async def data_versions(
+        self, vehicle_id: Optional[uuid.UUID] = None
+    ) -> Dict[str, int]:
+        """
+        Версии данных для ETag фрагмента: автомобиля или, без vehicle_id,
+        всего пользователя. Справочник входит всегда: от него зависят
+        названия работ и пороговые пробеги
+        """
+        scope = vehicle_scope(vehicle_id) if vehicle_id else user_scope(self.user.id)
+        return await self.version_repository.get_versions(scope, catalog=True)
+
+    async def _data_changed(self, vehicle_id: Optional[uuid.UUID] = None) -> None:
+        """Запись меняет данные пользователя и, если указан, автомобиля"""
+        scopes = [user_scope(self.user.id)]
+        if vehicle_id is not None:
+            scopes.append(vehicle_scope(vehicle_id))
+        await self.version_repository.bump(*scopes)
+
     async def get_maintenance_items(
-        self, skip: int = 0, limit: int = 10
-    ) -> Sequence[MaintenanceItem]:
-        """Получить список всех типов обслуживания"""
-        return await self.maintenance_repository.get_maintenance_items(skip, limit)
+        self,
+        skip: int = 0,
+        limit: int = 10,
+        q: Optional[str] = None,
+        category: Optional[MaintenanceCategory] = None,
+    ) -> Sequence[CatalogItem]:
+        """Получить список типов обслуживания с поиском и фильтром по категории"""
+        return await self.maintenance_repository.get_maintenance_items(
+            skip, limit, q, category
+        )
 
-    async def get_maintenance_item(
-        self, item_id: uuid.UUID
-    ) -> Optional[MaintenanceItem]:
+    async def get_maintenance_item(self, item_id: uuid.UUID) -> Optional[CatalogItem]:
         """Получить информацию о типе обслуживания по ID"""
         return await self.maintenance_repository.get_maintenance_item(item_id)
 
@@ -74,24 +117,30 @@ class MaintenanceService(BaseService):
         """Получить автомобиль по ID"""
         return await self.vehicle_repository.get_vehicle(vehicle_id)
 
-    async def get_user_maintenance_items(
-        self, vehicle_id: Optional[uuid.UUID] = None, skip: int = 0, limit: int = 10
-    ) -> Sequence[UserMaintenanceItem]:
-        """Получить список элементов обслуживания пользователя"""
-        return await self.user_maintenance_repository.get_by_vehicle(
-            vehicle_id, skip, limit, eager=True
+    async def get_directory(
+        self,
+        vehicle_id: uuid.UUID,
+        q: Optional[str] = None,
+        category: Optional[MaintenanceCategory] = None,
+        tracked_only: bool = False,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> List[DirectoryItem]:
+        """Справочник работ с отметкой отслеживаемых для автомобиля"""
+        return await self.maintenance_repository.get_directory(
+            vehicle_id, q, category, tracked_only, skip, limit
         )
 
     async def get_user_maintenance_item(
         self, item_id: uuid.UUID
     ) -> Optional[UserMaintenanceItem]:
         """Получить элемент обслуживания пользователя по ID"""
-        return await self.user_maintenance_repository.get_by_id(item_id, eager=True)
+        return await self.user_maintenance_repository.get_by_id(item_id, profile="card")
 
     async def get_user_maintenance_item_by_item_id(self, item_id: uuid.UUID):
         """Получить элемент обслуживания пользователя по Maintenance ID"""
         return await self.user_maintenance_repository.get_by_item_id(
-            item_id, eager=True
+            item_id, profile="card"
         )
 
     async def create_user_maintenance_item(
@@ -99,7 +148,9 @@ class MaintenanceService(BaseService):
     ) -> UserMaintenanceItem:
         """Создать элемент обслуживания для пользователя"""
         db_item = UserMaintenanceItem(user_id=self.user.id, **item_data)
-        return await self.user_maintenance_repository.create(db_item)
+        created = await self.user_maintenance_repository.create(db_item)
+        await self._data_changed(created.vehicle_id)
+        return created
 
     async def update_user_maintenance_item(
         self, item_id: uuid.UUID, schema: BaseModel
@@ -108,14 +159,19 @@ class MaintenanceService(BaseService):
         update_data: dict[str, Any] = schema.model_dump(
             exclude_unset=True, exclude_defaults=True, exclude_none=True
         )
-        return await self.user_maintenance_repository.update_by_id(item_id, update_data)
+        updated = await self.user_maintenance_repository.update_by_id(
+            item_id, update_data
+        )
+        await self._data_changed(updated.vehicle_id)
+        return updated
 
-    async def delete_user_maintenance_item(self, item_id: uuid.UUID) -> bool:
-        """Удалить элемент обслуживания пользователя"""
-        try:
-            return await self.user_maintenance_repository.delete_by_id(item_id)
-        except SQLAlchemyError:
-            return False
+    async def delete_user_maintenance_item(self, item_id: uuid.UUID) -> None:
+        """
+        Удалить элемент обслуживания пользователя. Ошибка БД не глотается:
+        сессия после неё непригодна, и единица работы откатывает запрос целиком
+        """
+        deleted = await self.user_maintenance_repository.delete_by_id(item_id)
+        await self._data_changed(deleted.vehicle_id)
 
     async def get_service_records(
         self, user_item_id: uuid.UUID
@@ -123,200 +179,146 @@ class MaintenanceService(BaseService):
         """Получить историю обслуживания для конкретного элемента"""
         return await self.record_repository.get_by_user_item_id(user_item_id)
 
+    async def get_service_records_page(
+        self, user_item_id: uuid.UUID, cursor: Optional[str] = None, limit: int = 20
+    ) -> Tuple[Sequence[ServiceRecord], Optional[str]]:
+        """Получить страницу истории обслуживания и курсор следующей страницы"""
+        return await self.record_repository.get_page_by_user_item_id(
+            user_item_id, cursor, limit
+        )
+
+    def stream_service_records(
+        self, user_item_id: uuid.UUID, cursor: Optional[str] = None
+    ) -> AsyncIterator[ServiceRecord]:
+        """
+        Вся история обслуживания после курсора для потокового ответа.
+        Курсор проверяется сразу, записи читаются при обходе
+        """
+        query = history_query(user_item_id, cursor)
+        return self._stream(ServiceRecordRepository, query, scalars=True)
+
     async def create_service_record(self, record: ServiceRecordCreate) -> ServiceRecord:
         """Создать запись об обслуживании"""
         record_data = record.model_dump(exclude_unset=True)
         db_item = ServiceRecord(**record_data)
-        return await self.record_repository.create(db_item)
+        created = await self.record_repository.create(db_item)
+        # Запись не сдвигает последнее обслуживание элемента: меняется только
+        # история, а она версионируется по пользователю
+        await self._data_changed()
+        return created
 
     async def mark_item_as_serviced(
         self,
         service_record_create: ServiceRecordCreate,
-    ) -> Optional[UserMaintenanceItem]:
+    ) -> ServicedItem:
         """Отметить элемент как обслуженный"""
-
-        item: UserMaintenanceItem = await self.user_maintenance_repository.get_by_id(
-            service_record_create.user_item_id, eager=True
+        service_date = service_record_create.service_date
+        comment = service_record_create.comment
+        if comment is None or comment.strip() == "":
+            comment = f"Обслуживание выполнено {service_date.strftime('%d.%m.%Y')}"
+
+        # Пробег 0 или пустой — берётся текущий пробег автомобиля
+        serviced = await self.maintenance_repository.mark_serviced(
+            user_id=self.user.id,
+            user_item_id=service_record_create.user_item_id,
+            service_date=datetime.combine(service_date, time.min),
+            service_odometer=service_record_create.service_odometer or None,
+            comment=comment,
         )
-        if not item or item.user_id != self.user.id:
+        if serviced is None:
             raise HTTPException(
                 status_code=404, detail="Элемент обслуживания не найден"
             )
-
-        if service_record_create.service_odometer is None or service_record_create.service_odometer == 0:
-            if item.vehicle:
-                service_record_create.service_odometer = item.vehicle.odometer
-
-        if (
-            service_record_create.comment is None
-            or service_record_create.comment.strip() == ""
-        ):
-            service_record_create.comment = f"Обслуживание выполнено {service_record_create.service_date.strftime('%d.%m.%Y')}"
-
-        record_data = service_record_create.model_dump(
-            exclude_unset=True, exclude_defaults=True, exclude_none=True
-        )
-
-        # if photo_path:
-        #     record_data["photo_path"] = photo_path
-        db_record = ServiceRecord(**record_data)
-        await self.record_repository.create(db_record)
-
-        user_maintenance_item_update = UserMaintenanceItemUpdate(
-            user_item_id=item.id,
-            last_service_odometer=service_record_create.service_odometer,
-            last_service_date=service_record_create.service_date,
-        )
-        maintenance_item_payload = user_maintenance_item_update.model_dump(
-            exclude_unset=True, exclude_defaults=True, exclude_none=True
-        )
-        db_item: UserMaintenanceItem = (
-            await self.user_maintenance_repository.update_by_id(
-                item.id, maintenance_item_payload
-            )
-        )
-
-        updated_item = await self.user_maintenance_repository.get_by_id(
-            item.id, eager=True
-        )
-        return updated_item
+        await self._data_changed(serviced.vehicle_id)
+        return serviced
 
     async def get_items_requiring_service_count(self, vehicle_id: uuid.UUID) -> int:
-        items = (
-            await self.maintenance_repository.get_maintenance_items_requiring_service(
-                self.user.id, vehicle_id, 0, sys.maxsize
-            )
+        counts = await self.get_items_requiring_service_counts([vehicle_id])
+        return counts.get(vehicle_id, 0)
+
+    async def get_items_requiring_service_counts(
+        self, vehicle_ids: Optional[Sequence[uuid.UUID]] = None
+    ) -> Dict[uuid.UUID, int]:
+        """Получить количество элементов, требующих обслуживания, по автомобилям"""
+        return await self.maintenance_repository.get_due_counts_by_vehicle(
+            self.user.id, vehicle_ids
         )
-        return len(items)
 
-    async def get_items_requiring_service(
+    async def get_items_requiring_service_page(
         self,
         vehicle_id: uuid.UUID,
-        page: int = 1,
+        cursor: Optional[str] = None,
         page_size: int = 10,
         show_all: bool = False,
-    ) -> Tuple[List[MaintenanceItemDisplay], Dict[str, int]]:
+        q: Optional[str] = None,
+        category: Optional[MaintenanceCategory] = None,
+    ) -> Tuple[List[MaintenanceItemDisplay], Optional[str], int]:
         """
-        Получить элементы, требующие обслуживания для конкретного автомобиля.
-        Возвращает список элементов в формате отображения и информацию о пагинации.
-
-        Args:
-            vehicle_id: ID автомобиля
-            page: Номер страницы (по умолчанию 1)
-            page_size: Размер страницы (по умолчанию 10)
-            show_all: Показать все элементы, включая не требующие обслуживания (по умолчанию False)
+        Получить следующую порцию элементов после курсора (для подгрузки "Показать ещё").
+        Возвращает список элементов в формате отображения, курсор следующей порции
+        и число элементов, оставшихся после неё.
         """
-
-        vehicle = await self.vehicle_repository.get_vehicle(vehicle_id)
-        if not vehicle:
-            return [], {
-                "current_page": page,
-                "total_pages": 0,
-                "items_per_page": page_size,
-                "total_items": 0,
-            }
-
-        current_odometer = vehicle.odometer
-
-        if not show_all:
-            all_items = await self.maintenance_repository.get_maintenance_items_requiring_service(
-                self.user.id, vehicle_id, 0, sys.maxsize
+        rows, next_cursor, total = (
+            await self.maintenance_repository.get_vehicle_maintenance_due_page(
+                self.user.id, vehicle_id, cursor, page_size, show_all, q, category
             )
-        else:
-            all_items = await self.maintenance_repository.get_user_maintenance_items(
-                self.user.id, vehicle_id, 0, sys.maxsize
-            )
-
-        filtered_items = []
-        for item in all_items:
-            interval = item.custom_interval or item.maintenance_item.default_interval
-            status = MaintenanceItemStatus.OK
-
-            if item.last_service_odometer is None:
-                status = MaintenanceItemStatus.NEVER_SERVICED
-            else:
-                km_since_last_service = current_odometer - item.last_service_odometer
-                if km_since_last_service > interval:
-                    status = MaintenanceItemStatus.OVERDUE
-                elif km_since_last_service > interval * 0.9:
-                    status = MaintenanceItemStatus.UPCOMING
-                else:
-                    if not show_all:
-                        continue
-            filtered_items.append(item)
-
-        total_count = len(filtered_items)
-
-        skip = (page - 1) * page_size
-        limit = page_size
-        paginated_items = filtered_items[skip : skip + limit]
-
-        display_items = []
-        for item in paginated_items:
-
-            interval = item.custom_interval or item.maintenance_item.default_interval
+        )
+        return [self._display_item(row) for row in rows], next_cursor, total - len(rows)
 
-            status = MaintenanceItemStatus.OK
+    def stream_items_requiring_service(
+        self,
+        vehicle_id: uuid.UUID,
+        cursor: Optional[str] = None,
+        show_all: bool = False,
+        q: Optional[str] = None,
+        category: Optional[MaintenanceCategory] = None,
+    ) -> AsyncIterator[MaintenanceItemDisplay]:
+        """
+        Все элементы после курсора для потокового ответа, в порядке
+        get_items_requiring_service_page. Курсор проверяется сразу
+        """
+        query = due_query(self.user.id, vehicle_id, cursor, show_all, q, category)
+        rows = self._stream(MaintenanceRepository, query)
+        return (self._display_item(row) async for row in rows)
 
-            if item.last_service_odometer is None:
-                status = MaintenanceItemStatus.NEVER_SERVICED
-                overdue_km = None
-                remaining_km = None
+    @staticmethod
+    async def _stream(repository_class, query, scalars: bool = False) -> AsyncIterator:
+        """
+        Строки запроса из отдельной сессии: тело потокового ответа читается
+        после того, как сессия запроса закрыта
+        """
+        replica = replicas.choose()
+        async with session_manager.stream_session(replica) as session:
+            repository = repository_class(session)
+            if scalars:
+                rows = repository.stream_scalars(query)
             else:
-                km_since_last_service = current_odometer - item.last_service_odometer
-
-                if km_since_last_service > interval:
-                    status = MaintenanceItemStatus.OVERDUE
-                    overdue_km = km_since_last_service - interval
-                    remaining_km = None
-                elif km_since_last_service > interval * 0.9:
-                    status = MaintenanceItemStatus.UPCOMING
-                    overdue_km = None
-                    remaining_km = interval - km_since_last_service
-                else:
-                    # Элемент не требует обслуживания в ближайшее время
-                    if not show_all:
-                        continue
-                    overdue_km = None
-                    remaining_km = interval - km_since_last_service
-
-            item_type = get_maintenance_item_type(item.maintenance_item.name)
-
-            last_service_date = None
-            if item.last_service_date:
-                if isinstance(item.last_service_date, datetime):
-                    last_service_date = item.last_service_date.date()
-                else:
-                    last_service_date = item.last_service_date
-
-            display_item = MaintenanceItemDisplay(
-                id=item.id,
-                name=item.maintenance_item.name,
-                type=item_type,
-                status=status,
-                last_service_date=last_service_date,
-                last_service_odometer=item.last_service_odometer,
-                overdue_km=overdue_km,
-                remaining_km=remaining_km,
-                custom_interval=item.custom_interval,
-                default_interval=item.maintenance_item.default_interval,
-            )
-
-            display_items.append(display_item)
-
-        total_pages = (total_count + page_size - 1) // page_size
-        pagination = {
-            "current_page": page,
-            "total_pages": total_pages,
-            "items_per_page": page_size,
-            "total_items": total_count,
-        }
-
-        return display_items, pagination
+                rows = repository.stream(query)
+            async for row in rows:
+                yield row
+
+    @staticmethod
+    def _display_item(row) -> MaintenanceItemDisplay:
+        last_service_date = row.last_service_date
+        if isinstance(last_service_date, datetime):
+            last_service_date = last_service_date.date()
+
+        return MaintenanceItemDisplay(
+            id=row.id,
+            name=row.name,
+            type=MaintenanceItemType(row.type),
+            status=MaintenanceItemStatus(row.status),
+            last_service_date=last_service_date,
+            last_service_odometer=row.last_service_odometer,
+            overdue_km=row.overdue_km,
+            remaining_km=row.remaining_km,
+            custom_interval=row.custom_interval,
+            default_interval=row.default_interval,
+        )
 
     async def update_service_record(
         self,
-        record_id: int,
+        record_id: uuid.UUID,
         service_record_update: ServiceRecordUpdate,
     ) -> ServiceRecord:
         """Обновить запись об обслуживании"""
@@ -333,4 +335,5 @@ class MaintenanceService(BaseService):
         )
         update_data.pop("user_item_id", None)
         updated = await self.record_repository.update_by_id(record_id, update_data)
+        await self._data_changed(user_item.vehicle_id)
         return updated
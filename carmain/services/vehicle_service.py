@@ -3,10 +3,15 @@ from typing import Annotated, Any
 from collections.abc import Sequence
 from fastapi import Depends
 
-from carmain.models.users import User
+from carmain.schemas.user_schema import UserPrincipal
 from carmain.models.vehicles import Vehicle
 from carmain.repository.vehicle_repository import VehicleRepository
-from carmain.routers.v1.auth_router import current_active_verified_user
+from carmain.repository.version_repository import (
+    DataVersionRepository,
+    user_scope,
+    vehicle_scope,
+)
+from carmain.routers.v1.auth_router import current_active_verified_principal
 from carmain.schemas.vehicle_schema import VehicleSchema
 from carmain.services.base_service import BaseService
 
@@ -15,9 +20,11 @@ class VehicleService(BaseService[uuid.UUID, VehicleSchema, Vehicle]):
     def __init__(
         self,
         repository: Annotated[VehicleRepository, Depends(VehicleRepository)],
-        user: User = Depends(current_active_verified_user),
+        version_repository: Annotated[DataVersionRepository, Depends()],
+        user: UserPrincipal = Depends(current_active_verified_principal),
     ):
         self.repository = repository
+        self.version_repository = version_repository
         self.user = user
 
     async def get_by_id(self, obj_id: uuid.UUID) -> Vehicle:
@@ -26,16 +33,26 @@ class VehicleService(BaseService[uuid.UUID, VehicleSchema, Vehicle]):
     async def add(self, schema: VehicleSchema) -> Vehicle:
         vehicle = Vehicle(**schema.model_dump())
         vehicle.user_id = self.user.id
-        return await self.repository.create(vehicle)
+        created = await self.repository.create(vehicle)
+        await self.version_repository.bump(user_scope(self.user.id))
+        return created
 
     async def patch(self, obj_id: uuid.UUID, schema: VehicleSchema) -> Vehicle:
         update_data: dict[str, Any] = schema.model_dump(
             exclude_unset=True, exclude_defaults=True, exclude_none=True
         )
-        return await self.repository.update_by_id(obj_id, update_data)
+        updated = await self.repository.update_by_id(obj_id, update_data)
+        await self.version_repository.bump(
+            user_scope(self.user.id), vehicle_scope(obj_id)
+        )
+        return updated
 
     async def remove_by_id(self, obj_id: uuid.UUID) -> Vehicle:
-        return await self.repository.delete_by_id(obj_id)
+        deleted = await self.repository.delete_by_id(obj_id)
+        await self.version_repository.bump(
+            user_scope(self.user.id), vehicle_scope(obj_id)
+        )
+        return deleted
 
     async def all(self) -> Sequence[Vehicle]:
         return await self.repository.all()
@@ -0,0 +1,58 @@
+"""
+UUIDv7 (RFC 9562): 48 бит времени в миллисекундах, затем счётчик и
+случайные биты. Ключи растут вместе со временем вставки, поэтому новые
+строки попадают в правый край btree-индекса первичного ключа, а не в
+случайные страницы, как uuid4. Сортировка по id совпадает с порядком
+добавления строк (для строк, созданных до перехода на uuid7, — нет).
+"""
+
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+_VERSION = 0x7 << 76
+_VARIANT = 0b10 << 62
+_COUNTER_MAX = 0xFFF
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Новый UUIDv7. В пределах процесса значения строго возрастают: 12 бит
+    после времени — счётчик внутри миллисекунды (RFC 9562, метод 1), при
+    его переполнении или переводе часов назад время берётся на 1 мс вперёд
+    """
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # Старший бит счётчика нулевой: запас до переполнения
+            _counter = int.from_bytes(os.urandom(2)) & 0x7FF
+        else:
+            _counter += 1
+            if _counter > _COUNTER_MAX:
+                _last_ms += 1
+                _counter = 0
+        timestamp, counter = _last_ms, _counter
+
+    random_bits = int.from_bytes(os.urandom(8)) >> 2
+    return uuid.UUID(
+        int=(timestamp << 80) | _VERSION | (counter << 64) | _VARIANT | random_bits
+    )
+
+
+def uuid7_floor(moment: datetime) -> uuid.UUID:
+    """Наименьший UUIDv7 момента: id >= uuid7_floor(t) — строки не старше t"""
+    timestamp = int(moment.timestamp() * 1000)
+    return uuid.UUID(int=(timestamp << 80) | _VERSION | _VARIANT)
+
+
+def uuid7_datetime(value: uuid.UUID) -> datetime:
+    """Время создания, записанное в UUIDv7"""
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
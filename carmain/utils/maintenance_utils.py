@@ -1,83 +1,123 @@
-from typing import List, Optional, Union
-from carmain.schemas.maintenance_schema import MaintenanceCategory, MaintenanceItemDisplay, MaintenanceItemType
-from carmain.models.items import MaintenanceItem
+"""
+Классификация работ по названию: тип, иконка и категория.
 
+Правила описаны данными: для каждого признака — список (значение, условие),
+где условие — группы ключевых слов; правило срабатывает, если в названии есть
+хотя бы одно слово из каждой группы. Порядок важен: признак получает значение
+первого сработавшего правила, поэтому "Масляный фильтр" относится к фильтрам,
+а не к двигателю.
 
-def filter_maintenance_items_by_search(
-    items: List[Union[MaintenanceItemDisplay, MaintenanceItem]], 
-    search_query: Optional[str]
-) -> List[Union[MaintenanceItemDisplay, MaintenanceItem]]:
-    """Фильтрация элементов обслуживания по поисковому запросу"""
-    if not search_query:
-        return items
-    
-    query_lower = search_query.lower()
-    return [item for item in items if query_lower in item.name.lower()]
+Все ключевые слова собраны в одно регулярное выражение, и название
+просматривается один раз. Результат кэшируется по названию, а в БД хранится
+в колонках maintenance_item (см. события модели), так что списки работ
+классификатор не вызывают.
+"""
 
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Generic, Optional, Tuple, TypeVar
 
-def filter_maintenance_items_by_category(
-    items: List[Union[MaintenanceItemDisplay, MaintenanceItem]], 
+from carmain.schemas.maintenance_schema import MaintenanceCategory, MaintenanceItemType
+
+V = TypeVar("V")
+
+# Группы ключевых слов: все группы должны совпасть, внутри группы — любое слово
+Condition = Tuple[Tuple[str, ...], ...]
+
+
+@dataclass(frozen=True)
+class Rules(Generic[V]):
+    rules: Tuple[Tuple[V, Condition], ...]
+    default: V
+
+    def resolve(self, found: frozenset) -> V:
+        for value, condition in self.rules:
+            if all(not found.isdisjoint(group) for group in condition):
+                return value
+        return self.default
+
+
+TYPE_RULES: Rules[MaintenanceItemType] = Rules(
+    (
+        (MaintenanceItemType.OIL_CHANGE, (("масл",),)),
+        (MaintenanceItemType.BRAKE_PADS, (("тормоз", "колод"),)),
+        (MaintenanceItemType.TIMING_BELT, (("ремен", "грм"),)),
+        (MaintenanceItemType.AIR_FILTER, (("фильтр",), ("воздух", "воздуш"))),
+        (MaintenanceItemType.BATTERY, (("аккумулятор", "батар"),)),
+    ),
+    MaintenanceItemType.OTHER,
+)
+
+ICON_RULES: Rules[str] = Rules(
+    (
+        ("oil-can", (("масл", "oil"),)),
+        ("exclamation-circle", (("тормоз", "brake"),)),
+        ("cogs", (("ремень", "грм"),)),
+        ("filter", (("фильтр", "filter"),)),
+        ("car-battery", (("аккум", "battery"),)),
+    ),
+    "wrench",
+)
+
+CATEGORY_RULES: Rules[Optional[MaintenanceCategory]] = Rules(
+    (
+        (MaintenanceCategory.FILTERS, (("фильтр",),)),
+        (MaintenanceCategory.BRAKES, (("тормоз", "колод"),)),
+        (MaintenanceCategory.BATTERY, (("аккум", "батар"),)),
+        (MaintenanceCategory.ENGINE, (("масл", "двигател"),)),
+    ),
+    None,
+)
+
+
+@dataclass(frozen=True)
+class Classification:
+    type: MaintenanceItemType
+    icon: str
     category: Optional[MaintenanceCategory]
-) -> List[Union[MaintenanceItemDisplay, MaintenanceItem]]:
-    """Фильтрация элементов обслуживания по категории"""
-    if not category or category == MaintenanceCategory.ALL:
-        return items
-    
-    filtered_items = []
-    for item in items:
-        if _item_matches_category(item.name, category):
-            filtered_items.append(item)
-    
-    return filtered_items
-
-
-def _item_matches_category(item_name: str, category: MaintenanceCategory) -> bool:
-    """Проверяет, соответствует ли элемент указанной категории"""
-    name_lower = item_name.lower()
-    
-    if category == MaintenanceCategory.ENGINE:
-        return "масл" in name_lower or "двигател" in name_lower
-    elif category == MaintenanceCategory.BRAKES:
-        return "тормоз" in name_lower or "колод" in name_lower
-    elif category == MaintenanceCategory.FILTERS:
-        return "фильтр" in name_lower
-    elif category == MaintenanceCategory.BATTERY:
-        return "аккум" in name_lower or "батар" in name_lower
-    
-    return False
-
-
-def get_maintenance_item_icon(item_name: str) -> str:
-    """Возвращает иконку для элемента обслуживания на основе названия"""
-    name_lower = item_name.lower()
-    
-    if "масл" in name_lower or "oil" in name_lower:
-        return "oil-can"
-    elif "тормоз" in name_lower or "brake" in name_lower:
-        return "exclamation-circle"
-    elif "ремень" in name_lower or "грм" in name_lower:
-        return "cogs"
-    elif "фильтр" in name_lower or "filter" in name_lower:
-        return "filter"
-    elif "аккум" in name_lower or "battery" in name_lower:
-        return "car-battery"
-    else:
-        return "wrench"
-
-
-def get_maintenance_item_type(item_name: str) -> MaintenanceItemType:
-    """Возвращает тип элемента обслуживания на основе названия"""
-    name_lower = item_name.lower()
-    
-    if "масл" in name_lower:
-        return MaintenanceItemType.OIL_CHANGE
-    elif "тормоз" in name_lower or "колод" in name_lower:
-        return MaintenanceItemType.BRAKE_PADS
-    elif "ремен" in name_lower or "грм" in name_lower:
-        return MaintenanceItemType.TIMING_BELT
-    elif "фильтр" in name_lower and ("воздух" in name_lower or "воздуш" in name_lower):
-        return MaintenanceItemType.AIR_FILTER
-    elif "аккумулятор" in name_lower or "батар" in name_lower:
-        return MaintenanceItemType.BATTERY
-    else:
-        return MaintenanceItemType.OTHER
\ No newline at end of file
+
+
+class Classifier:
+    """Ключевые слова всех правил, скомпилированные в один проход по названию"""
+
+    def __init__(self, *rule_sets: Rules) -> None:
+        keywords = {
+            keyword
+            for rules in rule_sets
+            for _, condition in rules.rules
+            for group in condition
+            for keyword in group
+        }
+        # Поиск с просмотром вперёд находит слово в каждой позиции, а длинные
+        # слова идут первыми. Слова, с которых начинается найденное ("ремен"
+        # в "ремень"), совпали в той же позиции — их добавляет _prefixes
+        alternatives = sorted(keywords, key=len, reverse=True)
+        self._pattern = re.compile(
+            "(?=(" + "|".join(map(re.escape, alternatives)) + "))"
+        )
+        self._prefixes = {
+            keyword: frozenset(k for k in keywords if keyword.startswith(k))
+            for keyword in keywords
+        }
+
+    def keywords(self, name: str) -> frozenset:
+        """Все ключевые слова правил, входящие в название"""
+        found = set()
+        for match in self._pattern.finditer(name.lower()):
+            found |= self._prefixes[match.group(1)]
+        return frozenset(found)
+
+
+_classifier = Classifier(TYPE_RULES, ICON_RULES, CATEGORY_RULES)
+
+
+@lru_cache(maxsize=4096)
+def classify(name: str) -> Classification:
+    """Тип, иконка и категория работы по её названию"""
+    found = _classifier.keywords(name)
+    return Classification(
+        type=TYPE_RULES.resolve(found),
+        icon=ICON_RULES.resolve(found),
+        category=CATEGORY_RULES.resolve(found),
+    )
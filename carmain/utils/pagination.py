@@ -0,0 +1,68 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence
+
+from carmain.core.exceptions import ValidationError
+
+# Приведение значения курсора на своей позиции: TypeError/ValueError,
+# если значение не того типа
+Converter = Callable[[Any], Any]
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Упаковать значения ключа последней строки в непрозрачный курсор"""
+    payload = json.dumps(values, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: Optional[str], converters: Sequence[Converter]
+) -> Optional[List[Any]]:
+    """
+    Распаковать курсор, полученный из encode_cursor, и привести его значения
+    converters по позициям. Курсор не той длины или со значением не того
+    типа — ValidationError, а не ошибка в запросе к БД
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError(detail="Некорректный курсор пагинации")
+    if not isinstance(values, list) or len(values) != len(converters):
+        raise ValidationError(detail="Некорректный курсор пагинации")
+    try:
+        return [convert(value) for convert, value in zip(converters, values)]
+    except (TypeError, ValueError):
+        raise ValidationError(detail="Некорректный курсор пагинации")
+
+
+def _require(value: Any, kind: type) -> Any:
+    # bool — подкласс int, но в курсоре это разные значения
+    if not isinstance(value, kind) or (isinstance(value, bool) and kind is not bool):
+        raise TypeError(f"ожидалось значение типа {kind.__name__}")
+    return value
+
+
+def as_bool(value: Any) -> bool:
+    return _require(value, bool)
+
+
+def as_int(value: Any) -> int:
+    return _require(value, int)
+
+
+def as_uuid(value: Any) -> uuid.UUID:
+    return uuid.UUID(_require(value, str))
+
+
+def as_datetime(value: Any) -> datetime:
+    return datetime.fromisoformat(_require(value, str))
+
+
+def optional(convert: Converter) -> Converter:
+    """Значение или null"""
+    return lambda value: None if value is None else convert(value)
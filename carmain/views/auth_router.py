@@ -6,17 +6,22 @@ from fastapi_users import models, exceptions
 from pydantic import EmailStr
 from starlette.responses import RedirectResponse
 
-from carmain.core.backend import get_user_manager, UserManager, cookie_backend
+from carmain.core.exceptions import ServiceUnavailableError
+from carmain.core.backend import (
+    get_user_manager,
+    UserManager,
+    cookie_backend,
+    principal_cookie_backend,
+)
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from carmain.core.templating import templates
 from urllib.parse import quote
 
-from carmain.models.users import User
-from carmain.routers.v1.auth_router import current_active_verified_user
+from carmain.schemas.user_schema import UserPrincipal
+from carmain.routers.v1.auth_router import current_active_verified_principal
 from carmain.schemas.user_schema import UserCreate, SignUpFormData
 
 auth_view_router = APIRouter(prefix="/auth", tags=["auth"])
-templates = Jinja2Templates(directory="carmain/templates")
 
 
 async def get_signup_form_data(
@@ -46,7 +51,15 @@ async def login_action(
     user_manager: UserManager = Depends(get_user_manager),
     strategy: Strategy[models.UP, models.ID] = Depends(cookie_backend.get_strategy),
 ):
-    user = await user_manager.authenticate(credentials)
+    try:
+        user = await user_manager.authenticate(credentials)
+    except ServiceUnavailableError as e:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": e.detail},
+            status_code=e.status_code,
+            headers=e.headers,
+        )
     if user is None or not user.is_active:
         return templates.TemplateResponse(
             "login.html", {"request": request, "error": "Invalid credentials"}
@@ -61,11 +74,14 @@ async def login_action(
 @auth_view_router.get("/logout")
 async def logout_action(
     request: Request,
-    user: User = Depends(current_active_verified_user),
-    strategy: Strategy[models.UP, models.ID] = Depends(cookie_backend.get_strategy),
+    user: UserPrincipal = Depends(current_active_verified_principal),
+    strategy: Strategy[models.UP, models.ID] = Depends(
+        principal_cookie_backend.get_strategy
+    ),
 ):
-    token = request.headers.get("token")
-    response = await cookie_backend.logout(strategy, user, token)
+    # Токен сессии приходит в cookie; его удаление сбрасывает и кэш сессий
+    token = await principal_cookie_backend.transport.scheme(request)
+    response = await principal_cookie_backend.logout(strategy, user, token)
     response.headers["location"] = quote(str("/"), safe=":/%#?=@[]!$&'()*+,;")
     response.status_code = status.HTTP_303_SEE_OTHER
     return response
@@ -88,4 +104,11 @@ async def signup_action(
         return templates.TemplateResponse(
             "signup.html", {"request": request, "error": e.reason}
         )
+    except ServiceUnavailableError as e:
+        return templates.TemplateResponse(
+            "signup.html",
+            {"request": request, "error": e.detail},
+            status_code=e.status_code,
+            headers=e.headers,
+        )
     return RedirectResponse("/auth/login", status_code=303)
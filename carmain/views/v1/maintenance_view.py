@@ -1,4 +1,3 @@
-import json
 from datetime import date, datetime
 import uuid
 from typing import Optional, List, Dict, Any, Annotated
@@ -15,43 +14,47 @@ from fastapi import (
     UploadFile,
 )
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from markupsafe import Markup
+from carmain.core.conditional import (
+    etag_matches,
+    fragment_etag,
+    not_modified,
+    with_etag,
+)
+from carmain.core.fragment_cache import fragment_cache
+from carmain.core.templating import stream_template, templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from carmain.core.database import get_async_session
-from carmain.routers.v1.auth_router import current_active_verified_user
-from carmain.models.users import User
-from carmain.repository.maintenance_repository import MaintenanceRepository
+from carmain.routers.v1.auth_router import current_active_verified_principal
+from carmain.schemas.user_schema import UserPrincipal
+from carmain.repository.maintenance_repository import (
+    DirectoryItem,
+    MaintenanceRepository,
+)
 from carmain.repository.vehicle_repository import VehicleRepository
 from carmain.schemas.maintenance_schema import (
     MaintenanceItemDisplay,
     ServiceRecordCreate,
-    PaginationParams,
     MaintenanceCategory,
     UserMaintenanceItemUpdate,
 )
 from carmain.services.maintenance_service import MaintenanceService
 from carmain.services.vehicle_service import VehicleService
-from carmain.utils.maintenance_utils import (
-    filter_maintenance_items_by_search,
-    filter_maintenance_items_by_category,
-    get_maintenance_item_icon,
-)
 
 router = APIRouter(prefix="/vehicles", tags=["maintenance"])
 
 
-templates = Jinja2Templates(directory="carmain/templates")
-
-
-def to_json_filter(value):
-    if isinstance(value, uuid.UUID):
-        return Markup(json.dumps(str(value)))
-    return Markup(json.dumps(value))
-
-
-templates.env.filters["tojson"] = to_json_filter
+def _directory_card(vehicle_id: uuid.UUID, item: DirectoryItem):
+    """
+    Карточка справочника. DirectoryItem неизменяем и содержит всё, что она
+    выводит, поэтому сам служит версией
+    """
+    return fragment_cache.render(
+        "maintenance_directory_card.html",
+        (vehicle_id, item.id),
+        item,
+        {"vehicle_id": vehicle_id, "item": item},
+    )
 
 
 @router.get("/{vehicle_id}/maintenance")
@@ -59,56 +62,95 @@ async def maintenance_items_view(
     request: Request,
     vehicle_id: Annotated[uuid.UUID, Path(description="UUID идентификатор автомобиля")],
     maintenance_service: Annotated[MaintenanceService, Depends()],
-    page: int = Query(1, ge=1),
     show_all: bool = False,
     q: Optional[str] = Query(None, description="Поисковый запрос"),
     category: Optional[MaintenanceCategory] = Query(
         None, description="Фильтр по категории"
     ),
+    cursor: Optional[str] = Query(None, description="Курсор следующей порции"),
+    rest: bool = Query(False, description="Все оставшиеся элементы одним ответом"),
 ):
     """
     Отображение деталей, требующих обслуживания для конкретного автомобиля
     """
+    is_htmx_request = request.headers.get("HX-Request") == "true"
+    is_item_list_target = (
+        is_htmx_request and request.headers.get("HX-Target") == "maintenance-items-list"
+    )
+    # Фрагменты (порция по курсору и список) проверяются по версии данных
+    # автомобиля до чтения строк; страница целиком — без ETag
+    if cursor or rest or is_item_list_target:
+        etag = fragment_etag(
+            request,
+            maintenance_service.user.id,
+            await maintenance_service.data_versions(vehicle_id),
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
     vehicle = await maintenance_service.get_vehicle(vehicle_id)
     if not vehicle or vehicle.user_id != maintenance_service.user.id:
         raise HTTPException(status_code=404, detail="Автомобиль не найден")
 
-    user_vehicles = await maintenance_service.get_user_vehicles()
-
-    maintenance_items, pagination = (
-        await maintenance_service.get_items_requiring_service(
-            vehicle_id=vehicle_id, page=page, page_size=10, show_all=show_all
+    if rest:
+        # Остаток списка: строки читаются серверным курсором и уходят
+        # клиенту по мере рендера, не собираясь в памяти
+        response = stream_template(
+            "maintenance_items_page.html",
+            {
+                "request": request,
+                "vehicle": vehicle,
+                "maintenance_items": maintenance_service.stream_items_requiring_service(
+                    vehicle_id, cursor, show_all, q, category
+                ),
+                "next_cursor": None,
+                "today": date.today().isoformat(),
+            },
         )
-    )
+        return with_etag(response, etag)
 
-    # Применяем фильтры
-    maintenance_items = filter_maintenance_items_by_search(maintenance_items, q)
-    maintenance_items = filter_maintenance_items_by_category(
-        maintenance_items, category
+    # Список листается по ключу: первая порция без курсора, дальше
+    # "Показать ещё" передаёт курсор последней показанной строки
+    maintenance_items, next_cursor, remaining = (
+        await maintenance_service.get_items_requiring_service_page(
+            vehicle_id=vehicle_id,
+            cursor=cursor,
+            page_size=10,
+            show_all=show_all,
+            q=q,
+            category=category,
+        )
     )
 
-    pagination_params = PaginationParams(
-        current_page=pagination["current_page"],
-        total_pages=pagination["total_pages"],
-        items_per_page=pagination["items_per_page"],
-        total_items=pagination["total_items"],
-    )
+    if cursor:
+        response = templates.TemplateResponse(
+            "maintenance_items_page.html",
+            {
+                "request": request,
+                "vehicle": vehicle,
+                "maintenance_items": maintenance_items,
+                "next_cursor": next_cursor,
+                "remaining": remaining,
+                "today": date.today().isoformat(),
+            },
+        )
+        return with_etag(response, etag)
 
-    is_htmx_request = request.headers.get("HX-Request") == "true"
-    is_item_list_target = (
-        is_htmx_request and request.headers.get("HX-Target") == "maintenance-items-list"
-    )
     if is_item_list_target:
-        return templates.TemplateResponse(
+        response = templates.TemplateResponse(
             "maintenance_items_list.html",
             {
                 "request": request,
                 "vehicle": vehicle,
                 "maintenance_items": maintenance_items,
-                "pagination": pagination_params,
+                "next_cursor": next_cursor,
+                "remaining": remaining,
                 "today": date.today().isoformat(),
             },
         )
+        return with_etag(response, etag)
+
+    user_vehicles = await maintenance_service.get_user_vehicles()
 
     return templates.TemplateResponse(
         "maintenance_items.html",
@@ -118,7 +160,8 @@ async def maintenance_items_view(
             "vehicle": vehicle,
             "user_vehicles": user_vehicles,
             "maintenance_items": maintenance_items,
-            "pagination": pagination_params,
+            "next_cursor": next_cursor,
+            "remaining": remaining,
             "today": date.today().isoformat(),
         },
     )
@@ -147,18 +190,8 @@ async def change_custom_interval(
         user_item.id, user_maintenance_item_update
     )
 
-    maintenance_items, pagination = (
-        await maintenance_service.get_items_requiring_service(
-            vehicle_id=vehicle_id,
-            page=1,
-        )
-    )
-
-    pagination_params = PaginationParams(
-        current_page=pagination["current_page"],
-        total_pages=pagination["total_pages"],
-        items_per_page=pagination["items_per_page"],
-        total_items=pagination["total_items"],
+    maintenance_items, next_cursor, remaining = (
+        await maintenance_service.get_items_requiring_service_page(vehicle_id)
     )
 
     return templates.TemplateResponse(
@@ -167,7 +200,8 @@ async def change_custom_interval(
             "request": request,
             "vehicle": user_item.vehicle,
             "maintenance_items": maintenance_items,
-            "pagination": pagination_params,
+            "next_cursor": next_cursor,
+            "remaining": remaining,
             "today": date.today().isoformat(),
         },
     )
@@ -183,48 +217,44 @@ async def mark_item_as_serviced(
     """
     Отметить деталь как обслуженную
     """
-    item = await maintenance_service.mark_item_as_serviced(service_record_create)
+    serviced = await maintenance_service.mark_item_as_serviced(service_record_create)
+    # Шаблонам нужны только id и пробег автомобиля и название работы: они
+    # пришли из того же запроса, что и запись, без повторного чтения элемента
+    vehicle = {"id": serviced.vehicle_id, "odometer": serviced.vehicle_odometer}
 
     is_htmx = request.headers.get("HX-Request") == "true"
     is_service_records_container = (
         is_htmx and request.headers.get("HX-Target") == "service-records-container"
     )
     if is_service_records_container:
-        records = await maintenance_service.get_service_records(item.id)
-        sorted_records = sorted(records, key=lambda x: x.service_date, reverse=True)
+        records, next_cursor = await maintenance_service.get_service_records_page(
+            serviced.id
+        )
 
         return templates.TemplateResponse(
             "service_records_list.html",
             {
                 "request": request,
-                "vehicle": item.vehicle,
-                "item": item,
-                "maintenance_item": item.maintenance_item,
-                "records": sorted_records,
+                "vehicle": vehicle,
+                "item": serviced,
+                "maintenance_item": serviced,
+                "records": records,
+                "next_cursor": next_cursor,
             },
         )
 
-    maintenance_items, pagination = (
-        await maintenance_service.get_items_requiring_service(
-            vehicle_id=vehicle_id,
-            page=1,
-        )
-    )
-
-    pagination_params = PaginationParams(
-        current_page=pagination["current_page"],
-        total_pages=pagination["total_pages"],
-        items_per_page=pagination["items_per_page"],
-        total_items=pagination["total_items"],
+    maintenance_items, next_cursor, remaining = (
+        await maintenance_service.get_items_requiring_service_page(vehicle_id)
     )
 
     return templates.TemplateResponse(
         "maintenance_items_list.html",
         {
             "request": request,
-            "vehicle": item.vehicle,
+            "vehicle": vehicle,
             "maintenance_items": maintenance_items,
-            "pagination": pagination_params,
+            "next_cursor": next_cursor,
+            "remaining": remaining,
         },
     )
 
@@ -241,50 +271,49 @@ async def all_maintenance_items_view(
     tracked_only: Optional[bool] = Query(
         False, description="Показывать только отслеживаемые"
     ),
+    skip: int = Query(0, ge=0, description="Сколько работ пропустить"),
+    limit: int = Query(200, ge=1, le=1000, description="Размер страницы"),
 ):
     """
     Отображение справочника всех типов работ, с отметкой отслеживаемых пользователем
     """
+    is_htmx = request.headers.get("HX-Request") == "true"
+    is_maintenance_container_target = (
+        is_htmx and request.headers.get("HX-Target") == "maintenance-items-container"
+    )
+    if is_maintenance_container_target:
+        etag = fragment_etag(
+            request,
+            maintenance_service.user.id,
+            await maintenance_service.data_versions(vehicle_id),
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
 
     vehicle = await maintenance_service.get_vehicle(vehicle_id)
     if not vehicle or vehicle.user_id != maintenance_service.user.id:
         raise HTTPException(status_code=404, detail="Автомобиль не найден")
 
-    all_items = await maintenance_service.get_maintenance_items(skip=0, limit=1000)
-
-    user_items = await maintenance_service.get_user_maintenance_items(
-        vehicle_id=vehicle_id, limit=1000
+    items = await maintenance_service.get_directory(
+        vehicle_id,
+        q=q,
+        category=category,
+        tracked_only=bool(tracked_only),
+        skip=skip,
+        limit=limit,
     )
-    tracked_ids = {ui.item_id for ui in user_items}
 
-    # Применяем фильтры
-    filtered_items = filter_maintenance_items_by_search(all_items, q)
-    filtered_items = filter_maintenance_items_by_category(filtered_items, category)
-
-    items: List[Dict[str, Any]] = []
-    for mi in filtered_items:
-        is_tracked = mi.id in tracked_ids
-
-        if tracked_only and not is_tracked:
-            continue
-
-        items.append(
-            {
-                "id": mi.id,
-                "name": mi.name,
-                "default_interval": mi.default_interval,
-                "icon": get_maintenance_item_icon(mi.name),
-                "is_tracked": is_tracked,
-            }
-        )
-
-    is_htmx = request.headers.get("HX-Request") == "true"
-    is_maintenance_container_target = (
-        is_htmx and request.headers.get("HX-Target") == "maintenance-items-container"
-    )
-    context = {"request": request, "vehicle_id": vehicle_id, "maintenance_items": items}
+    context = {
+        "request": request,
+        "vehicle_id": vehicle_id,
+        "maintenance_items": items,
+        "maintenance_cards": [_directory_card(vehicle_id, item) for item in items],
+    }
     if is_maintenance_container_target:
-        return templates.TemplateResponse("maintenance_directory_list.html", context)
+        response = templates.TemplateResponse(
+            "maintenance_directory_list.html", context
+        )
+        return with_etag(response, etag)
     return templates.TemplateResponse("maintenance_directory.html", context)
 
 
@@ -311,17 +340,9 @@ async def track_maintenance_item(
     mi = await maintenance_service.get_maintenance_item(item_id)
     if not mi:
         raise HTTPException(status_code=404, detail="Работа не найдена")
-    item = {
-        "id": mi.id,
-        "name": mi.name,
-        "default_interval": mi.default_interval,
-        "icon": get_maintenance_item_icon(mi.name),
-        "is_tracked": True,
-    }
-    return templates.TemplateResponse(
-        "maintenance_directory_card.html",
-        {"request": request, "vehicle_id": vehicle_id, "item": item},
-    )
+    fragment_cache.invalidate((vehicle_id, item_id))
+    item = DirectoryItem.from_catalog(mi, is_tracked=True)
+    return HTMLResponse(_directory_card(vehicle_id, item))
 
 
 @router.post(
@@ -348,17 +369,9 @@ async def untrack_maintenance_item(
     mi = await maintenance_service.get_maintenance_item(item_id)
     if not mi:
         raise HTTPException(status_code=404, detail="Работа не найдена")
-    item = {
-        "id": mi.id,
-        "name": mi.name,
-        "default_interval": mi.default_interval,
-        "icon": get_maintenance_item_icon(mi.name),
-        "is_tracked": False,
-    }
-    return templates.TemplateResponse(
-        "maintenance_directory_card.html",
-        {"request": request, "vehicle_id": vehicle_id, "item": item},
-    )
+    fragment_cache.invalidate((vehicle_id, item_id))
+    item = DirectoryItem.from_catalog(mi, is_tracked=False)
+    return HTMLResponse(_directory_card(vehicle_id, item))
 
 
 @router.get("/{vehicle_id}/add-maintenance-item")
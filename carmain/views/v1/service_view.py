@@ -1,12 +1,16 @@
-import json
 from datetime import date, datetime
 import uuid
-from typing import Annotated, Any
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Path
+from fastapi import APIRouter, Depends, HTTPException, Request, Path, Query
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from markupsafe import Markup
+from carmain.core.conditional import (
+    etag_matches,
+    fragment_etag,
+    not_modified,
+    with_etag,
+)
+from carmain.core.templating import stream_template, templates
 
 from carmain.models.items import UserMaintenanceItem
 from carmain.models.vehicles import Vehicle
@@ -15,17 +19,6 @@ from carmain.services.maintenance_service import MaintenanceService
 
 router = APIRouter(prefix="/service-records", tags=["service-records"])
 
-templates = Jinja2Templates(directory="carmain/templates")
-
-
-def to_json_filter(value: Any) -> Any:
-    if isinstance(value, uuid.UUID):
-        return Markup(json.dumps(str(value)))
-    return Markup(json.dumps(value))
-
-
-templates.env.filters["tojson"] = to_json_filter
-
 
 @router.get("/{item_id}")
 async def service_record_history_view(
@@ -34,31 +27,60 @@ async def service_record_history_view(
         uuid.UUID, Path(description="UUID идентификатор элемента обслуживания")
     ],
     maintenance_service: Annotated[MaintenanceService, Depends()],
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы"),
+    rest: bool = Query(False, description="Вся оставшаяся история одним ответом"),
 ):
     """
     Отображение истории обслуживания для конкретной детали
     """
+    # Порции "Показать ещё" и остаток истории проверяются по версии данных
+    # пользователя
+    if cursor or rest:
+        etag = fragment_etag(
+            request,
+            maintenance_service.user.id,
+            await maintenance_service.data_versions(),
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
     item = await maintenance_service.get_user_maintenance_item(item_id)
     if not item or item.user_id != maintenance_service.user.id:
         raise HTTPException(status_code=404, detail="Элемент обслуживания не найден")
 
-    records = await maintenance_service.get_service_records(item_id)
-
-    name_lower = item.maintenance_item.name.lower()
-    if "масл" in name_lower or "oil" in name_lower:
-        icon = "oil-can"
-    elif "тормоз" in name_lower or "brake" in name_lower:
-        icon = "exclamation-circle"
-    elif "ремень" in name_lower or "грм" in name_lower:
-        icon = "cogs"
-    elif "фильтр" in name_lower or "filter" in name_lower:
-        icon = "filter"
-    elif "аккум" in name_lower or "battery" in name_lower:
-        icon = "car-battery"
-    else:
-        icon = "wrench"
+    if rest:
+        # Остаток истории: записи читаются серверным курсором и уходят
+        # клиенту по мере рендера, не собираясь в памяти
+        response = stream_template(
+            "service_records_page.html",
+            {
+                "request": request,
+                "vehicle": item.vehicle,
+                "item": item,
+                "maintenance_item": item.maintenance_item,
+                "records": maintenance_service.stream_service_records(item_id, cursor),
+                "next_cursor": None,
+            },
+        )
+        return with_etag(response, etag)
+
+    records, next_cursor = await maintenance_service.get_service_records_page(
+        item_id, cursor
+    )
 
-    sorted_records = sorted(records, key=lambda x: x.service_date, reverse=True)
+    if cursor:
+        response = templates.TemplateResponse(
+            "service_records_page.html",
+            {
+                "request": request,
+                "vehicle": item.vehicle,
+                "item": item,
+                "maintenance_item": item.maintenance_item,
+                "records": records,
+                "next_cursor": next_cursor,
+            },
+        )
+        return with_etag(response, etag)
 
     today = date.today().isoformat()
 
@@ -70,8 +92,9 @@ async def service_record_history_view(
             "vehicle": item.vehicle,
             "item": item,
             "maintenance_item": item.maintenance_item,
-            "records": sorted_records,
-            "icon": icon,
+            "records": records,
+            "next_cursor": next_cursor,
+            "icon": item.maintenance_item.icon,
             "today": today,
         },
     )
@@ -104,8 +127,9 @@ async def update_service_record(
     if not item or item.user_id != maintenance_service.user.id:
         raise HTTPException(status_code=404, detail="Элемент обслуживания не найден")
 
-    records = await maintenance_service.get_service_records(user_item_id)
-    sorted_records = sorted(records, key=lambda x: x.service_date, reverse=True)
+    records, next_cursor = await maintenance_service.get_service_records_page(
+        user_item_id
+    )
 
     return templates.TemplateResponse(
         "service_records_list.html",
@@ -114,7 +138,8 @@ async def update_service_record(
             "vehicle": item.vehicle,
             "item": item,
             "maintenance_item": item.maintenance_item,
-            "records": sorted_records,
+            "records": records,
+            "next_cursor": next_cursor,
         },
     )
 
@@ -150,8 +175,9 @@ async def create_service_record(
     if not vehicle or vehicle.user_id != maintenance_service.user.id:
         raise HTTPException(status_code=404, detail="Автомобиль не найден")
 
-    records = await maintenance_service.get_service_records(user_item_id)
-    sorted_records = sorted(records, key=lambda x: x.service_date, reverse=True)
+    records, next_cursor = await maintenance_service.get_service_records_page(
+        user_item_id
+    )
 
     is_htmx_request = request.headers.get("HX-Request") == "true"
     is_item_list_target = (
@@ -177,6 +203,7 @@ async def create_service_record(
             "vehicle": item.vehicle,
             "item": item,
             "maintenance_item": item.maintenance_item,
-            "records": sorted_records,
+            "records": records,
+            "next_cursor": next_cursor,
         },
     )
@@ -2,8 +2,15 @@ import uuid
 from typing import Optional
 
 from fastapi import APIRouter, Depends, status, UploadFile, File, HTTPException
-from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse
+from carmain.core.conditional import (
+    etag_matches,
+    fragment_etag,
+    not_modified,
+    with_etag,
+)
+from carmain.core.fragment_cache import fragment_cache
+from carmain.core.templating import templates
 from fastapi.requests import Request
 
 from carmain.services.vehicle_service import VehicleService
@@ -14,11 +21,28 @@ from carmain.schemas.vehicle_schema import (
     VehicleCreate,
     VehicleUpdate,
 )
-from carmain.models.users import User
-from carmain.routers.v1.auth_router import current_active_verified_user
+from carmain.schemas.user_schema import UserPrincipal
+from carmain.routers.v1.auth_router import current_active_verified_principal
 
 vehicle_router = APIRouter(prefix="/vehicles", tags=["vehicles"])
-templates = Jinja2Templates(directory="carmain/templates")
+
+
+def _vehicle_card(vehicle, due_count: int):
+    """Карточка гаража; версия — всё, что она выводит"""
+    version = (
+        vehicle.brand,
+        vehicle.model,
+        vehicle.year,
+        vehicle.odometer,
+        vehicle.photo,
+        due_count,
+    )
+    return fragment_cache.render(
+        "vehicle_card.html",
+        vehicle.id,
+        version,
+        {"vehicle": vehicle, "service_requiring": {vehicle.id.hex: due_count}},
+    )
 
 
 @vehicle_router.get("/")
@@ -28,18 +52,25 @@ async def list_vehicles(
     maintenance_service: MaintenanceService = Depends(),
 ):
     """Возвращает HTML-фрагмент со списком автомобилей пользователя"""
+    etag = fragment_etag(
+        request,
+        maintenance_service.user.id,
+        await maintenance_service.data_versions(),
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     vehicles = await vehicle_service.get_user_vehicles()
-    service_requiring = {
-        vehicle.id.hex: await maintenance_service.get_items_requiring_service_count(
-            vehicle.id
-        )
-        for vehicle in vehicles
-    }
-    return templates.TemplateResponse(
+    due_counts = await maintenance_service.get_items_requiring_service_counts()
+    vehicle_cards = [
+        _vehicle_card(vehicle, due_counts.get(vehicle.id, 0)) for vehicle in vehicles
+    ]
+    response = templates.TemplateResponse(
         request=request,
         name="vehicle_list.html",
-        context={"vehicles": vehicles, "service_requiring": service_requiring},
+        context={"vehicles": vehicles, "vehicle_cards": vehicle_cards},
     )
+    return with_etag(response, etag)
 
 
 @vehicle_router.get(path="/{obj_id}")
@@ -60,7 +91,7 @@ async def create(
     photo: UploadFile = File(None),
     vehicle_service: VehicleService = Depends(),
     file_service: FileService = Depends(),
-    user: User = Depends(current_active_verified_user),
+    user: UserPrincipal = Depends(current_active_verified_principal),
 ):
     try:
         photo_path = None
@@ -99,7 +130,7 @@ async def update(
     vehicle_service: VehicleService = Depends(),
     maintenance_service: MaintenanceService = Depends(),
     file_service: FileService = Depends(),
-    user: User = Depends(current_active_verified_user),
+    user: UserPrincipal = Depends(current_active_verified_principal),
 ):
     try:
         vehicle = await vehicle_service.get_by_id(obj_id)
@@ -124,20 +155,12 @@ async def update(
         vehicle_update.photo = photo_path
         updated_vehicle = await vehicle_service.patch(obj_id, vehicle_update)
 
-        service_requiring = {
-            updated_vehicle.id.hex: await maintenance_service.get_items_requiring_service_count(
-                updated_vehicle.id
-            )
-        }
-
-        return templates.TemplateResponse(
-            request=request,
-            name="vehicle_card.html",
-            context={
-                "vehicle": updated_vehicle,
-                "service_requiring": service_requiring,
-            },
+        due_count = await maintenance_service.get_items_requiring_service_count(
+            updated_vehicle.id
         )
+
+        fragment_cache.invalidate(updated_vehicle.id)
+        return HTMLResponse(_vehicle_card(updated_vehicle, due_count))
     except Exception as e:
         return templates.TemplateResponse(
             request=request,
@@ -15,6 +15,40 @@ preload_app = True
 timeout = 30
 keepalive = 2
 
+
+def post_fork(server, worker):
+    # preload_app импортирует приложение и создаёт движок БД в мастере;
+    # каждый воркер начинает с собственным пустым пулом соединений
+    from carmain.core.database import dispose_after_fork
+
+    dispose_after_fork()
+
+
+# Метрики воркеров собираются через файлы в metrics_dir (core/metrics.py)
+def on_starting(server):
+    from carmain.core.config import get_settings
+    from carmain.core.metrics import clear_directory
+
+    metrics_dir = get_settings().metrics_dir
+    if metrics_dir:
+        clear_directory(metrics_dir)
+
+
+def worker_exit(server, worker):
+    from carmain.core.metrics import registry
+
+    registry.flush(force=True)
+
+
+def child_exit(server, worker):
+    from carmain.core.config import get_settings
+    from carmain.core.metrics import mark_process_dead
+
+    metrics_dir = get_settings().metrics_dir
+    if metrics_dir:
+        mark_process_dead(metrics_dir, worker.pid)
+
+
 # Logging
 accesslog = "-"
 errorlog = "-"
@@ -33,4 +67,4 @@ tmp_upload_dir = None
 
 # SSL (if needed in future)
 # keyfile = None
-# certfile = None
\ No newline at end of file
+# certfile = None
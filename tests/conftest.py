@@ -11,6 +11,8 @@ from carmain.models.items import MaintenanceItem, UserMaintenanceItem
 from carmain.models.vehicles import Vehicle
 from carmain.models.users import User
 
+pytest_plugins = ["tests.query_budget"]
+
 
 @pytest.fixture
 def user():
@@ -3,11 +3,19 @@ import datetime
 import pytest
 
 from fastapi_users.authentication.strategy import DatabaseStrategy, JWTStrategy
-from fastapi_users.authentication import BearerTransport, CookieTransport, AuthenticationBackend
+from fastapi_users.authentication import (
+    BearerTransport,
+    CookieTransport,
+    AuthenticationBackend,
+)
 
 from carmain.core.backend import (
     get_jwt_strategy,
     get_database_strategy,
+    get_principal_database_strategy,
+    get_principal_jwt_strategy,
+    PrincipalDatabaseStrategy,
+    PrincipalJWTStrategy,
     get_user_manager,
     get_backends,
     bearer_transport,
@@ -17,6 +25,8 @@ from carmain.core.backend import (
     UserManager,
 )
 from carmain.core.database import settings as db_settings
+from carmain.core.token_cache import MemoryTokenCacheBackend, TokenCache
+from carmain.schemas.user_schema import UserPrincipal
 
 
 @pytest.mark.asyncio
@@ -31,6 +41,7 @@ async def test_get_jwt_strategy():
 def test_get_database_strategy():
     class DummyDB:
         pass
+
     dummy = DummyDB()
     strat = get_database_strategy(dummy)
     assert isinstance(strat, DatabaseStrategy)
@@ -64,6 +75,7 @@ def test_backends_configuration():
     assert isinstance(jwt_backend.transport, BearerTransport)
     # cookie_backend uses cookie transport instance
     from carmain.core.backend import cookie_transport as ct_inst
+
     assert cookie_backend.transport is ct_inst
     assert isinstance(cookie_backend.transport, CookieTransport)
     # CookieTransport defaults from settings
@@ -72,7 +84,80 @@ def test_backends_configuration():
     assert ct.cookie_max_age == 86400
     # HTTPONLY from settings
     assert ct.cookie_httponly is True
-    assert hasattr(ct, 'cookie_samesite')
+    assert hasattr(ct, "cookie_samesite")
     # Backends are AuthenticationBackend instances
     assert isinstance(cookie_backend, AuthenticationBackend)
-    assert isinstance(jwt_backend, AuthenticationBackend)
\ No newline at end of file
+    assert isinstance(jwt_backend, AuthenticationBackend)
+
+
+class DummyUsers:
+    def __init__(self):
+        self.calls = []
+
+    async def get_principal(self, user_id):
+        self.calls.append(("id", user_id))
+        return user_id
+
+    async def get_session_principal(self, token, max_age=None):
+        self.calls.append(("token", token, max_age))
+        if token != "tok":
+            return None
+        principal = UserPrincipal(
+            id=1,
+            email="a@example.com",
+            is_active=True,
+            is_superuser=False,
+            is_verified=True,
+        )
+        return principal, datetime.datetime.now(datetime.timezone.utc)
+
+
+class DummyTokenDB:
+    def __init__(self):
+        self.deleted = []
+
+    async def get_by_token(self, token, max_age=None):
+        return token
+
+    async def delete(self, access_token):
+        self.deleted.append(access_token)
+
+
+@pytest.mark.asyncio
+async def test_principal_database_strategy_reads_projection():
+    users = DummyUsers()
+    db = DummyTokenDB()
+    strat = get_principal_database_strategy(db, users)
+    strat.cache = TokenCache(MemoryTokenCacheBackend())
+    assert isinstance(strat, PrincipalDatabaseStrategy)
+    assert await strat.read_token(None, None) is None
+
+    principal = await strat.read_token("tok", None)
+    assert principal.email == "a@example.com"
+    kind, token, max_age = users.calls[0]
+    assert (kind, token) == ("token", "tok")
+    assert max_age < datetime.datetime.now(datetime.timezone.utc)
+
+    # Повторная проверка токена обслуживается кэшем
+    assert await strat.read_token("tok", None) == principal
+    assert len(users.calls) == 1
+    assert strat.cache.stats() == {"hits": 1, "misses": 1, "errors": 0}
+
+    # Выход удаляет токен и из БД, и из кэша
+    await strat.destroy_token("tok", principal)
+    assert db.deleted == ["tok"]
+    assert await strat.read_token("tok", None) == principal
+    assert len(users.calls) == 2
+
+    assert await strat.read_token("missing", None) is None
+
+
+@pytest.mark.asyncio
+async def test_principal_jwt_strategy_reads_projection():
+    users = DummyUsers()
+    strat = get_principal_jwt_strategy(users)
+    assert isinstance(strat, PrincipalJWTStrategy)
+    token = await strat.write_token(type("U", (), {"id": 7})())
+    assert await strat.read_token(token, None) == 7
+    assert await strat.read_token("broken", None) is None
+    assert users.calls == [("id", 7)]
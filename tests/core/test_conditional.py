@@ -0,0 +1,60 @@
+from starlette.requests import Request
+
+from carmain.core.conditional import (
+    etag_matches,
+    fragment_etag,
+    not_modified,
+    with_etag,
+)
+from fastapi import Response
+
+
+def _request(query: str = "", **headers) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/vehicles/",
+            "query_string": query.encode(),
+            "headers": [
+                (name.replace("_", "-").lower().encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+def test_fragment_etag_depends_on_versions_user_and_request():
+    request = _request(HX_Request="true")
+    etag = fragment_etag(request, 1, {"user:1": 3, "catalog": 1})
+
+    assert etag.startswith('W/"')
+    assert etag == fragment_etag(request, 1, {"catalog": 1, "user:1": 3})
+    assert etag != fragment_etag(request, 1, {"user:1": 4, "catalog": 1})
+    assert etag != fragment_etag(request, 2, {"user:1": 3, "catalog": 1})
+    assert etag != fragment_etag(_request(), 1, {"user:1": 3, "catalog": 1})
+    assert etag != fragment_etag(
+        _request("cursor=x", HX_Request="true"), 1, {"user:1": 3, "catalog": 1}
+    )
+
+
+def test_etag_matches_uses_weak_comparison():
+    etag = 'W/"abc"'
+
+    assert not etag_matches(_request(), etag)
+    assert etag_matches(_request(If_None_Match='W/"abc"'), etag)
+    # gzip в nginx может ослабить или оставить ETag: сравнение слабое
+    assert etag_matches(_request(If_None_Match='"old", "abc"'), etag)
+    assert etag_matches(_request(If_None_Match="*"), etag)
+    assert not etag_matches(_request(If_None_Match='W/"abd"'), etag)
+
+
+def test_responses_carry_validators():
+    response = not_modified('W/"abc"')
+    assert response.status_code == 304
+    assert response.body == b""
+
+    response = with_etag(Response("ok"), 'W/"abc"')
+    assert response.headers["ETag"] == 'W/"abc"'
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert response.headers["Vary"] == "HX-Request, HX-Target"
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from carmain.core import database
+from carmain.core.config import Settings
+from carmain.core.database import TimedQueuePool, engine_options, pool_stats
+
+
+def make_settings(**overrides):
+    values = dict(
+        admin_email="a@b.c",
+        secret_key="x",
+        db_name="t",
+        postgres_user="u",
+        postgres_password="p",
+    )
+    values.update(overrides)
+    return Settings(**values)
+
+
+def test_engine_options_from_settings():
+    options = engine_options(
+        make_settings(db_pool_size=3, db_max_overflow=2, db_pool_timeout=1.5)
+    )
+
+    assert options["echo"] is False
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_size"] == 3
+    assert options["max_overflow"] == 2
+    assert options["pool_timeout"] == 1.5
+    assert options["pool_pre_ping"] is True
+
+
+def test_application_engine_uses_settings():
+    pool = database.engine.sync_engine.pool
+
+    assert database.engine.echo is False
+    assert isinstance(pool, TimedQueuePool)
+    assert pool.size() == database.settings.db_pool_size
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_count_checkouts_and_timeouts(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            stats = pool_stats(engine)
+            assert stats["checked_out"] == 1
+            assert stats["size"] == 1
+
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+
+        stats = pool_stats(engine)
+        assert stats["checked_out"] == 0
+        assert stats["checkouts"] == 2
+        assert stats["timeouts"] == 1
+        assert stats["max_wait_seconds"] >= 0.05
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_dispose_resets_pool_counters(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool
+    )
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    assert pool_stats(engine)["checkouts"] == 1
+
+    engine.sync_engine.dispose(close=False)
+    assert pool_stats(engine)["checkouts"] == 0
+    await engine.dispose()
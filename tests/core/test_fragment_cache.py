@@ -0,0 +1,53 @@
+import sys
+
+from carmain.core.fragment_cache import FragmentCache
+from carmain.core.templating import create_templates
+
+
+def _cache(tmp_path, max_bytes=1024 * 1024) -> FragmentCache:
+    (tmp_path / "card.html").write_text("<b>{{ name }}</b>")
+    return FragmentCache(create_templates(str(tmp_path)), max_bytes)
+
+
+def test_render_reuses_html_for_same_version(tmp_path):
+    cache = _cache(tmp_path)
+
+    first = cache.render("card.html", 1, ("a",), {"name": "a"})
+    # При попадании контекст не используется: шаблон не рендерится
+    second = cache.render("card.html", 1, ("a",), {"name": "ignored"})
+    changed = cache.render("card.html", 1, ("b",), {"name": "b"})
+
+    assert first == second == "<b>a</b>"
+    assert changed == "<b>b</b>"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_invalidate_drops_every_version_of_entity(tmp_path):
+    cache = _cache(tmp_path)
+    cache.render("card.html", 1, ("a",), {"name": "a"})
+    cache.render("card.html", 1, ("b",), {"name": "b"})
+    cache.render("card.html", 2, ("a",), {"name": "a"})
+
+    cache.invalidate(1)
+
+    assert len(cache) == 1
+    assert cache.size == sys.getsizeof(cache.render("card.html", 2, ("a",), {}))
+    assert cache.hits == 1
+
+
+def test_size_is_bounded_by_memory(tmp_path):
+    entry = sys.getsizeof(_cache(tmp_path).render("card.html", 0, 0, {"name": "x"}))
+    cache = _cache(tmp_path, max_bytes=entry * 3)
+
+    for entity in range(10):
+        cache.render("card.html", entity, 0, {"name": "x"})
+
+    assert len(cache) == 3
+    assert cache.size <= cache.max_bytes
+    # Вытесняются самые давние
+    cache.render("card.html", 9, 0, {})
+    assert cache.hits == 1
+
+    tiny = _cache(tmp_path, max_bytes=1)
+    assert tiny.render("card.html", 1, 0, {"name": "x"}) == "<b>x</b>"
+    assert len(tiny) == 0
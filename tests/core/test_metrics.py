@@ -0,0 +1,154 @@
+import math
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from carmain.core import backend, database, metrics
+from carmain.core.database import (
+    Base,
+    ReplicaSet,
+    replica_excluded,
+    replica_routing,
+    statement_seconds,
+)
+from carmain.core.metrics import MetricsRegistry, mark_process_dead
+from carmain.core.middleware import MetricsMiddleware, request_seconds
+from carmain.core.templating import create_templates, render_seconds
+from carmain.models.items import MaintenanceItem
+from carmain.repository.base_repository import BaseRepository, call_statements
+
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs", ["kind"])
+    histogram = registry.histogram("job_seconds", "Job time", buckets=(0.1, 1))
+    counter.inc(kind='a"b')
+    counter.inc(2, kind='a"b')
+    histogram.observe(0.05)
+    histogram.observe(5)
+
+    text = registry.render()
+
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{kind="a\\"b"} 3.0' in text
+    assert 'job_seconds_bucket{le="0.1"} 1' in text
+    assert 'job_seconds_bucket{le="1.0"} 1' in text
+    assert 'job_seconds_bucket{le="+Inf"} 2' in text
+    assert "job_seconds_sum 5.05" in text
+    assert "job_seconds_count 2" in text
+
+
+def worker_registry(directory, requests, in_flight):
+    registry = MetricsRegistry(str(directory))
+    registry.counter("requests_total", "Requests").inc(requests)
+    registry.gauge("in_flight", "In flight").set(in_flight)
+    registry.histogram("seconds", "Time", buckets=(1,)).observe(0.5)
+    return registry
+
+
+def test_workers_are_merged_and_dead_keep_counters(tmp_path):
+    # Файл другого воркера с pid 4242
+    other = worker_registry(tmp_path, requests=5, in_flight=2)
+    metrics._write_json(str(tmp_path / "4242.json"), other.snapshot())
+    current = worker_registry(tmp_path, requests=1, in_flight=1)
+
+    text = current.render()
+    assert "requests_total 6.0" in text
+    assert "in_flight 3.0" in text
+    assert "seconds_count 2" in text
+
+    mark_process_dead(str(tmp_path), 4242)
+    assert not (tmp_path / "4242.json").exists()
+
+    text = current.render()
+    assert "requests_total 6.0" in text
+    assert "in_flight 1.0" in text
+    assert "seconds_count 2" in text
+
+
+def test_flush_is_throttled(tmp_path):
+    registry = worker_registry(tmp_path, requests=1, in_flight=0)
+    registry.flush_interval = 60
+    registry.flush()
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    (next(tmp_path.glob("*.json"))).unlink()
+    registry.flush()
+    assert not list(tmp_path.glob("*.json"))
+
+
+def test_middleware_labels_route_template():
+    app = FastAPI()
+
+    @app.get("/metrics-test/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(MetricsMiddleware, registry=MetricsRegistry())
+    client = TestClient(app)
+    client.get("/metrics-test/1")
+    client.get("/metrics-test/2")
+    client.get("/metrics-test-missing/3")
+
+    counts = request_seconds.values
+    assert counts[("GET", "/metrics-test/{item_id}")][-2] >= 0
+    assert sum(counts[("GET", "/metrics-test/{item_id}")][:-1]) >= 2
+    assert ("GET", "<unmatched>") in counts
+    assert not any("/metrics-test/1" in key[1] for key in counts)
+
+
+class ItemRepository(BaseRepository):
+    def __init__(self, session):
+        super().__init__(MaintenanceItem, session)
+
+    async def count_twice(self):
+        await self.all()
+        return len(await self.all())
+
+
+@pytest.mark.asyncio
+async def test_statements_are_labelled_by_repository_method(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'm.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSession(engine) as session:
+        assert await ItemRepository(session).count_twice() == 0
+    await engine.dispose()
+
+    # Вложенные вызовы all() помечены собственным методом, а число их
+    # запросов входит и в вызов снаружи
+    assert sum(statement_seconds.values[("ItemRepository.all",)][:-1]) == 2
+    outer = call_statements.values[("ItemRepository.count_twice",)]
+    assert outer[:-1][call_statements.buckets.index(2)] == 1
+
+
+def test_template_render_time(tmp_path):
+    (tmp_path / "metrics_test.html").write_text("Hello {{ name }}")
+    templates = create_templates(str(tmp_path))
+
+    html = templates.get_template("metrics_test.html").render(name="Carmain")
+
+    assert html == "Hello Carmain"
+    assert sum(render_seconds.values[("metrics_test.html",)][:-1]) == 1
+
+
+def test_replica_and_password_stats_are_collected(monkeypatch):
+    replicas = ReplicaSet([object(), object()], max_lag=5.0)
+    replicas.lags = [1.0, math.inf]
+    replicas.routed, replicas.fallbacks = 7, 2
+    monkeypatch.setattr(database, "replicas", replicas)
+
+    database.collect_replica_stats()
+    backend.collect_password_hashing_stats()
+
+    assert replica_routing.values[("replica",)] == 7
+    assert replica_routing.values[("primary",)] == 2
+    assert replica_excluded.values[("replica0",)] == 0
+    assert replica_excluded.values[("replica1",)] == 1
+    stats = backend.password_helper.stats()
+    completed = backend.password_hashing_operations.values[("completed",)]
+    assert completed == stats["completed"]
+    assert backend.password_hashing_pending.values[()] == stats["pending"]
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+
+from carmain.core.exceptions import ServiceUnavailableError
+from carmain.core.password import PooledPasswordHelper
+
+
+class GatedHash:
+    """Хешер, который держит поток, пока тест не откроет шлагбаум"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.threads = []
+
+    def hash(self, password):
+        self.threads.append(threading.current_thread().name)
+        self.gate.wait(5)
+        return f"hashed:{password}"
+
+    def verify_and_update(self, password, hashed):
+        return hashed == f"hashed:{password}", None
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_roundtrip():
+    helper = PooledPasswordHelper(max_workers=1, max_pending=4)
+
+    hashed = await helper.hash_async("s3cret-pass")
+    verified, updated = await helper.verify_and_update_async("s3cret-pass", hashed)
+    wrong, _ = await helper.verify_and_update_async("other", hashed)
+
+    assert verified is True and updated is None
+    assert wrong is False
+    assert helper.stats()["completed"] == 3
+    assert helper.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_hash_runs_off_event_loop():
+    hasher = GatedHash()
+    helper = PooledPasswordHelper(max_workers=1, max_pending=4, password_hash=hasher)
+
+    task = asyncio.create_task(helper.hash_async("pw"))
+    # Цикл событий продолжает работать, пока поток пула занят
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+    assert not task.done()
+    assert helper.stats()["pending"] == 1
+
+    hasher.gate.set()
+    assert await task == "hashed:pw"
+    assert hasher.threads[0].startswith("password")
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_is_full():
+    hasher = GatedHash()
+    helper = PooledPasswordHelper(max_workers=1, max_pending=2, password_hash=hasher)
+
+    tasks = [asyncio.create_task(helper.hash_async(f"pw{i}")) for i in range(2)]
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(ServiceUnavailableError) as exc:
+        await helper.hash_async("overflow")
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"] == "1"
+
+    hasher.gate.set()
+    assert await asyncio.gather(*tasks) == ["hashed:pw0", "hashed:pw1"]
+    stats = helper.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+    assert stats["pending"] == 0
@@ -0,0 +1,81 @@
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from carmain.core.database import QueryStats, count_queries
+from carmain.core.middleware import QueryStatsMiddleware
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'q.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE item (id INTEGER)"))
+        await conn.execute(text("INSERT INTO item VALUES (1), (2), (3)"))
+    yield engine
+    await engine.dispose()
+
+
+async def select_items(engine, n_plus_one=False):
+    async with engine.connect() as conn:
+        ids = (await conn.execute(text("SELECT id FROM item"))).scalars().all()
+        if n_plus_one:
+            for item_id in ids:
+                await conn.execute(
+                    text("SELECT id FROM item WHERE id = :id"), {"id": item_id}
+                )
+
+
+@pytest.mark.asyncio
+async def test_count_queries_and_repeats(engine):
+    with count_queries() as stats:
+        await select_items(engine, n_plus_one=True)
+
+    assert stats.count == 4
+    assert stats.seconds > 0
+    assert stats.repeated(3) == [("SELECT id FROM item WHERE id = ?", 3)]
+    assert "x3: SELECT id FROM item WHERE id = ?" in stats.report()
+
+    # Вне блока запросы не считаются
+    await select_items(engine)
+    assert stats.count == 4
+
+
+@pytest.mark.max_queries(1, repeated=2)
+@pytest.mark.asyncio
+async def test_budget_marker_counts_test_body_only(engine):
+    await select_items(engine)
+
+
+def make_app(engine, **options):
+    app = FastAPI()
+
+    @app.get("/items")
+    async def items(n_plus_one: bool = False):
+        await select_items(engine, n_plus_one)
+        return {}
+
+    return QueryStatsMiddleware(app, **options)
+
+
+@pytest.mark.asyncio
+async def test_middleware_reports_queries_in_headers(engine):
+    transport = httpx.ASGITransport(app=make_app(engine, headers=True))
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        response = await client.get("/items", params={"n_plus_one": True})
+
+    assert response.headers["X-DB-Queries"] == "4"
+    assert float(response.headers["X-DB-Time-Ms"]) > 0
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+
+
+@pytest.mark.asyncio
+async def test_middleware_headers_off_by_default(engine):
+    transport = httpx.ASGITransport(app=make_app(engine))
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        response = await client.get("/items")
+
+    assert "X-DB-Queries" not in response.headers
@@ -0,0 +1,158 @@
+import asyncio
+import math
+import time
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import column, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from carmain.core import database
+from carmain.core.database import ReplicaSet, RoutingSession
+
+
+async def make_engine(path, label):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE origin (name TEXT)"))
+        await conn.execute(text(f"INSERT INTO origin VALUES ('{label}')"))
+    return engine
+
+
+@pytest_asyncio.fixture
+async def engines(tmp_path):
+    primary = await make_engine(tmp_path / "primary.db", "primary")
+    replica = await make_engine(tmp_path / "replica.db", "replica")
+    yield primary, replica
+    await primary.dispose()
+    await replica.dispose()
+
+
+def replica_set(replica, lag=0):
+    replicas = ReplicaSet([replica], max_lag=5.0, lag_check_interval=60.0)
+    replicas.lag_query = text(f"SELECT {lag}")
+    return replicas
+
+
+origin_table = table("origin", column("name"))
+
+
+async def origin(session, **options):
+    query = select(origin_table.c.name).limit(1).execution_options(**options)
+    return await session.scalar(query)
+
+
+def make_session(primary, replica):
+    session = AsyncSession(primary, sync_session_class=RoutingSession)
+    session.info.update(replica=replica, wrote=False)
+    return session
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_until_first_write(engines):
+    primary, replica = engines
+    async with make_session(primary, replica) as session:
+        assert await origin(session) == "replica"
+
+        await session.execute(text("INSERT INTO origin VALUES ('written')"))
+        assert session.info["wrote"] is True
+        assert await origin(session) == "primary"
+
+
+@pytest.mark.asyncio
+async def test_primary_option_and_no_replica(engines):
+    primary, replica = engines
+    async with make_session(primary, replica) as session:
+        assert await origin(session, primary=True) == "primary"
+        assert await origin(session) == "replica"
+
+    async with make_session(primary, None) as session:
+        assert await origin(session) == "primary"
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_is_skipped(engines):
+    _, replica = engines
+
+    fresh = replica_set(replica, lag=0)
+    await fresh.check_lag()
+    assert fresh.choose() is replica
+
+    stale = replica_set(replica, lag=30)
+    await stale.check_lag()
+    assert stale.choose() is None
+    assert stale.stats()["fallbacks"] == 1
+    assert stale.stats()["replicas"][0]["lag"] == 30
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_is_skipped(tmp_path):
+    broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/db.sqlite")
+    replicas = replica_set(broken)
+
+    await replicas.check_lag()
+    assert replicas.choose() is None
+    assert replicas.stats()["replicas"][0]["lag"] is None
+    await broken.dispose()
+
+
+@pytest.mark.asyncio
+async def test_choose_does_not_wait_for_lag_check(engines):
+    _, replica = engines
+    replicas = replica_set(replica)
+    probes = []
+
+    async def slow_lag(engine):
+        probes.append(engine)
+        await asyncio.sleep(0.05)
+        return 0.0
+
+    replicas._lag = slow_lag
+
+    # Ещё не проверенная реплика не выбирается, проверка идёт в фоне
+    assert replicas.choose() is None
+    assert replicas.choose() is None
+    await asyncio.sleep(0.1)
+    assert probes == [replica]
+    assert replicas.choose() is replica
+    assert probes == [replica]
+
+
+@pytest.mark.asyncio
+async def test_lag_probes_share_one_timeout():
+    replicas = ReplicaSet(
+        [create_async_engine("sqlite+aiosqlite://") for _ in range(3)],
+        lag_check_timeout=0.2,
+    )
+
+    async def lag(engine):
+        # Последняя реплика не отвечает дольше общего таймаута
+        await asyncio.sleep(0.15 if engine is not replicas.engines[-1] else 5)
+        return 1.0
+
+    replicas._lag = lag
+    started = time.monotonic()
+    await replicas.check_lag()
+
+    assert time.monotonic() - started < 0.4
+    assert replicas.lags == [1.0, 1.0, math.inf]
+
+
+def test_session_dependency_uses_replica_only_for_safe_methods(monkeypatch, engines):
+    _, replica = engines
+    replicas = replica_set(replica)
+    replicas.lags = [0.0]
+    replicas._checked_at = time.monotonic()
+    monkeypatch.setattr(database, "replicas", replicas)
+
+    app = FastAPI()
+
+    @app.api_route("/", methods=["GET", "POST"])
+    async def endpoint(session: AsyncSession = Depends(database.get_async_session)):
+        return {"replica": session.info["replica"] is not None}
+
+    client = TestClient(app)
+    assert client.get("/").json() == {"replica": True}
+    assert client.post("/").json() == {"replica": False}
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from carmain.core.templating import (
+    create_stream_env,
+    create_templates,
+    precompile,
+    stream_template,
+    templates,
+)
+
+
+def test_app_templates_precompile():
+    # Все шаблоны приложения компилируются; синтаксическая ошибка упадёт здесь
+    assert precompile(templates) == len(templates.env.list_templates(["html"]))
+
+
+def test_bytecode_cache_skips_compilation(tmp_path, monkeypatch):
+    source = tmp_path / "templates"
+    source.mkdir()
+    (source / "page.html").write_text("{{ value|tojson }}")
+    cache_dir = tmp_path / "cache"
+
+    first = create_templates(str(source), cache_dir=str(cache_dir))
+    assert precompile(first) == 1
+    assert list(cache_dir.iterdir())
+
+    # Новый процесс (новое окружение) берёт код шаблона из кэша на диске
+    second = create_templates(str(source), cache_dir=str(cache_dir))
+    monkeypatch.setattr(
+        second.env, "compile", lambda *args, **kwargs: pytest.fail("скомпилирован")
+    )
+    value = uuid.uuid4()
+    assert second.get_template("page.html").render(value=value) == f'"{value}"'
+
+
+def test_auto_reload_disabled_keeps_loaded_template(tmp_path):
+    (tmp_path / "page.html").write_text("old")
+    production = create_templates(str(tmp_path), auto_reload=False)
+    development = create_templates(str(tmp_path))
+    precompile(production)
+    precompile(development)
+
+    (tmp_path / "page.html").write_text("new")
+    os.utime(tmp_path / "page.html", (0, 0))
+
+    assert production.get_template("page.html").render() == "old"
+    assert development.get_template("page.html").render() == "new"
+
+
+@pytest.mark.asyncio
+async def test_stream_renders_while_rows_are_read(tmp_path, monkeypatch):
+    (tmp_path / "list.html").write_text(
+        "<ul>{% for row in rows %}<li>{{ row|tojson }}</li>{% endfor %}</ul>"
+    )
+    stream_env = create_stream_env(create_templates(str(tmp_path)))
+    monkeypatch.setattr("carmain.core.templating.stream_env", stream_env)
+    monkeypatch.setattr("carmain.core.templating.STREAM_CHUNK", 10)
+
+    read = []
+
+    async def rows():
+        for n in range(5):
+            read.append(n)
+            await asyncio.sleep(0)
+            yield n
+
+    response = stream_template("list.html", {"rows": rows()})
+    chunks = response.body_iterator
+    # Первый кусок уходит, когда прочитана только первая строка
+    assert await anext(chunks) == "<ul><li>0</li>"
+    assert read == [0]
+    rest = [chunk async for chunk in chunks]
+    assert "".join(rest) == "".join(f"<li>{n}</li>" for n in range(1, 5)) + "</ul>"
+
+
+def test_stream_env_keeps_own_bytecode_cache(tmp_path):
+    (tmp_path / "page.html").write_text("{{ value|tojson }}")
+    cache_dir = tmp_path / "cache"
+    sync = create_templates(str(tmp_path), cache_dir=str(cache_dir))
+    precompile(sync)
+
+    # Асинхронный код шаблона не смешивается с синхронным в одном кэше
+    stream_env = create_stream_env(sync, str(cache_dir))
+    template = stream_env.get_template("page.html")
+    assert asyncio.run(template.render_async(value=1)) == "1"
+    assert (cache_dir / "async").is_dir()
+    assert sync.get_template("page.html").render(value=2) == "2"
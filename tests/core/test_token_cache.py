@@ -0,0 +1,162 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from carmain.core.config import get_settings
+from carmain.core.token_cache import (
+    LOCAL_TOKEN_CACHE_MAX_TTL,
+    MemoryTokenCacheBackend,
+    RespTokenCacheBackend,
+    TokenCache,
+    create_token_cache,
+)
+from carmain.schemas.user_schema import UserPrincipal
+
+
+def make_principal(user_id=1, **flags):
+    return UserPrincipal(
+        id=user_id,
+        email=f"user{user_id}@example.com",
+        is_active=flags.get("is_active", True),
+        is_superuser=flags.get("is_superuser", False),
+        is_verified=flags.get("is_verified", True),
+    )
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_hits_misses_and_invalidation():
+    cache = TokenCache(MemoryTokenCacheBackend(maxsize=10), ttl=60)
+    assert await cache.get("a") is None
+
+    await cache.put("a", make_principal(1))
+    await cache.put("b", make_principal(1))
+    await cache.put("c", make_principal(2))
+    assert (await cache.get("a")).id == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "errors": 0}
+
+    await cache.invalidate("a")
+    assert await cache.get("a") is None
+
+    await cache.invalidate_user(1)
+    assert await cache.get("b") is None
+    assert (await cache.get("c")).id == 2
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_lru_and_expiry():
+    backend = MemoryTokenCacheBackend(maxsize=2)
+    cache = TokenCache(backend, ttl=60)
+    await cache.put("a", make_principal(1))
+    await cache.put("b", make_principal(2))
+    await cache.get("a")
+    await cache.put("c", make_principal(3))
+    # Вытеснена самая давно использованная запись
+    assert len(backend) == 2
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+
+    # Истёкший токен в кэш не попадает, срок записи ограничен сроком токена
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await cache.put("d", make_principal(4), expires_at=past)
+    assert await cache.get("d") is None
+
+    await backend.set("e", 5, "{}", ttl=0.01)
+    await asyncio.sleep(0.02)
+    assert await backend.get("e") is None
+
+
+class RespStandIn:
+    """Минимальный сервер с протоколом Redis для проверки клиента"""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    async def handle(self, reader, writer):
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            args = []
+            for _ in range(int(header[1:])):
+                size = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(size + 2))[:-2].decode())
+            self.commands.append(args[0])
+            writer.write(self.execute(*args))
+            await writer.drain()
+        writer.close()
+
+    def execute(self, command, *args):
+        if command == "GET":
+            value = self.data.get(args[0])
+            return b"$-1\r\n" if value is None else self.bulk(value)
+        if command == "SET":
+            self.data[args[0]] = args[1]
+            return b"+OK\r\n"
+        if command == "SADD":
+            self.data.setdefault(args[0], set()).add(args[1])
+            return b":1\r\n"
+        if command == "SMEMBERS":
+            members = self.data.get(args[0], set())
+            return b"*%d\r\n" % len(members) + b"".join(map(self.bulk, members))
+        if command == "PTTL":
+            return b":-1\r\n"
+        if command == "PEXPIRE":
+            return b":1\r\n"
+        if command == "DEL":
+            removed = sum(self.data.pop(key, None) is not None for key in args)
+            return b":%d\r\n" % removed
+        return b"-ERR unknown command\r\n"
+
+    @staticmethod
+    def bulk(value):
+        data = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+@pytest.mark.asyncio
+async def test_resp_backend_shared_between_caches():
+    stand_in = RespStandIn()
+    server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"redis://127.0.0.1:{port}/0"
+    try:
+        worker_a = TokenCache(RespTokenCacheBackend(url), ttl=60)
+        worker_b = TokenCache(RespTokenCacheBackend(url), ttl=60)
+
+        await worker_a.put("tok", make_principal(7))
+        assert (await worker_b.get("tok")).id == 7
+
+        # Деактивация пользователя видна всем воркерам
+        await worker_b.invalidate_user(7)
+        assert await worker_a.get("tok") is None
+        assert "tok" not in str(stand_in.data)
+        await worker_a.backend.close()
+        await worker_b.backend.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_unavailable_backend_is_a_miss():
+    cache = TokenCache(RespTokenCacheBackend("redis://127.0.0.1:1/0"), ttl=60)
+    await cache.put("tok", make_principal(1))
+    assert await cache.get("tok") is None
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["errors"] == 2
+
+
+def test_local_cache_ttl_is_capped(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "token_cache_ttl", 60.0)
+    monkeypatch.setattr(settings, "token_cache_url", None)
+    local = create_token_cache()
+    assert isinstance(local.backend, MemoryTokenCacheBackend)
+    assert local.ttl == LOCAL_TOKEN_CACHE_MAX_TTL
+
+    monkeypatch.setattr(settings, "token_cache_url", "redis://127.0.0.1:6379/0")
+    shared = create_token_cache()
+    assert isinstance(shared.backend, RespTokenCacheBackend)
+    assert shared.ttl == 60.0
@@ -0,0 +1,116 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from carmain.core.database import Base, RoutingSession, SessionManager
+from carmain.models.items import MaintenanceItem
+from carmain.repository.version_repository import (
+    DataVersionRepository,
+    user_scope,
+)
+
+
+@pytest_asyncio.fixture
+async def manager(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'uow.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(
+        engine,
+        expire_on_commit=False,
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        autoflush=False,
+    )
+    manager = SessionManager(session_maker)
+    manager.commits = 0
+
+    @event.listens_for(RoutingSession, "after_commit")
+    def count_commit(session):
+        manager.commits += 1
+
+    yield manager
+    event.remove(RoutingSession, "after_commit", count_commit)
+    await engine.dispose()
+
+
+async def count_items(manager):
+    async with manager.unit_of_work() as session:
+        return await session.scalar(select(func.count(MaintenanceItem.id)))
+
+
+@pytest.mark.asyncio
+async def test_single_commit_at_end_of_unit(manager):
+    async with manager.unit_of_work() as session:
+        session.add(MaintenanceItem(name="Oil", default_interval=5000))
+        await session.flush()
+        session.add(MaintenanceItem(name="Brakes", default_interval=20000))
+        await session.flush()
+        assert manager.commits == 0
+
+    assert manager.commits == 1
+    assert await count_items(manager) == 2
+
+
+@pytest.mark.asyncio
+async def test_read_only_unit_does_not_commit(manager):
+    assert await count_items(manager) == 0
+    assert manager.commits == 0
+
+
+@pytest.mark.asyncio
+async def test_version_check_is_read_only(manager):
+    # Проверка ETag (UNION версий пользователя и справочника) — чтение:
+    # запрос остаётся на реплике, и пустая транзакция не коммитится
+    async with manager.unit_of_work() as session:
+        versions = await DataVersionRepository(session).get_versions(
+            user_scope(1), catalog=True
+        )
+        assert session.info["wrote"] is False
+
+    assert versions[user_scope(1)] == 0
+    assert manager.commits == 0
+
+
+@pytest.mark.asyncio
+async def test_error_rolls_back_whole_unit(manager):
+    with pytest.raises(RuntimeError):
+        async with manager.unit_of_work() as session:
+            session.add(MaintenanceItem(name="Oil", default_interval=5000))
+            await session.flush()
+            raise RuntimeError("boom")
+
+    assert manager.commits == 0
+    assert await count_items(manager) == 0
+
+
+@pytest.mark.asyncio
+async def test_nested_unit_joins_outer_transaction(manager):
+    async with manager.unit_of_work() as outer:
+        async with manager.unit_of_work() as inner:
+            assert inner is outer
+            inner.add(MaintenanceItem(name="Oil", default_interval=5000))
+        # Вложенная единица работы не коммитит и не закрывает сессию
+        assert manager.commits == 0
+        assert outer.new
+
+    assert manager.commits == 1
+    assert await count_items(manager) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_session_outlives_unit_of_work(manager):
+    async with manager.unit_of_work() as session:
+        session.add(MaintenanceItem(name="Oil", default_interval=5000))
+
+    # Тело потокового ответа читает после того, как единица работы закрыта,
+    # и его сессия не занимает место сессии задачи
+    async with manager.stream_session() as stream:
+        assert not manager.session_factory.registry.has()
+        names = [
+            item.name
+            async for item in await stream.stream_scalars(select(MaintenanceItem))
+        ]
+    assert names == ["Oil"]
+    assert manager.commits == 1
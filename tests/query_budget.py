@@ -0,0 +1,52 @@
+"""
+Бюджет SQL-запросов для тестов.
+
+    @pytest.mark.max_queries(3)
+    async def test_garage(...): ...
+
+Тест падает, если его тело выполнило больше 3 SQL-запросов. Запросы фикстур
+в счёт не входят. В сообщении об ошибке запросы сгруппированы по тексту,
+поэтому N+1 виден сразу. С repeated=N тест падает и тогда, когда один и тот
+же запрос выполнен N раз или больше, даже если общий бюджет не превышен.
+
+Маршруты проверяются так же через httpx.AsyncClient с ASGITransport:
+приложение выполняется в контексте теста. Для точечных проверок внутри
+теста есть carmain.core.database.count_queries().
+"""
+
+import pytest
+
+from carmain.core.database import count_queries
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "max_queries(n, repeated=None): верхняя граница числа SQL-запросов теста",
+    )
+
+
+# Счётчик ставится на фазу call, а не в pytest_pyfunc_call: pytest-asyncio
+# копирует контекст для теста раньше, в runtest
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("max_queries")
+    if marker is None:
+        return (yield)
+
+    with count_queries() as stats:
+        result = yield
+
+    limit = marker.args[0] if marker.args else marker.kwargs["n"]
+    if stats.count > limit:
+        pytest.fail(
+            f"Превышен бюджет SQL-запросов: {stats.count} > {limit}\n{stats.report()}",
+            pytrace=False,
+        )
+    repeated_limit = marker.kwargs.get("repeated")
+    if repeated_limit is not None and stats.repeated(repeated_limit):
+        pytest.fail(
+            f"Запрос повторяется {repeated_limit}+ раз (N+1)\n{stats.report()}",
+            pytrace=False,
+        )
+    return result
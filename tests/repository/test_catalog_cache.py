@@ -0,0 +1,102 @@
+import pytest
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from carmain.core.database import Base
+from carmain.models.items import CatalogVersion, MaintenanceItem
+from carmain.repository import catalog_cache as catalog_cache_module
+from carmain.repository.catalog_cache import CatalogCache
+from carmain.repository.maintenance_repository import MaintenanceRepository
+
+
+@pytest.fixture
+async def session(tmp_path):
+    db_file = tmp_path / "test.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}", echo=False)
+    async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_reused_until_version_changes(session):
+    cache = CatalogCache(check_interval=0)
+    oil = MaintenanceItem(name="Oil", default_interval=5000)
+    session.add(oil)
+    await session.commit()
+
+    first = await cache.snapshot(session)
+    assert [item.name for item in first.items] == ["Oil"]
+    assert first.by_id[oil.id].default_interval == 5000
+    with pytest.raises(AttributeError):
+        first.items[0].name = "Changed"
+
+    # Версия не менялась: тот же снимок, справочник не перечитывается
+    assert await cache.snapshot(session) is first
+
+    # Другой воркер изменил справочник и увеличил версию
+    await session.execute(
+        update(MaintenanceItem.__table__)
+        .where(MaintenanceItem.id == oil.id)
+        .values(default_interval=7000)
+    )
+    await session.execute(
+        update(CatalogVersion.__table__).values(version=CatalogVersion.version + 1)
+    )
+    await session.commit()
+
+    second = await cache.snapshot(session)
+    assert second is not first
+    assert second.by_id[oil.id].default_interval == 7000
+
+
+@pytest.mark.asyncio
+async def test_check_interval_defers_version_check(session):
+    cache = CatalogCache(check_interval=3600)
+    session.add(MaintenanceItem(name="Oil", default_interval=5000))
+    await session.commit()
+
+    first = await cache.snapshot(session)
+    await session.execute(
+        update(CatalogVersion.__table__).values(version=CatalogVersion.version + 1)
+    )
+    await session.commit()
+    assert await cache.snapshot(session) is first
+
+    cache.invalidate()
+    assert await cache.snapshot(session) is not first
+
+
+@pytest.mark.asyncio
+async def test_repository_write_invalidates_cache(session, monkeypatch):
+    cache = CatalogCache(check_interval=3600)
+    monkeypatch.setattr(catalog_cache_module, "catalog_cache", cache)
+    repo = MaintenanceRepository(session)
+    repo.catalog_cache = cache
+
+    session.add(MaintenanceItem(name="Oil", default_interval=5000))
+    await session.commit()
+    assert len(await repo.get_maintenance_items()) == 1
+
+    # Коммит изменений справочника в этом процессе сбрасывает кэш сразу
+    await repo.create(MaintenanceItem(name="Brake fluid", default_interval=40000))
+
+    names = [item.name for item in await repo.get_maintenance_items()]
+    assert names == ["Brake fluid", "Oil"]
+
+
+@pytest.mark.asyncio
+async def test_catalog_version_row_seeded_and_bumped(session):
+    assert await session.scalar(select(CatalogVersion.version)) == 1
+
+    session.add(MaintenanceItem(name="Oil", default_interval=5000))
+    await session.commit()
+    session.add(MaintenanceItem(name="Brakes", default_interval=20000))
+    await session.commit()
+
+    rows = (await session.execute(select(CatalogVersion))).scalars().all()
+    assert [(row.id, row.version) for row in rows] == [(1, 3)]
@@ -3,18 +3,22 @@ from datetime import datetime, timedelta
 
 import pytest
 
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from carmain.core.database import Base
+from carmain.core.database import Base, count_queries
 from carmain.repository.maintenance_repository import (
     MaintenanceRepository,
     UserMaintenanceRepository,
+    due_query,
 )
 from carmain.models.items import MaintenanceItem, UserMaintenanceItem
 from carmain.models.records import ServiceRecord
 from carmain.models.vehicles import Vehicle
 from carmain.core.exceptions import NotFoundError
+from carmain.schemas.maintenance_schema import MaintenanceCategory
 
 
 @pytest.fixture
@@ -50,6 +54,116 @@ async def test_get_maintenance_items_and_item(session):
     assert missing is None
 
 
+@pytest.mark.asyncio
+async def test_get_maintenance_items_search_and_category(session):
+    repo = MaintenanceRepository(session)
+    session.add_all(
+        [
+            MaintenanceItem(name="Engine oil filter", default_interval=5000),
+            MaintenanceItem(name="Brake pads", default_interval=20000),
+            MaintenanceItem(name="Cabin 100%_filter", default_interval=15000),
+            MaintenanceItem(name="Тормозные колодки", default_interval=15000),
+        ]
+    )
+    await session.commit()
+
+    found = await repo.get_maintenance_items(q="FILTER")
+    assert [it.name for it in found] == ["Cabin 100%_filter", "Engine oil filter"]
+
+    literal_wildcards = await repo.get_maintenance_items(q="%_")
+    assert [it.name for it in literal_wildcards] == ["Cabin 100%_filter"]
+
+    brakes = await repo.get_maintenance_items(category=MaintenanceCategory.BRAKES)
+    assert [it.name for it in brakes] == ["Тормозные колодки"]
+    assert brakes[0].category == "brakes"
+
+    everything = await repo.get_maintenance_items(category=MaintenanceCategory.ALL)
+    assert len(everything) == 4
+
+
+@pytest.mark.asyncio
+async def test_category_filter_uses_single_stored_category(session):
+    repo = MaintenanceRepository(session)
+    session.add_all(
+        [
+            MaintenanceItem(name="Масляный фильтр", default_interval=6000),
+            MaintenanceItem(name="Масло моторное", default_interval=6000),
+        ]
+    )
+    await session.commit()
+
+    # До хранимой категории масляный фильтр находился и в "Двигателе"
+    engine = await repo.get_maintenance_items(category=MaintenanceCategory.ENGINE)
+    assert [it.name for it in engine] == ["Масло моторное"]
+    filters = await repo.get_maintenance_items(category=MaintenanceCategory.FILTERS)
+    assert [it.name for it in filters] == ["Масляный фильтр"]
+
+
+@pytest.mark.asyncio
+async def test_classification_is_stored_on_write(session):
+    repo = MaintenanceRepository(session)
+    item = MaintenanceItem(name="Воздушный фильтр", default_interval=15000)
+    session.add(item)
+    await session.commit()
+
+    stored = await repo.get_maintenance_item(item.id)
+    assert (stored.type, stored.icon, stored.category) == (
+        "air_filter",
+        "filter",
+        "filters",
+    )
+
+    item.name = "Тормозные колодки"
+    await session.commit()
+    row = (
+        await session.execute(
+            select(MaintenanceItem.type, MaintenanceItem.icon, MaintenanceItem.category)
+        )
+    ).one()
+    assert tuple(row) == ("brake_pads", "exclamation-circle", "brakes")
+
+
+@pytest.mark.asyncio
+async def test_directory_marks_tracked_items_in_one_query(session):
+    repo = MaintenanceRepository(session)
+    oil = MaintenanceItem(name="Масляный фильтр", default_interval=10000)
+    pads = MaintenanceItem(name="Тормозные колодки", default_interval=30000)
+    belt = MaintenanceItem(name="Ремень ГРМ", default_interval=60000)
+    vehicle = Vehicle(user_id=1, brand="A", model="B", year=2020, odometer=1000)
+    other = Vehicle(user_id=2, brand="C", model="D", year=2020, odometer=1000)
+    session.add_all([oil, pads, belt, vehicle, other])
+    await session.flush()
+    session.add_all(
+        [
+            # Дубль отслеживания не должен размножать строку справочника
+            UserMaintenanceItem(user_id=1, item_id=oil.id, vehicle_id=vehicle.id),
+            UserMaintenanceItem(user_id=1, item_id=oil.id, vehicle_id=vehicle.id),
+            UserMaintenanceItem(user_id=2, item_id=pads.id, vehicle_id=other.id),
+        ]
+    )
+    await session.commit()
+
+    with count_queries() as stats:
+        directory = await repo.get_directory(vehicle.id)
+    assert stats.count == 1
+    assert [(it.name, it.is_tracked) for it in directory] == [
+        ("Масляный фильтр", True),
+        ("Ремень ГРМ", False),
+        ("Тормозные колодки", False),
+    ]
+    assert directory[0].icon == "oil-can"
+    assert directory[0].category == "filters"
+
+    tracked = await repo.get_directory(vehicle.id, tracked_only=True)
+    assert [it.name for it in tracked] == ["Масляный фильтр"]
+
+    brakes = await repo.get_directory(other.id, category=MaintenanceCategory.BRAKES)
+    assert [(it.name, it.is_tracked) for it in brakes] == [("Тормозные колодки", True)]
+
+    page = await repo.get_directory(vehicle.id, q="е", skip=1, limit=1)
+    assert [it.name for it in page] == ["Тормозные колодки"]
+
+
 @pytest.mark.asyncio
 async def test_user_maintenance_items_and_count(session):
     repo = MaintenanceRepository(session)
@@ -174,6 +288,265 @@ async def test_get_maintenance_items_requiring_service(session):
     assert umi_ok.id not in ids
 
 
+@pytest.mark.asyncio
+async def test_get_vehicle_maintenance_due(session):
+    user_id = 4
+
+    mitem = MaintenanceItem(name="Oil Change", default_interval=5000)
+    vehicle = Vehicle(
+        user_id=user_id, brand="Test", model="Y", year=2021, odometer=10000
+    )
+    session.add_all([mitem, vehicle])
+    await session.commit()
+
+    def tracked(last_odometer, custom_interval=None):
+        return UserMaintenanceItem(
+            user_id=user_id,
+            item_id=mitem.id,
+            vehicle_id=vehicle.id,
+            custom_interval=custom_interval,
+            last_service_odometer=last_odometer,
+        )
+
+    umi_never = tracked(None)
+    umi_overdue = tracked(3000)  # diff = 7000, превышение 2000
+    umi_upcoming = tracked(5300)  # diff = 4700, осталось 300
+    umi_ok = tracked(8000)  # diff = 2000, осталось 3000
+    umi_custom = tracked(8000, custom_interval=1000)  # превышение 1000
+    session.add_all([umi_never, umi_overdue, umi_upcoming, umi_ok, umi_custom])
+    await session.commit()
+
+    repo = MaintenanceRepository(session)
+    rows, cursor, total = await repo.get_vehicle_maintenance_due_page(
+        user_id, vehicle.id
+    )
+
+    assert cursor is None
+    assert total == 4
+    assert [row.id for row in rows] == [
+        umi_never.id,
+        umi_overdue.id,
+        umi_custom.id,
+        umi_upcoming.id,
+    ]
+    by_id = {row.id: row for row in rows}
+    assert by_id[umi_never.id].status == "never_serviced"
+    assert by_id[umi_never.id].overdue_km is None
+    assert by_id[umi_never.id].remaining_km is None
+    assert by_id[umi_overdue.id].status == "overdue"
+    assert by_id[umi_overdue.id].overdue_km == 2000
+    assert by_id[umi_custom.id].overdue_km == 1000
+    assert by_id[umi_upcoming.id].status == "upcoming"
+    assert by_id[umi_upcoming.id].remaining_km == 300
+    assert by_id[umi_upcoming.id].name == "Oil Change"
+    assert by_id[umi_upcoming.id].default_interval == 5000
+
+    everything, _, total = await repo.get_vehicle_maintenance_due_page(
+        user_id, vehicle.id, show_all=True
+    )
+    assert len(everything) == total == 5
+    ok_row = next(row for row in everything if row.id == umi_ok.id)
+    assert ok_row.status == "ok"
+    assert ok_row.remaining_km == 3000
+
+    foreign, cursor, total = await repo.get_vehicle_maintenance_due_page(
+        user_id + 1, vehicle.id
+    )
+    assert foreign == []
+    assert total == 0
+    assert cursor is None
+
+
+@pytest.mark.asyncio
+async def test_get_vehicle_maintenance_due_page(session):
+    user_id = 7
+
+    mitem = MaintenanceItem(name="Coolant", default_interval=1000)
+    vehicle = Vehicle(user_id=user_id, brand="K", model="S", year=2022, odometer=10000)
+    session.add_all([mitem, vehicle])
+    await session.commit()
+
+    items = [
+        UserMaintenanceItem(
+            user_id=user_id,
+            item_id=mitem.id,
+            vehicle_id=vehicle.id,
+            last_service_odometer=last,
+        )
+        for last in (None, None, None, 1000, 2000, 2000, 5000, 9500)
+    ]
+    session.add_all(items)
+    await session.commit()
+
+    repo = MaintenanceRepository(session)
+    expected, _, _ = await repo.get_vehicle_maintenance_due_page(
+        user_id, vehicle.id, limit=100
+    )
+    assert len(expected) == 7  # 9500 + 1000 > 10000, в норме
+
+    seen = []
+    cursor = None
+    while True:
+        # Каждая порция — один запрос вместе с количеством, без догрузки
+        # связей по строкам
+        with count_queries() as stats:
+            page, cursor, total = await repo.get_vehicle_maintenance_due_page(
+                user_id, vehicle.id, cursor, limit=2
+            )
+        assert stats.count == 1
+        # Количество — строки от курсора до конца списка
+        assert total == len(expected) - len(seen)
+        seen.extend(page)
+        if cursor is None:
+            break
+
+    assert [row.id for row in seen] == [row.id for row in expected]
+    assert [row.status for row in seen] == [row.status for row in expected]
+
+    # Поток после первой порции продолжает тот же порядок
+    first, cursor, _ = await repo.get_vehicle_maintenance_due_page(
+        user_id, vehicle.id, limit=2
+    )
+    rest = [row async for row in repo.stream(due_query(user_id, vehicle.id, cursor), 3)]
+    assert [row.id for row in first + rest] == [row.id for row in expected]
+
+
+@pytest.mark.asyncio
+async def test_get_due_counts_by_vehicle(session):
+    user_id = 5
+
+    mitem = MaintenanceItem(name="Air Filter", default_interval=5000)
+    vehicle_a = Vehicle(user_id=user_id, brand="A", model="1", year=2019, odometer=9000)
+    vehicle_b = Vehicle(user_id=user_id, brand="B", model="2", year=2020, odometer=1000)
+    vehicle_c = Vehicle(user_id=user_id, brand="C", model="3", year=2021, odometer=0)
+    session.add_all([mitem, vehicle_a, vehicle_b, vehicle_c])
+    await session.commit()
+
+    session.add_all(
+        [
+            # a: никогда не обслуживалось + просрочено + в норме
+            UserMaintenanceItem(
+                user_id=user_id, item_id=mitem.id, vehicle_id=vehicle_a.id
+            ),
+            UserMaintenanceItem(
+                user_id=user_id,
+                item_id=mitem.id,
+                vehicle_id=vehicle_a.id,
+                last_service_odometer=1000,
+            ),
+            UserMaintenanceItem(
+                user_id=user_id,
+                item_id=mitem.id,
+                vehicle_id=vehicle_a.id,
+                last_service_odometer=8000,
+            ),
+            # b: только никогда не обслуживавшийся
+            UserMaintenanceItem(
+                user_id=user_id, item_id=mitem.id, vehicle_id=vehicle_b.id
+            ),
+            # c: всё в норме
+            UserMaintenanceItem(
+                user_id=user_id,
+                item_id=mitem.id,
+                vehicle_id=vehicle_c.id,
+                last_service_odometer=0,
+            ),
+        ]
+    )
+    await session.commit()
+
+    repo = MaintenanceRepository(session)
+    counts = await repo.get_due_counts_by_vehicle(user_id)
+    assert counts == {vehicle_a.id: 2, vehicle_b.id: 1}
+
+    only_b = await repo.get_due_counts_by_vehicle(user_id, [vehicle_b.id])
+    assert only_b == {vehicle_b.id: 1}
+
+    assert await repo.get_due_counts_by_vehicle(user_id + 1) == {}
+
+
+@pytest.mark.asyncio
+async def test_next_due_odometer_maintained(session):
+    mitem = MaintenanceItem(name="Spark Plugs", default_interval=10000)
+    session.add(mitem)
+    await session.commit()
+
+    um_repo = UserMaintenanceRepository(session)
+    umi = await um_repo.create(
+        UserMaintenanceItem(user_id=6, item_id=mitem.id, vehicle_id=uuid.uuid4())
+    )
+    assert umi.next_due_odometer is None
+    assert umi.next_warning_odometer is None
+
+    umi = await um_repo.update_by_id(umi.id, {"last_service_odometer": 20000})
+    assert umi.next_due_odometer == 30000
+    assert umi.next_warning_odometer == 29000
+
+    umi = await um_repo.update_by_id(umi.id, {"custom_interval": 5000})
+    assert umi.next_due_odometer == 25000
+    assert umi.next_warning_odometer == 24500
+
+    umi = await um_repo.update_by_id(umi.id, {"custom_interval": None})
+    mitem.default_interval = 15000
+    await session.commit()
+    await session.refresh(umi)
+    assert umi.next_due_odometer == 35000
+    assert umi.next_warning_odometer == 33500
+
+
+@pytest.mark.asyncio
+async def test_mark_serviced(session):
+    user_id = 7
+    mitem = MaintenanceItem(name="Oil", default_interval=10000)
+    vehicle = Vehicle(
+        user_id=user_id, brand="Test", model="X", year=2020, odometer=42000
+    )
+    session.add_all([mitem, vehicle])
+    await session.commit()
+    umi = UserMaintenanceItem(user_id=user_id, item_id=mitem.id, vehicle_id=vehicle.id)
+    session.add(umi)
+    await session.commit()
+
+    repo = MaintenanceRepository(session)
+
+    async def state():
+        row = (
+            await session.execute(
+                select(
+                    UserMaintenanceItem.last_service_date,
+                    UserMaintenanceItem.last_service_odometer,
+                    UserMaintenanceItem.next_due_odometer,
+                    UserMaintenanceItem.next_warning_odometer,
+                ).where(UserMaintenanceItem.id == umi.id)
+            )
+        ).one()
+        return tuple(row)
+
+    # Пробег не указан — берётся пробег автомобиля
+    june = datetime(2025, 6, 1)
+    serviced = await repo.mark_serviced(user_id, umi.id, june, None, "Замена")
+    assert serviced.id == umi.id
+    assert serviced.vehicle_id == vehicle.id
+    assert serviced.name == "Oil"
+    assert serviced.service_odometer == 42000
+    assert serviced.advanced is True
+    assert await state() == (june, 42000, 52000, 51000)
+
+    # Запись задним числом сохраняется, но последнее обслуживание не трогает
+    back_dated = await repo.mark_serviced(
+        user_id, umi.id, datetime(2025, 1, 1), 30000, "Старая"
+    )
+    assert back_dated.advanced is False
+    assert await state() == (june, 42000, 52000, 51000)
+
+    records = await repo.get_service_records(umi.id)
+    assert sorted(r.service_odometer for r in records) == [30000, 42000]
+
+    # Чужой элемент: ничего не записывается
+    assert await repo.mark_serviced(user_id + 1, umi.id, june, 50000, "x") is None
+    assert len(await repo.get_service_records(umi.id)) == 2
+
+
 @pytest.mark.asyncio
 async def test_user_repository_getters(session):
     um_repo = UserMaintenanceRepository(session)
@@ -209,8 +582,47 @@ async def test_user_repository_getters(session):
     empty = await um_repo.get_by_vehicle(uuid.uuid4())
     assert empty == []
 
+    assert await um_repo.get_item_ids_by_vehicle(vehicle_a) == {
+        umi_a1.item_id,
+        umi_a2.item_id,
+    }
+
     found = await um_repo.get_by_item_id(umi_b.item_id)
     assert found.id == umi_b.id
 
     with pytest.raises(NotFoundError):
         await um_repo.get_by_item_id(uuid.uuid4())
+
+
+@pytest.mark.asyncio
+async def test_loader_profiles(session):
+    um_repo = UserMaintenanceRepository(session)
+    vehicle = Vehicle(user_id=1, brand="B", model="M", year=2020, odometer=1000)
+    item = MaintenanceItem(name="Oil", default_interval=5000)
+    session.add_all([vehicle, item])
+    await session.flush()
+    umi = UserMaintenanceItem(user_id=1, item_id=item.id, vehicle_id=vehicle.id)
+    session.add(umi)
+    await session.commit()
+    session.expunge_all()
+
+    # Без профиля связи не загружаются и не подгружаются скрыто
+    plain = await um_repo.get_by_id(umi.id)
+    with pytest.raises(InvalidRequestError):
+        plain.vehicle
+    session.expunge_all()
+
+    card = await um_repo.get_by_id(umi.id, profile="card")
+    assert card.vehicle.odometer == 1000
+    assert card.maintenance_item.name == "Oil"
+
+    # Обновление сохраняет загруженные профилем связи
+    updated = await um_repo.update_by_id(umi.id, {"custom_interval": 3000})
+    assert updated.next_due_odometer is None
+    assert updated.vehicle.odometer == 1000
+
+    with pytest.raises(ValueError):
+        await um_repo.get_by_id(umi.id, profile="unknown")
+
+    await um_repo.delete_by_id(umi.id)
+    assert await um_repo.get_by_vehicle(vehicle.id) == []
@@ -7,8 +7,11 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from carmain.core.database import Base
 from carmain.models.records import ServiceRecord
-from carmain.repository.record_repository import ServiceRecordRepository
-from carmain.core.exceptions import NotFoundError
+from carmain.repository.record_repository import (
+    ServiceRecordRepository,
+    history_query,
+)
+from carmain.core.exceptions import NotFoundError, ValidationError
 
 
 @pytest.fixture
@@ -61,7 +64,7 @@ async def test_get_by_user_item_id_and_all(session):
     assert len(recs_skip) == len(recs_uid1)
     assert {r.comment for r in recs_skip} == comments
 
-    eager_recs = await repo.get_by_user_item_id(uid1, eager=True)
+    eager_recs = await repo.get_by_user_item_id(uid1, profile="admin")
     assert len(eager_recs) == 2
 
     no_recs = await repo.get_by_user_item_id(uuid.uuid4())
@@ -85,7 +88,7 @@ async def test_crud_operations(session):
     assert found.comment == "CreateTest"
 
     with pytest.raises(NotFoundError):
-        await repo.get_by_id(str(uuid.uuid4()))
+        await repo.get_by_id(uuid.uuid4())
 
     updated = await repo.update_by_id(created.id, {"comment": "Updated"})
     assert updated.comment == "Updated"
@@ -96,3 +99,79 @@ async def test_crud_operations(session):
     assert deleted.id == created.id
     with pytest.raises(NotFoundError):
         await repo.get_by_id(created.id)
+
+
+@pytest.mark.asyncio
+async def test_get_page_by_user_item_id(session):
+    repo = ServiceRecordRepository(session)
+    uid = uuid.uuid4()
+    base = datetime(2025, 1, 1)
+    records = [
+        ServiceRecord(
+            user_item_id=uid,
+            service_date=base + timedelta(days=i // 2),  # по две записи на дату
+            service_odometer=1000 * i,
+            comment=f"Rec{i}",
+        )
+        for i in range(5)
+    ]
+    session.add_all(records)
+    session.add(
+        ServiceRecord(
+            user_item_id=uuid.uuid4(),
+            service_date=base,
+            service_odometer=1,
+            comment="Other",
+        )
+    )
+    await session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = await repo.get_page_by_user_item_id(uid, cursor, limit=2)
+        seen.extend(page)
+        if cursor is None:
+            break
+        assert len(page) == 2
+
+    assert len(seen) == 5
+    assert len({r.id for r in seen}) == 5
+    keys = [(r.service_date, str(r.id)) for r in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    empty, cursor = await repo.get_page_by_user_item_id(uuid.uuid4())
+    assert empty == []
+    assert cursor is None
+
+    with pytest.raises(ValidationError):
+        await repo.get_page_by_user_item_id(uid, "not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_stream_history_after_cursor(session):
+    repo = ServiceRecordRepository(session)
+    uid = uuid.uuid4()
+    base = datetime(2025, 1, 1)
+    session.add_all(
+        ServiceRecord(
+            user_item_id=uid,
+            service_date=base + timedelta(days=i),
+            service_odometer=100 * i,
+        )
+        for i in range(7)
+    )
+    await session.commit()
+
+    first, cursor = await repo.get_page_by_user_item_id(uid, limit=2)
+    # Остаток после первой страницы читается порциями по batch строк
+    rest = [
+        record
+        async for record in repo.stream_scalars(history_query(uid, cursor), batch=2)
+    ]
+    everything, _ = await repo.get_page_by_user_item_id(uid, limit=100)
+    assert [r.id for r in first + rest] == [r.id for r in everything]
+
+    # Курсор проверяется при построении запроса, до чтения строк
+    with pytest.raises(ValidationError):
+        history_query(uid, "not-a-cursor")
@@ -1,12 +1,16 @@
 import uuid
+from datetime import datetime, timedelta, timezone
+
 import pytest
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from carmain.core.database import Base
+from carmain.models.auth import AccessToken
 from carmain.models.users import User
 from carmain.repository.user_repository import UserRepository
 from carmain.schemas.auth_schema import SignIn
+from carmain.schemas.user_schema import UserPrincipal
 from carmain.core.exceptions import NotFoundError, DuplicatedError
 
 
@@ -91,4 +95,35 @@ async def test_create_duplicate(session):
 
     user2 = User(email="dup@example.com", hashed_password="pwd2")
     with pytest.raises(DuplicatedError):
-        await repo.create(user2)
\ No newline at end of file
+        await repo.create(user2)
+
+    # Откатилась только неудачная вставка: прежние изменения транзакции
+    # остаются и коммитятся
+    other = await repo.create(User(email="other@example.com", hashed_password="p"))
+    await session.commit()
+    emails = sorted(user.email for user in await repo.all())
+    assert emails == ["dup@example.com", "other@example.com"]
+    assert other.id != created1.id
+
+@pytest.mark.asyncio
+async def test_get_principal_and_by_token(session):
+    repo = UserRepository(session)
+    user = User(email="principal@example.com", hashed_password="pwd", is_verified=True)
+    session.add(user)
+    await session.flush()
+    session.add(AccessToken(token="tok", user_id=user.id))
+    await session.commit()
+
+    principal = await repo.get_principal(user.id)
+    assert isinstance(principal, UserPrincipal)
+    assert principal.email == "principal@example.com"
+    assert principal.is_active and principal.is_verified
+    assert await repo.get_principal(user.id + 1) is None
+
+    by_token = await repo.get_principal_by_token("tok")
+    assert by_token == principal
+    assert await repo.get_principal_by_token("missing") is None
+
+    # Токен старше допустимого возраста не аутентифицирует
+    future = datetime.now(timezone.utc) + timedelta(days=1)
+    assert await repo.get_principal_by_token("tok", max_age=future) is None
@@ -7,7 +7,8 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from carmain.core.database import Base
 from carmain.models.vehicles import Vehicle
 from carmain.repository.vehicle_repository import VehicleRepository
-from carmain.core.exceptions import NotFoundError
+from carmain.core.exceptions import NotFoundError, ValidationError
+from carmain.utils.pagination import encode_cursor
 
 
 @pytest.fixture
@@ -56,3 +57,30 @@ async def test_get_vehicle(session):
 
     with pytest.raises(NotFoundError):
         await repo.get_vehicle(uuid.uuid4())
+
+
+@pytest.mark.asyncio
+async def test_get_page_follows_insertion_order(session):
+    repo = VehicleRepository(session)
+    vehicles = [
+        Vehicle(user_id=4, brand=f"B{n}", model="M", year=2020, odometer=n)
+        for n in range(5)
+    ]
+    session.add_all(vehicles)
+    await session.commit()
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = await repo.get_page(
+            cursor, limit=2, criteria=[Vehicle.user_id == 4]
+        )
+        seen.extend(vehicle.brand for vehicle in page)
+        if cursor is None:
+            break
+
+    assert seen == [f"B{n}" for n in range(5)]
+    assert [v.brand for v in await repo.get_by_user_id(4)] == seen
+
+    # Курсор с id не того типа — ошибка валидации, а не 500
+    with pytest.raises(ValidationError):
+        await repo.get_page(encode_cursor([42]))
@@ -0,0 +1,57 @@
+import uuid
+
+import pytest
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from carmain.core.database import Base, count_queries
+from carmain.models.items import MaintenanceItem
+from carmain.repository.version_repository import (
+    DataVersionRepository,
+    user_scope,
+    vehicle_scope,
+)
+
+
+@pytest.fixture
+async def session(tmp_path):
+    db_file = tmp_path / "test.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}", echo=False)
+    async_session = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_bump_creates_and_increments_versions(session):
+    repo = DataVersionRepository(session)
+    user, vehicle = user_scope(1), vehicle_scope(uuid.uuid4())
+
+    assert await repo.get_versions(user, vehicle) == {user: 0, vehicle: 0}
+
+    with count_queries() as stats:
+        await repo.bump(user, vehicle)
+    assert stats.count == 1
+    await repo.bump(user)
+    await session.commit()
+
+    assert await repo.get_versions(user, vehicle) == {user: 2, vehicle: 1}
+    assert await repo.get_versions(user_scope(2)) == {user_scope(2): 0}
+
+
+@pytest.mark.asyncio
+async def test_versions_include_catalog(session):
+    repo = DataVersionRepository(session)
+    user = user_scope(1)
+    before = await repo.get_versions(user, catalog=True)
+
+    session.add(MaintenanceItem(name="Свечи", default_interval=30000))
+    await session.commit()
+
+    with count_queries() as stats:
+        after = await repo.get_versions(user, catalog=True)
+    assert stats.count == 1
+    assert after == {user: 0, "catalog": before["catalog"] + 1}
@@ -1,13 +1,16 @@
 import sys
 import uuid
-from datetime import date
+from datetime import date, datetime, time
+from types import SimpleNamespace
 
 import pytest
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
 
 from carmain.models.records import ServiceRecord
+from carmain.repository.maintenance_repository import ServicedItem
 from carmain.services.maintenance_service import MaintenanceService
+from carmain.utils.maintenance_utils import classify
 from carmain.schemas.maintenance_schema import (
     MaintenanceItemStatus,
     ServiceRecordCreate,
@@ -40,10 +43,28 @@ async def mocked_repositories(user, vehicle, user_maintenance_items, mock_reposi
         "maintenance_repo": maintenance_repo,
         "vehicle_repo": vehicle_repo,
         "user_maintenance_repo": user_maintenance_repo,
-        "record_repo": record_repo
+        "record_repo": record_repo,
+        "version_repo": mock_repository,
     }
 
 
+def _due_row(item, status, overdue_km=None, remaining_km=None):
+    """Строка, которую возвращает get_vehicle_maintenance_due_page"""
+    return SimpleNamespace(
+        id=item.id,
+        custom_interval=item.custom_interval,
+        last_service_odometer=item.last_service_odometer,
+        last_service_date=item.last_service_date,
+        name=item.maintenance_item.name,
+        default_interval=item.maintenance_item.default_interval,
+        # Тип хранится в maintenance_item и вычисляется при записи
+        type=classify(item.maintenance_item.name).type.value,
+        status=status.value,
+        overdue_km=overdue_km,
+        remaining_km=remaining_km,
+    )
+
+
 @pytest.fixture
 async def maintenance_service(user, mocked_repositories):
     """Фикстура для создания тестового экземпляра MaintenanceService"""
@@ -52,6 +73,7 @@ async def maintenance_service(user, mocked_repositories):
         user_maintenance_repo=mocked_repositories["user_maintenance_repo"],
         vehicle_repo=mocked_repositories["vehicle_repo"],
         record_repo=mocked_repositories["record_repo"],
+        version_repo=mocked_repositories["version_repo"],
         user=user
     )
 
@@ -59,215 +81,236 @@ async def maintenance_service(user, mocked_repositories):
 @pytest.mark.asyncio
 async def test_get_items_requiring_service_count(maintenance_service, vehicle):
     """Тестирование функции get_items_requiring_service_count"""
+    maintenance_service.maintenance_repository.get_due_counts_by_vehicle.return_value = {
+        vehicle.id: 2
+    }
+
     count = await maintenance_service.get_items_requiring_service_count(vehicle.id)
     
     assert count == 2
     
-    maintenance_service.maintenance_repository.get_maintenance_items_requiring_service.assert_called_once_with(
-        maintenance_service.user.id, vehicle.id, 0, sys.maxsize
+    maintenance_service.maintenance_repository.get_due_counts_by_vehicle.assert_called_once_with(
+        maintenance_service.user.id, [vehicle.id]
     )
 
 
+@pytest.mark.asyncio
+async def test_get_items_requiring_service_counts(maintenance_service, vehicle):
+    """Количество по всем автомобилям запрашивается одним вызовом репозитория"""
+    other_vehicle_id = uuid.uuid4()
+    maintenance_service.maintenance_repository.get_due_counts_by_vehicle.return_value = {
+        vehicle.id: 2,
+        other_vehicle_id: 5,
+    }
+
+    counts = await maintenance_service.get_items_requiring_service_counts()
+
+    assert counts == {vehicle.id: 2, other_vehicle_id: 5}
+    maintenance_service.maintenance_repository.get_due_counts_by_vehicle.assert_called_once_with(
+        maintenance_service.user.id, None
+    )
+
+    empty = await maintenance_service.get_items_requiring_service_count(uuid.uuid4())
+    assert empty == 0
+
+
 @pytest.mark.asyncio
 async def test_get_items_requiring_service_overdue(maintenance_service, vehicle, user_maintenance_items):
-    """Тестирование функции get_items_requiring_service для элементов, требующих обслуживания"""
-    maintenance_service.maintenance_repository.get_maintenance_items_requiring_service.return_value = [
-        user_maintenance_items[0],
-        user_maintenance_items[3],
-    ]
-    
-    display_items, pagination = await maintenance_service.get_items_requiring_service(
+    """Тестирование функции get_items_requiring_service_page для элементов, требующих обслуживания"""
+    maintenance_service.maintenance_repository.get_vehicle_maintenance_due_page.return_value = (
+        [
+            _due_row(user_maintenance_items[0], MaintenanceItemStatus.OVERDUE, overdue_km=5000),
+            _due_row(user_maintenance_items[3], MaintenanceItemStatus.NEVER_SERVICED),
+        ],
+        None,
+        2,
+    )
+
+    display_items, next_cursor, remaining = await maintenance_service.get_items_requiring_service_page(
         vehicle_id=vehicle.id,
-        page=1,
         page_size=10,
         show_all=False
     )
-    
+
     assert len(display_items) == 2
-    
+
     assert display_items[0].status == MaintenanceItemStatus.OVERDUE
+    assert display_items[0].overdue_km == 5000
     assert display_items[1].status == MaintenanceItemStatus.NEVER_SERVICED
-    
-    assert pagination["current_page"] == 1
-    assert pagination["total_pages"] == 1
-    assert pagination["items_per_page"] == 10
-    assert pagination["total_items"] == 2
+
+    maintenance_service.maintenance_repository.get_vehicle_maintenance_due_page.assert_called_once_with(
+        maintenance_service.user.id, vehicle.id, None, 10, False, None, None
+    )
+    assert next_cursor is None
+    assert remaining == 0
 
 
 @pytest.mark.asyncio
 async def test_get_items_requiring_service_show_all(maintenance_service, vehicle, user_maintenance_items):
-    """Тестирование функции get_items_requiring_service с параметром show_all=True"""
-    maintenance_service.maintenance_repository.get_user_maintenance_items.return_value = user_maintenance_items
-    
-    display_items, pagination = await maintenance_service.get_items_requiring_service(
+    """Тестирование функции get_items_requiring_service_page с параметром show_all=True"""
+    maintenance_service.maintenance_repository.get_vehicle_maintenance_due_page.return_value = (
+        [
+            _due_row(user_maintenance_items[0], MaintenanceItemStatus.OVERDUE, overdue_km=5000),
+            _due_row(user_maintenance_items[1], MaintenanceItemStatus.OVERDUE, overdue_km=-3000),
+            _due_row(user_maintenance_items[2], MaintenanceItemStatus.OK, remaining_km=15000),
+            _due_row(user_maintenance_items[3], MaintenanceItemStatus.NEVER_SERVICED),
+        ],
+        None,
+        4,
+    )
+
+    display_items, _, _ = await maintenance_service.get_items_requiring_service_page(
         vehicle_id=vehicle.id,
-        page=1,
         page_size=10,
         show_all=True
     )
-    
+
     assert len(display_items) == 4
-    
+
     statuses = [item.status for item in display_items]
     assert MaintenanceItemStatus.OVERDUE in statuses
     assert MaintenanceItemStatus.OK in statuses
     assert MaintenanceItemStatus.NEVER_SERVICED in statuses
-    
-    assert pagination["current_page"] == 1
-    assert pagination["total_pages"] == 1
-    assert pagination["items_per_page"] == 10
-    assert pagination["total_items"] == 4
+
+
+@pytest.mark.asyncio
+async def test_get_items_requiring_service_next_page(maintenance_service, vehicle, user_maintenance_items):
+    """Курсор передаётся в репозиторий, следующий курсор возвращается как есть"""
+    maintenance_service.maintenance_repository.get_vehicle_maintenance_due_page.return_value = (
+        [_due_row(user_maintenance_items[3], MaintenanceItemStatus.NEVER_SERVICED)],
+        "next",
+        5,
+    )
+
+    display_items, next_cursor, remaining = await maintenance_service.get_items_requiring_service_page(
+        vehicle_id=vehicle.id,
+        cursor="current",
+        page_size=1,
+    )
+
+    assert len(display_items) == 1
+    maintenance_service.maintenance_repository.get_vehicle_maintenance_due_page.assert_called_once_with(
+        maintenance_service.user.id, vehicle.id, "current", 1, False, None, None
+    )
+    assert next_cursor == "next"
+    # Количество от курсора включает показанную порцию
+    assert remaining == 4
 
 
 @pytest.mark.asyncio
 async def test_get_items_requiring_service_nonexistent_vehicle(maintenance_service):
-    """Тестирование функции get_items_requiring_service с несуществующим vehicle_id"""
-    maintenance_service.vehicle_repository.get_vehicle.return_value = None
-    
-    nonexistent_id = uuid.uuid4()
-    display_items, pagination = await maintenance_service.get_items_requiring_service(
-        vehicle_id=nonexistent_id,
-        page=1,
+    """Тестирование функции get_items_requiring_service_page с несуществующим vehicle_id"""
+    maintenance_service.maintenance_repository.get_vehicle_maintenance_due_page.return_value = ([], None, 0)
+
+    display_items, next_cursor, _ = await maintenance_service.get_items_requiring_service_page(
+        vehicle_id=uuid.uuid4(),
         page_size=10,
         show_all=False
     )
-    
+
     assert len(display_items) == 0
-    
-    assert pagination["current_page"] == 1
-    assert pagination["total_pages"] == 0
-    assert pagination["items_per_page"] == 10
-    assert pagination["total_items"] == 0
+    assert next_cursor is None
+
+
+def _serviced(item, vehicle, service_odometer, advanced=True):
+    """Результат MaintenanceRepository.mark_serviced"""
+    return ServicedItem(
+        id=item.id,
+        vehicle_id=vehicle.id,
+        vehicle_odometer=vehicle.odometer,
+        name=item.maintenance_item.name,
+        record_id=uuid.uuid4(),
+        service_odometer=service_odometer,
+        advanced=advanced,
+    )
 
 
 @pytest.mark.asyncio
-async def test_mark_item_as_serviced_success(maintenance_service, user_maintenance_items, user):
+async def test_mark_item_as_serviced_success(maintenance_service, user_maintenance_items, vehicle, user):
     """Тестирование успешного выполнения функции mark_item_as_serviced"""
     item = user_maintenance_items[0]
-    item.user_id = user.id  # Устанавливаем user_id равным id текущего пользователя
-    maintenance_service.user_maintenance_repository.get_by_id.return_value = item
-    
+    mark_serviced = maintenance_service.maintenance_repository.mark_serviced
+    mark_serviced.return_value = _serviced(item, vehicle, 55000)
+
     service_date = date.today()
-    service_odometer = 55000
     service_record_create = ServiceRecordCreate(
         user_item_id=item.id,
         service_date=service_date,
-        service_odometer=service_odometer,
+        service_odometer=55000,
         comment="Тестовое обслуживание"
     )
-    
-    updated_item = item
-    updated_item.last_service_date = service_date
-    updated_item.last_service_odometer = service_odometer
-    maintenance_service.user_maintenance_repository.update_by_id.return_value = updated_item
-    maintenance_service.user_maintenance_repository.get_by_id.side_effect = [item, updated_item]
-    
+
     result = await maintenance_service.mark_item_as_serviced(service_record_create)
-    
-    maintenance_service.record_repository.create.assert_called_once()
-    maintenance_service.user_maintenance_repository.update_by_id.assert_called_once()
-    assert result.last_service_date == service_date
-    assert result.last_service_odometer == service_odometer
+
+    mark_serviced.assert_awaited_once_with(
+        user_id=user.id,
+        user_item_id=item.id,
+        service_date=datetime.combine(service_date, time.min),
+        service_odometer=55000,
+        comment="Тестовое обслуживание",
+    )
+    maintenance_service.record_repository.create.assert_not_called()
+    maintenance_service.user_maintenance_repository.update_by_id.assert_not_called()
+    assert result.id == item.id
+    assert result.service_odometer == 55000
 
 
 @pytest.mark.asyncio
-async def test_mark_item_as_serviced_with_empty_comment(maintenance_service, user_maintenance_items, user):
+async def test_mark_item_as_serviced_with_empty_comment(maintenance_service, user_maintenance_items, vehicle):
     """Тестирование функции mark_item_as_serviced с пустым комментарием"""
     item = user_maintenance_items[0]
-    item.user_id = user.id  # Устанавливаем user_id равным id текущего пользователя
-    maintenance_service.user_maintenance_repository.get_by_id.return_value = item
-    
+    mark_serviced = maintenance_service.maintenance_repository.mark_serviced
+    mark_serviced.return_value = _serviced(item, vehicle, 55000)
+
     service_date = date.today()
-    service_odometer = 55000
     service_record_create = ServiceRecordCreate(
         user_item_id=item.id,
         service_date=service_date,
-        service_odometer=service_odometer,
-        comment=""
+        service_odometer=55000,
+        comment="  "
     )
-    
-    updated_item = item
-    updated_item.last_service_date = service_date
-    updated_item.last_service_odometer = service_odometer
-    maintenance_service.user_maintenance_repository.update_by_id.return_value = updated_item
-    maintenance_service.user_maintenance_repository.get_by_id.side_effect = [item, updated_item]
-    
-    result = await maintenance_service.mark_item_as_serviced(service_record_create)
-    
-    called_args = maintenance_service.record_repository.create.call_args[0][0]
+
+    await maintenance_service.mark_item_as_serviced(service_record_create)
+
     expected_comment = f"Обслуживание выполнено {service_date.strftime('%d.%m.%Y')}"
-    assert called_args.comment == expected_comment
-    assert result.last_service_date == service_date
-    assert result.last_service_odometer == service_odometer
+    assert mark_serviced.call_args.kwargs["comment"] == expected_comment
 
 
 @pytest.mark.asyncio
-async def test_mark_item_as_serviced_without_odometer(maintenance_service, user_maintenance_items, vehicle, user):
-    """Тестирование функции mark_item_as_serviced без указания пробега"""
+async def test_mark_item_as_serviced_without_odometer(maintenance_service, user_maintenance_items, vehicle):
+    """Пробег 0 передаётся как None: репозиторий возьмёт пробег автомобиля"""
     item = user_maintenance_items[0]
-    item.user_id = user.id  # Устанавливаем user_id равным id текущего пользователя
-    item.vehicle = vehicle
-    maintenance_service.user_maintenance_repository.get_by_id.return_value = item
-    
-    service_date = date.today()
-    # Передаем 0 вместо None, а в тесте проверяем, что функция использует odometer из vehicle
+    mark_serviced = maintenance_service.maintenance_repository.mark_serviced
+    mark_serviced.return_value = _serviced(item, vehicle, vehicle.odometer)
+
     service_record_create = ServiceRecordCreate(
         user_item_id=item.id,
-        service_date=service_date,
-        service_odometer=0,  # Заменяем None на 0, чтобы пройти валидацию
+        service_date=date.today(),
+        service_odometer=0,
         comment="Тестовое обслуживание"
     )
-    
-    updated_item = item
-    updated_item.last_service_date = service_date
-    updated_item.last_service_odometer = vehicle.odometer
-    maintenance_service.user_maintenance_repository.update_by_id.return_value = updated_item
-    maintenance_service.user_maintenance_repository.get_by_id.side_effect = [item, updated_item]
-    
+
     result = await maintenance_service.mark_item_as_serviced(service_record_create)
-    
-    called_args = maintenance_service.record_repository.create.call_args[0][0]
-    assert called_args.service_odometer == vehicle.odometer
-    assert result.last_service_date == service_date
-    assert result.last_service_odometer == vehicle.odometer
+
+    assert mark_serviced.call_args.kwargs["service_odometer"] is None
+    assert result.service_odometer == vehicle.odometer
 
 
 @pytest.mark.asyncio
 async def test_mark_item_as_serviced_item_not_found(maintenance_service):
-    """Тестирование функции mark_item_as_serviced когда элемент не найден"""
-    maintenance_service.user_maintenance_repository.get_by_id.return_value = None
-    
+    """Элемент не найден или принадлежит другому пользователю"""
+    maintenance_service.maintenance_repository.mark_serviced.return_value = None
+
     service_record_create = ServiceRecordCreate(
         user_item_id=uuid.uuid4(),
         service_date=date.today(),
         service_odometer=55000,
         comment="Тестовое обслуживание"
     )
-    
-    with pytest.raises(HTTPException) as excinfo:
-        await maintenance_service.mark_item_as_serviced(service_record_create)
-    
-    assert excinfo.value.status_code == 404
-    assert "Элемент обслуживания не найден" in excinfo.value.detail
 
-
-@pytest.mark.asyncio
-async def test_mark_item_as_serviced_wrong_user(maintenance_service, user_maintenance_items):
-    """Тестирование функции mark_item_as_serviced с неправильным пользователем"""
-    item = user_maintenance_items[0]
-    item.user_id = uuid.uuid4()  # Установка другого user_id, не совпадающего с текущим пользователем
-    maintenance_service.user_maintenance_repository.get_by_id.return_value = item
-    
-    service_record_create = ServiceRecordCreate(
-        user_item_id=item.id,
-        service_date=date.today(),
-        service_odometer=55000,
-        comment="Тестовое обслуживание"
-    )
-    
     with pytest.raises(HTTPException) as excinfo:
         await maintenance_service.mark_item_as_serviced(service_record_create)
-    
+
     assert excinfo.value.status_code == 404
     assert "Элемент обслуживания не найден" in excinfo.value.detail
 
@@ -328,24 +371,31 @@ async def test_update_user_maintenance_item(maintenance_service):
 async def test_delete_user_maintenance_item_success(maintenance_service):
     """Тестирование успешного удаления пользовательского элемента обслуживания"""
     item_id = uuid.uuid4()
-    maintenance_service.user_maintenance_repository.delete_by_id.return_value = True
+    vehicle_id = uuid.uuid4()
+    # delete_by_id возвращает удалённый объект
+    maintenance_service.user_maintenance_repository.delete_by_id.return_value = (
+        SimpleNamespace(id=item_id, vehicle_id=vehicle_id)
+    )
     
-    result = await maintenance_service.delete_user_maintenance_item(item_id)
+    await maintenance_service.delete_user_maintenance_item(item_id)
     
     maintenance_service.user_maintenance_repository.delete_by_id.assert_called_once_with(item_id)
-    assert result is True
+    maintenance_service.version_repository.bump.assert_awaited_once_with(
+        f"user:{maintenance_service.user.id}", f"vehicle:{vehicle_id}"
+    )
 
 
 @pytest.mark.asyncio
 async def test_delete_user_maintenance_item_failure(maintenance_service):
-    """Тестирование неудачного удаления пользовательского элемента обслуживания"""
+    """Ошибка БД доходит до единицы работы, которая откатит запрос, а не глотается"""
     item_id = uuid.uuid4()
     maintenance_service.user_maintenance_repository.delete_by_id.side_effect = SQLAlchemyError("DB Error")
     
-    result = await maintenance_service.delete_user_maintenance_item(item_id)
+    with pytest.raises(SQLAlchemyError):
+        await maintenance_service.delete_user_maintenance_item(item_id)
     
     maintenance_service.user_maintenance_repository.delete_by_id.assert_called_once_with(item_id)
-    assert result is False
+    maintenance_service.version_repository.bump.assert_not_awaited()
 
 
 @pytest.mark.asyncio
@@ -355,7 +405,7 @@ async def test_get_maintenance_items(maintenance_service, maintenance_items):
     
     result = await maintenance_service.get_maintenance_items(skip=0, limit=10)
     
-    maintenance_service.maintenance_repository.get_maintenance_items.assert_called_once_with(0, 10)
+    maintenance_service.maintenance_repository.get_maintenance_items.assert_called_once_with(0, 10, None, None)
     assert result == maintenance_items
 
 
@@ -401,4 +451,18 @@ async def test_get_service_records(maintenance_service):
     result = await maintenance_service.get_service_records(user_item_id)
     
     maintenance_service.record_repository.get_by_user_item_id.assert_called_once_with(user_item_id)
-    assert result == service_records
\ No newline at end of file
+    assert result == service_records
+
+@pytest.mark.asyncio
+async def test_get_service_records_page(maintenance_service):
+    """Тестирование функции get_service_records_page"""
+    user_item_id = uuid.uuid4()
+    maintenance_service.record_repository.get_page_by_user_item_id.return_value = ([], "next")
+
+    records, cursor = await maintenance_service.get_service_records_page(user_item_id, "abc")
+
+    maintenance_service.record_repository.get_page_by_user_item_id.assert_called_once_with(
+        user_item_id, "abc", 20
+    )
+    assert records == []
+    assert cursor == "next"
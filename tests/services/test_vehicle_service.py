@@ -1,4 +1,5 @@
 import uuid
+from unittest.mock import AsyncMock
 
 import pytest
 
@@ -8,8 +9,15 @@ from carmain.services.vehicle_service import VehicleService
 
 
 @pytest.fixture
-def vehicle_service(mock_repository, user):
-    return VehicleService(repository=mock_repository, user=user)
+def version_repository():
+    return AsyncMock()
+
+
+@pytest.fixture
+def vehicle_service(mock_repository, version_repository, user):
+    return VehicleService(
+        repository=mock_repository, version_repository=version_repository, user=user
+    )
 
 
 @pytest.mark.asyncio
@@ -51,6 +59,21 @@ async def test_patch_calls_update_by_id_with_correct_data(mock_repository, vehic
     mock_repository.update_by_id.assert_awaited_once_with(obj_id, expected_data)
 
 
+@pytest.mark.asyncio
+async def test_writes_bump_data_versions(vehicle_service, version_repository, user):
+    obj_id = uuid.uuid4()
+    schema = VehicleSchema(brand="B", model="M", year=2010, odometer=5000)
+    await vehicle_service.add(schema)
+    await vehicle_service.patch(obj_id, schema)
+    await vehicle_service.remove_by_id(obj_id)
+
+    assert [c.args for c in version_repository.bump.await_args_list] == [
+        (f"user:{user.id}",),
+        (f"user:{user.id}", f"vehicle:{obj_id}"),
+        (f"user:{user.id}", f"vehicle:{obj_id}"),
+    ]
+
+
 @pytest.mark.asyncio
 async def test_remove_by_id_calls_delete_by_id(mock_repository, vehicle_service):
     obj_id = uuid.uuid4()
@@ -0,0 +1,38 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from carmain.utils import ids
+from carmain.utils.ids import uuid7, uuid7_datetime, uuid7_floor
+
+
+def test_uuid7_layout_and_time():
+    before = datetime.now(timezone.utc) - timedelta(milliseconds=1)
+    value = uuid7()
+
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before <= uuid7_datetime(value) <= datetime.now(timezone.utc)
+
+
+def test_uuid7_is_monotonic_within_millisecond():
+    values = [uuid7() for _ in range(10000)]
+
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+    # Сравнение строк (как CHAR(32) в SQLite) даёт тот же порядок
+    assert [v.hex for v in values] == sorted(v.hex for v in values)
+
+
+def test_uuid7_survives_clock_going_back(monkeypatch):
+    first = uuid7()
+    monkeypatch.setattr(ids.time, "time_ns", lambda: 0)
+
+    assert uuid7() > first
+
+
+def test_uuid7_floor_bounds_time_range():
+    moment = datetime.now(timezone.utc)
+    value = uuid7()
+
+    assert uuid7_floor(moment - timedelta(seconds=1)) < value
+    assert uuid7_floor(moment + timedelta(seconds=1)) > value
@@ -0,0 +1,58 @@
+import pytest
+
+from carmain.schemas.maintenance_schema import MaintenanceCategory, MaintenanceItemType
+from carmain.utils.maintenance_utils import Classification, classify
+
+
+def test_classify_first_matching_rule_wins():
+    # Масло и фильтр: тип и иконка — по маслу, категория — фильтры
+    assert classify("Масляный фильтр") == Classification(
+        type=MaintenanceItemType.OIL_CHANGE,
+        icon="oil-can",
+        category=MaintenanceCategory.FILTERS,
+    )
+    assert classify("Ремень ГРМ") == Classification(
+        type=MaintenanceItemType.TIMING_BELT, icon="cogs", category=None
+    )
+    assert classify("Жидкость ГУР") == Classification(
+        type=MaintenanceItemType.OTHER, icon="wrench", category=None
+    )
+
+
+def test_classify_requires_every_keyword_group():
+    assert classify("Воздушный фильтр").type == MaintenanceItemType.AIR_FILTER
+    assert classify("Топливный фильтр").type == MaintenanceItemType.OTHER
+    assert classify("Воздуховод").type == MaintenanceItemType.OTHER
+
+
+def test_classify_finds_overlapping_keywords():
+    # "ремен" — начало "ремень": в одной позиции совпадают оба слова
+    belt = classify("РЕМЕНЬ генератора")
+    assert (belt.type, belt.icon) == (MaintenanceItemType.TIMING_BELT, "cogs")
+    # "аккум" — начало "аккумулятор"
+    battery = classify("Аккумулятор")
+    assert battery.type == MaintenanceItemType.BATTERY
+    assert battery.icon == "car-battery"
+    assert battery.category == MaintenanceCategory.BATTERY
+    assert classify("Brake fluid").icon == "exclamation-circle"
+
+
+@pytest.mark.parametrize(
+    "name, category",
+    [
+        # Одна категория на работу: фильтры важнее двигателя, поэтому
+        # масляный фильтр больше не попадает в фильтр "Двигатель"
+        ("Масляный фильтр", MaintenanceCategory.FILTERS),
+        ("Топливный фильтр", MaintenanceCategory.FILTERS),
+        ("Воздушный фильтр", MaintenanceCategory.FILTERS),
+        ("Масло моторное", MaintenanceCategory.ENGINE),
+        ("Трансмиссионное масло", MaintenanceCategory.ENGINE),
+        ("Масло редуктора", MaintenanceCategory.ENGINE),
+        ("Тормозная жидкость", MaintenanceCategory.BRAKES),
+        ("Тормозные колодки", MaintenanceCategory.BRAKES),
+        ("Антифриз", None),
+        ("Свечи", None),
+    ],
+)
+def test_initial_items_have_single_category(name, category):
+    assert classify(name).category == category
@@ -0,0 +1,57 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from carmain.core.exceptions import ValidationError
+from carmain.repository.maintenance_repository import due_query
+from carmain.repository.record_repository import history_query
+from carmain.utils.pagination import (
+    as_bool,
+    as_datetime,
+    as_int,
+    as_uuid,
+    decode_cursor,
+    encode_cursor,
+    optional,
+)
+
+
+def test_cursor_round_trip_converts_values():
+    record_id = uuid.uuid4()
+    when = datetime(2025, 1, 2, 3, 4)
+    cursor = encode_cursor([when.isoformat(), record_id, None, 5, True])
+
+    converters = [as_datetime, as_uuid, optional(as_int), as_int, as_bool]
+    assert decode_cursor(cursor, converters) == [when, record_id, None, 5, True]
+    assert decode_cursor(None, converters) is None
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        ["2025-01-01T00:00:00", "x"],
+        [1, str(uuid.uuid4())],
+        ["вчера", str(uuid.uuid4())],
+        ["2025-01-01T00:00:00", 7],
+        ["2025-01-01T00:00:00"],
+    ],
+)
+def test_history_cursor_with_wrong_values_is_rejected(values):
+    with pytest.raises(ValidationError):
+        history_query(uuid.uuid4(), encode_cursor(values))
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [False, "1000", str(uuid.uuid4())],
+        [1, 1000, str(uuid.uuid4())],
+        [False, True, str(uuid.uuid4())],
+        [False, None, str(uuid.uuid4())],
+        [True, None, {"id": 1}],
+    ],
+)
+def test_due_cursor_with_wrong_values_is_rejected(values):
+    with pytest.raises(ValidationError):
+        due_query(1, uuid.uuid4(), encode_cursor(values))